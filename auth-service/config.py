@@ -8,6 +8,74 @@ class Settings(BaseSettings):
     algorithm: str = Field(default="HS256", env="ALGORITHM")
     access_token_expire_minutes: int = Field(default=30, env="ACCESS_TOKEN_EXPIRE_MINUTES")
     refresh_token_expire_days: int = Field(default=7, env="REFRESH_TOKEN_EXPIRE_DAYS")
+    compression_minimum_size: int = Field(default=1024, env="COMPRESSION_MINIMUM_SIZE")
+    profiling_enabled: bool = Field(default=False, env="PROFILING_ENABLED")
+    profiling_token: str = Field(default="", env="PROFILING_TOKEN")
+    profiling_sample_rate: float = Field(default=0.0, env="PROFILING_SAMPLE_RATE")
+    profiling_path_prefix: str = Field(default="/", env="PROFILING_PATH_PREFIX")
+    profiling_interval_ms: float = Field(default=1.0, env="PROFILING_INTERVAL_MS")
+    profiling_dir: str = Field(default="/tmp/profiles", env="PROFILING_DIR")
+    tracing_enabled: bool = Field(default=False, env="TRACING_ENABLED")
+    # Fraction of requests without a sampled traceparent that start a trace
+    tracing_sample_rate: float = Field(default=0.01, env="TRACING_SAMPLE_RATE")
+    # "file" writes OTLP/JSON lines to tracing_dir, "otlp" posts them to
+    # tracing_otlp_endpoint
+    tracing_exporter: str = Field(default="file", env="TRACING_EXPORTER")
+    tracing_dir: str = Field(default="/tmp/traces", env="TRACING_DIR")
+    tracing_otlp_endpoint: str = Field(default="http://localhost:4318/v1/traces", env="TRACING_OTLP_ENDPOINT")
+    # Finished spans waiting for export per worker; more are dropped
+    tracing_max_queue: int = Field(default=10000, env="TRACING_MAX_QUEUE")
+    tracing_batch_size: int = Field(default=512, env="TRACING_BATCH_SIZE")
+    tracing_flush_seconds: float = Field(default=2.0, env="TRACING_FLUSH_SECONDS")
+    # "log" logs query budget overruns, N+1 patterns and slow statements of
+    # a sample of requests; "raise" fails every offending request (tests)
+    query_inspection: str = Field(default="log", env="QUERY_INSPECTION")
+    query_inspection_sample_rate: float = Field(default=0.01, env="QUERY_INSPECTION_SAMPLE_RATE")
+    # A statement run this many times in one request is reported as N+1
+    query_repeat_threshold: int = Field(default=5, env="QUERY_REPEAT_THRESHOLD")
+    query_slow_ms: float = Field(default=100.0, env="QUERY_SLOW_MS")
+    host: str = Field(default="0.0.0.0", env="HOST")
+    port: int = Field(default=8001, env="PORT")
+    # 0 starts one worker per CPU available to the container
+    web_concurrency: int = Field(default=0, env="WEB_CONCURRENCY")
+    backlog: int = Field(default=2048, env="BACKLOG")
+    keepalive_timeout: int = Field(default=75, env="KEEPALIVE_TIMEOUT")
+    graceful_timeout: int = Field(default=25, env="GRACEFUL_TIMEOUT")
+    access_log: bool = Field(default=False, env="ACCESS_LOG")
+    # Comma-separated addresses of the proxies (gateway, ingress) trusted to
+    # set X-Forwarded-For; anyone else's header is ignored and the client is
+    # the connecting address. "*" would let any client pick its address.
+    forwarded_allow_ips: str = Field(default="127.0.0.1", env="FORWARDED_ALLOW_IPS")
+    # Comma-separated CIDRs of further trusted proxies, for those whose
+    # addresses change, like gateway pods: e.g. the cluster's pod network
+    forwarded_allow_networks: str = Field(default="", env="FORWARDED_ALLOW_NETWORKS")
+    # Per worker: a pod holds up to workers * (pool size + overflow) connections
+    db_pool_size: int = Field(default=5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=5, env="DB_MAX_OVERFLOW")
+    db_pool_recycle: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    rate_limit_enabled: bool = Field(default=True, env="RATE_LIMIT_ENABLED")
+    # "shared" keeps buckets in shared memory for the workers on a node,
+    # "redis" in one Redis for all replicas, "local" per worker
+    rate_limit_store: str = Field(default="shared", env="RATE_LIMIT_STORE")
+    rate_limit_redis_url: str = Field(default="redis://localhost:6379/0", env="RATE_LIMIT_REDIS_URL")
+    # Directory of the shared bucket table; empty uses /dev/shm
+    rate_limit_dir: str = Field(default="", env="RATE_LIMIT_DIR")
+    rate_limit_slots: int = Field(default=65536, env="RATE_LIMIT_SLOTS")
+    # Tokens per second and bucket size, for users with a verified token and
+    # for everyone else by client IP
+    rate_limit_user_rate: float = Field(default=10.0, env="RATE_LIMIT_USER_RATE")
+    rate_limit_user_burst: float = Field(default=100.0, env="RATE_LIMIT_USER_BURST")
+    rate_limit_ip_rate: float = Field(default=20.0, env="RATE_LIMIT_IP_RATE")
+    rate_limit_ip_burst: float = Field(default=200.0, env="RATE_LIMIT_IP_BURST")
+    # "METHOD /path=cost" pairs, comma-separated; a trailing * matches a
+    # path prefix and cost 0 exempts the route. Other routes cost 1. Login
+    # and registration run bcrypt; /auth/me is the token check the other
+    # services make for each of their requests, which they limit themselves.
+    rate_limit_costs: str = Field(
+        default="POST /auth/login=10,POST /auth/register=10,POST /auth/refresh=2,GET /auth/me=0",
+        env="RATE_LIMIT_COSTS",
+    )
+    rate_limit_token_cache_size: int = Field(default=10000, env="RATE_LIMIT_TOKEN_CACHE_SIZE")
 
     class Config:
         env_file = ".env"
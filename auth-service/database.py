@@ -1,9 +1,23 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
 
-engine = create_engine(settings.database_url)
+
+def _engine_options() -> dict:
+    """Pool sizing for server databases; SQLite keeps SQLAlchemy's defaults"""
+    if make_url(settings.database_url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+
+
+engine = create_engine(settings.database_url, **_engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -21,3 +35,29 @@ def get_db():
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+
+
+def warm_pool():
+    """Open the worker's pooled connections before it reports ready"""
+    if "pool_size" not in _engine_options():
+        return
+    connections = []
+    try:
+        for _ in range(settings.db_pool_size):
+            connection = engine.connect()
+            connection.execute(text("SELECT 1"))
+            connections.append(connection)
+    finally:
+        # Closing returns them to the pool, still connected
+        for connection in connections:
+            connection.close()
+
+
+def check_database() -> bool:
+    """Cheap readiness check through the pool"""
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except SQLAlchemyError:
+        return False
@@ -1,12 +1,14 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
+from sqlalchemy import select
 from datetime import timedelta
+from typing import List
 import uvicorn
 
-from database import get_db, init_db
+from database import engine, get_db, warm_pool, check_database
 from models import User, Role
-from schemas import UserCreate, UserResponse, UserLogin, Token
+from schemas import UserCreate, UserResponse, UserPublicResponse, UserLogin, Token
 from auth import (
     get_password_hash,
     verify_password,
@@ -15,8 +17,20 @@ from auth import (
     get_current_user
 )
 from config import settings
+from fast_response import ORJSONResponse, CompressionMiddleware
+from metrics import MetricsMiddleware, instrument_engine, metrics_response, mark_process_dead
+import profiling
+import query_inspector
+from query_inspector import query_budget
+import tracing
+import rate_limit
 
-app = FastAPI(title="Auth Service", version="1.0.0")
+app = FastAPI(title="Auth Service", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Token-bucket rate limits. Added first so it runs inside CORS and a 429
+# still carries the CORS headers the browser needs to read it
+if settings.rate_limit_enabled:
+    app.add_middleware(rate_limit.RateLimitMiddleware, name="auth-service")
 
 # CORS middleware
 app.add_middleware(
@@ -27,25 +41,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses above the configured size
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
+
+# Request, status and DB metrics exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
+# Query budgets, N+1 and slow query reports; see query_inspector.py
+if settings.query_inspection != "off":
+    app.add_middleware(query_inspector.QueryInspectionMiddleware)
+    query_inspector.instrument_engine(engine)
+
+# Opt-in distributed tracing; nothing is mounted unless enabled
+if settings.tracing_enabled:
+    app.add_middleware(tracing.TracingMiddleware, service="auth-service")
+    tracing.instrument_engine(engine)
+
+# Opt-in request profiling; nothing is mounted unless enabled
+if settings.profiling_enabled:
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
+
 
 @app.on_event("startup")
 def on_startup():
-    """Initialize database on startup"""
-    init_db()
-    # Create default roles if they don't exist
-    db = next(get_db())
-    try:
-        if not db.query(Role).filter(Role.name == "user").first():
-            user_role = Role(name="user", description="Regular user")
-            db.add(user_role)
-        
-        if not db.query(Role).filter(Role.name == "admin").first():
-            admin_role = Role(name="admin", description="Administrator")
-            db.add(admin_role)
-        
-        db.commit()
-    finally:
-        db.close()
+    """Connect the pool before this worker accepts requests"""
+    warm_pool()
 
 
 @app.get("/")
@@ -58,7 +80,32 @@ def read_root():
     }
 
 
+@app.get("/ready", include_in_schema=False)
+def ready():
+    """Readiness probe: the database is reachable through the pool"""
+    if not check_database():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database unavailable"
+        )
+    return {"status": "ready"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics endpoint"""
+    return metrics_response()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    """Export queued trace spans and release this worker's live metrics"""
+    tracing.shutdown()
+    mark_process_dead()
+
+
 @app.post("/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@query_budget(5)
 def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
     # Check if username already exists
@@ -106,6 +153,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/login", response_model=Token)
+@query_budget(1)
 def login(credentials: UserLogin, db: Session = Depends(get_db)):
     # Find user
     user = db.query(User).filter(User.username == credentials.username).first()
@@ -139,6 +187,7 @@ def login(credentials: UserLogin, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/refresh", response_model=Token)
+@query_budget(1)
 def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
     from auth import decode_token
     
@@ -172,7 +221,28 @@ def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
     }
 
 
+# Batch lookups are capped so one request can't ask for the whole table
+MAX_USER_LOOKUP = 100
+
+
+@app.get("/auth/users", response_model=List[UserPublicResponse])
+@query_budget(1)
+def get_users(ids: List[int] = Query([]), db: Session = Depends(get_db)):
+    """Usernames for several users at once, e.g. /auth/users?ids=1&ids=2.
+    Unauthenticated, so it returns only the fields pages show of an author"""
+    if len(ids) > MAX_USER_LOOKUP:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_USER_LOOKUP} ids per request"
+        )
+    rows = db.execute(
+        select(User.id, User.username).where(User.id.in_(set(ids)))
+    ).mappings().all()
+    return rows
+
+
 @app.get("/auth/me", response_model=UserResponse)
+@query_budget(1)
 def get_me(current_user: User = Depends(get_current_user)):
     """
     Get current user information
@@ -181,4 +251,8 @@ def get_me(current_user: User = Depends(get_current_user)):
 
 
 if __name__ == "__main__":
+    # Development server; production runs migrate.py and then server.py
+    from migrate import migrate
+
+    migrate()
     uvicorn.run(app, host="0.0.0.0", port=8001)
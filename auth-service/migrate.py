@@ -0,0 +1,53 @@
+"""Create tables and seed default roles; run once per deploy before the servers.
+
+    python migrate.py
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from database import SessionLocal, engine, init_db
+from models import Role
+
+DEFAULT_ROLES = (
+    ("user", "Regular user"),
+    ("admin", "Administrator"),
+)
+
+# Serializes concurrent migrate runs, e.g. init containers of several replicas
+MIGRATION_LOCK_ID = 8001
+
+
+@contextmanager
+def migration_lock():
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def seed_roles():
+    """Create the default roles if they don't exist"""
+    db = SessionLocal()
+    try:
+        for name, description in DEFAULT_ROLES:
+            if not db.query(Role).filter(Role.name == name).first():
+                db.add(Role(name=name, description=description))
+        db.commit()
+    finally:
+        db.close()
+
+
+def migrate():
+    with migration_lock():
+        init_db()
+        seed_roles()
+
+
+if __name__ == "__main__":
+    migrate()
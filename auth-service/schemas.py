@@ -42,6 +42,15 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserPublicResponse(BaseModel):
+    # Only what other users' pages show: anyone can look these up by id
+    id: int
+    username: str
+
+    class Config:
+        from_attributes = True
+
+
 class UserLogin(BaseModel):
     username: str
     password: str
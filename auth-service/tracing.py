@@ -0,0 +1,442 @@
+"""Distributed tracing with W3C trace context.
+
+A sampled request gets a server span with child spans for its SQL
+statements, password hashing and calls to auth-service. Those calls carry
+a `traceparent` header, so auth-service's spans join the caller's trace.
+Nothing is mounted unless TRACING_ENABLED is set. A request whose
+traceparent is sampled is traced; one without a traceparent starts a trace
+with probability TRACING_SAMPLE_RATE. Unsampled requests create no spans and
+only pass their trace id on.
+
+Finished spans are batched by a background thread and exported as
+OTLP/JSON by the exporter named by TRACING_EXPORTER:
+
+- "file": one ExportTraceServiceRequest per line in TRACING_DIR, a file per
+  worker; no collector needed, and the files are what an OpenTelemetry
+  collector's otlpjsonfile receiver reads
+- "otlp": posted to TRACING_OTLP_ENDPOINT (a collector, Jaeger or Tempo)
+
+Other exporters are plugged in with set_exporter. The files are read by
+
+    python tracing.py /tmp/traces/*.jsonl               # slowest traces
+    python tracing.py /tmp/traces/*.jsonl --trace ID    # one trace as a tree
+"""
+import argparse
+import glob
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from metrics import TRACE_SPANS_DROPPED
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+TRACEPARENT = re.compile(rb"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+MAX_STATEMENT_LENGTH = 2000
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "sampled", "name", "kind", "start", "end", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], sampled: bool, name: str, kind: int = INTERNAL,
+                 attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes or {}
+        self.error = False
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def child(self, name: str, kind: int = INTERNAL, attributes: Optional[dict] = None) -> "Span":
+        return Span(self.trace_id, self.span_id, True, name, kind, attributes)
+
+    def finish(self) -> None:
+        self.end = time.time_ns()
+        _processor.add(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+# The span of the code running now: a request's server span, or a child of it
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes) -> Iterator[Optional[Span]]:
+    """A child of the current span around the block; yields None, and costs
+    next to nothing, when the request is not traced"""
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    child = parent.child(name, kind, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException:
+        child.error = True
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def inject(headers: dict) -> dict:
+    """`headers` with the current span's traceparent, for an outgoing request"""
+    current = _current.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent()
+    return headers
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def to_otlp(spans: List[Span], service: str) -> dict:
+    """An OTLP/JSON ExportTraceServiceRequest"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            _attribute("service.name", service),
+            _attribute("process.pid", os.getpid()),
+        ]},
+        "scopeSpans": [{
+            "scope": {"name": "tracing"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                "name": s.name,
+                "kind": s.kind,
+                "startTimeUnixNano": str(s.start),
+                "endTimeUnixNano": str(s.end),
+                "attributes": [_attribute(key, value) for key, value in s.attributes.items()],
+                "status": {"code": STATUS_ERROR} if s.error else {},
+            } for s in spans],
+        }],
+    }]}
+
+
+class FileExporter:
+    """Appends OTLP/JSON lines to {directory}/{service}-{pid}.jsonl"""
+
+    def __init__(self, directory: str, service: str):
+        os.makedirs(directory, exist_ok=True)
+        self.service = service
+        self.path = os.path.join(directory, f"{service}-{os.getpid()}.jsonl")
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "ab") as f:
+            f.write(orjson.dumps(to_otlp(spans, self.service)) + b"\n")
+
+
+class OtlpHttpExporter:
+    """Posts OTLP/JSON to an OTLP/HTTP traces endpoint"""
+
+    def __init__(self, endpoint: str, service: str):
+        self.endpoint = endpoint
+        self.service = service
+
+    def export(self, spans: List[Span]) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=orjson.dumps(to_otlp(spans, self.service)),
+            headers={"Content-Type": "application/json"},
+        )
+        # Raises on error statuses
+        with urllib.request.urlopen(request, timeout=5.0):
+            pass
+
+
+def create_exporter(service: str):
+    if settings.tracing_exporter == "otlp":
+        return OtlpHttpExporter(settings.tracing_otlp_endpoint, service)
+    if settings.tracing_exporter == "file":
+        return FileExporter(settings.tracing_dir, service)
+    raise ValueError(f"Unknown tracing exporter {settings.tracing_exporter!r}")
+
+
+# Queued by flush: the exporter thread sets _flushed when it gets to it
+_FLUSH = object()
+
+
+class BatchProcessor:
+    """Queues finished spans and exports them in batches from a daemon thread.
+
+    Requests never wait on an exporter: when the queue is full, or an export
+    fails, spans are dropped and counted.
+    """
+
+    def __init__(self):
+        self.service = "unknown"
+        self.exporter = None
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.tracing_max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._flushed = threading.Event()
+
+    def add(self, span: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            TRACE_SPANS_DROPPED.inc()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                if self.exporter is None:
+                    self.exporter = create_exporter(self.service)
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _take_batch(self, timeout: float) -> Tuple[List[Span], bool]:
+        """Spans queued within `timeout`, and whether a flush was asked for"""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < settings.tracing_batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _FLUSH:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _export(self, batch: List[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception:
+            TRACE_SPANS_DROPPED.inc(len(batch))
+
+    def _run(self) -> None:
+        while True:
+            batch, flush = self._take_batch(settings.tracing_flush_seconds)
+            if batch:
+                self._export(batch)
+            if flush:
+                self._flushed.set()
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Export every span finished so far; called on shutdown"""
+        if self._thread is None:
+            return
+        self._flushed.clear()
+        try:
+            # Behind the queued spans, so the thread exports them first
+            self._queue.put(_FLUSH, timeout=timeout)
+        except queue.Full:
+            return
+        self._flushed.wait(timeout)
+
+
+_processor = BatchProcessor()
+
+
+def set_exporter(exporter) -> None:
+    """Export spans through any object with an export(spans) method"""
+    _processor.exporter = exporter
+
+
+def shutdown() -> None:
+    _processor.flush()
+
+
+def _parse_traceparent(value: bytes):
+    match = TRACEPARENT.match(value.strip().lower())
+    if match is None or match.group(1) == b"0" * 32 or match.group(2) == b"0" * 16:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    return trace_id.decode(), parent_id.decode(), int(flags, 16) & 1 == 1
+
+
+class TracingMiddleware:
+    """Opens each request's server span, continuing the caller's trace if any"""
+
+    def __init__(self, app: ASGIApp, service: str) -> None:
+        self.app = app
+        _processor.service = service
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = _parse_traceparent(value)
+                break
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = "%032x" % random.getrandbits(128), None
+            sampled = random.random() < settings.tracing_sample_rate
+        method = scope["method"]
+        server_span = Span(trace_id, parent_id, sampled, method, SERVER)
+        token = _current.set(server_span)
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException:
+            server_span.error = True
+            raise
+        finally:
+            _current.reset(token)
+            if sampled:
+                route = scope.get("route")
+                template = route.path if route is not None else None
+                if template is not None:
+                    server_span.name = f"{method} {template}"
+                    server_span.set("http.route", template)
+                server_span.set("http.request.method", method)
+                server_span.set("url.path", scope["path"])
+                server_span.set("http.response.status_code", status_code)
+                server_span.error = server_span.error or status_code >= 500
+                server_span.finish()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """A client span for every SQL statement run in a traced request"""
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is not None and parent.sampled:
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+            context._trace_span = parent.child(operation, CLIENT, {
+                "db.system": system,
+                "db.statement": statement[:MAX_STATEMENT_LENGTH],
+            })
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        sql_span = getattr(context, "_trace_span", None)
+        if sql_span is not None:
+            context._trace_span = None
+            if cursor.rowcount >= 0:
+                sql_span.set("db.rowcount", cursor.rowcount)
+            sql_span.finish()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        sql_span = getattr(exception_context.execution_context, "_trace_span", None)
+        if sql_span is not None:
+            exception_context.execution_context._trace_span = None
+            sql_span.error = True
+            sql_span.set("exception.type", type(exception_context.original_exception).__name__)
+            sql_span.finish()
+
+
+def _read_spans(paths: List[str]) -> Dict[str, List[dict]]:
+    """Spans from OTLP/JSON files by trace id, each with its service"""
+    traces: Dict[str, List[dict]] = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            for line in f:
+                for resource_spans in orjson.loads(line)["resourceSpans"]:
+                    service = next(
+                        (a["value"]["stringValue"] for a in resource_spans["resource"]["attributes"]
+                         if a["key"] == "service.name"),
+                        "unknown",
+                    )
+                    for scope_spans in resource_spans["scopeSpans"]:
+                        for s in scope_spans["spans"]:
+                            s["service"] = service
+                            traces.setdefault(s["traceId"], []).append(s)
+    return traces
+
+
+def _duration_ms(s: dict) -> float:
+    return (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+
+
+def print_trace(spans: List[dict]) -> None:
+    ids = {s["spanId"] for s in spans}
+    children: Dict[Optional[str], List[dict]] = {}
+    for s in spans:
+        # A span whose parent was not exported is shown as a root
+        parent = s.get("parentSpanId") if s.get("parentSpanId") in ids else None
+        children.setdefault(parent, []).append(s)
+    origin = min(int(s["startTimeUnixNano"]) for s in spans)
+
+    def show(s: dict, depth: int) -> None:
+        offset = (int(s["startTimeUnixNano"]) - origin) / 1e6
+        error = "  ERROR" if s.get("status", {}).get("code") == STATUS_ERROR else ""
+        print(f"{offset:>9.2f} {_duration_ms(s):>9.2f}  {'  ' * depth}{s['service']}: {s['name']}{error}")
+        for child in sorted(children.get(s["spanId"], []), key=lambda c: int(c["startTimeUnixNano"])):
+            show(child, depth + 1)
+
+    print(f"{'start ms':>9} {'ms':>9}  span")
+    for root in sorted(children.get(None, []), key=lambda c: int(c["startTimeUnixNano"])):
+        show(root, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show traces written by the file exporter")
+    parser.add_argument("files", nargs="*", help=f"OTLP/JSON files (default: {settings.tracing_dir}/*.jsonl)")
+    parser.add_argument("--trace", help="trace id to show as a tree")
+    parser.add_argument("--top", type=int, default=20, help="slowest traces listed")
+    args = parser.parse_args()
+
+    traces = _read_spans(args.files or sorted(glob.glob(os.path.join(settings.tracing_dir, "*.jsonl"))))
+    if args.trace:
+        if args.trace not in traces:
+            parser.error(f"trace {args.trace} not found")
+        print_trace(traces[args.trace])
+        return
+    listed = []
+    for trace_id, spans in traces.items():
+        roots = [s for s in spans if not s.get("parentSpanId")] or spans
+        root = min(roots, key=lambda s: int(s["startTimeUnixNano"]))
+        listed.append((_duration_ms(root), trace_id, root, len(spans)))
+    print(f"{'ms':>9}  {'trace id':<32}  {'spans':>5}  root")
+    for duration, trace_id, root, count in sorted(listed, key=lambda t: t[0], reverse=True)[:args.top]:
+        print(f"{duration:>9.2f}  {trace_id:<32}  {count:>5}  {root['service']}: {root['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SERVICES = ("auth-service", "question-service", "blog-service")
+
+# Settings every service requires at import time
+DEFAULT_ENV = {
+    "DATABASE_URL": "sqlite://",
+    "SECRET_KEY": "benchmark-secret-key",
+}
+
+
+def _unregister_metrics(module) -> None:
+    """Drop an evicted module's metrics from the default Prometheus registry,
+    where the next service's metrics module registers the same names"""
+    prometheus_client = sys.modules.get("prometheus_client")
+    if prometheus_client is None:
+        return
+    for value in list(vars(module).values()):
+        if isinstance(value, prometheus_client.metrics.MetricWrapperBase):
+            try:
+                prometheus_client.REGISTRY.unregister(value)
+            except KeyError:
+                # Imported into several modules, dropped with the first
+                pass
+
+
+def load_service(name: str, **env: str):
+    """Make a service's flat modules importable, evicting those of any other service.
+
+    Every service ships top-level modules with the same names (config, database,
+    models, ...), so only one service can be imported into a process at a time.
+    Returns an import function bound to the selected service.
+    """
+    service_dir = REPO_ROOT / name
+    service_dirs = {str(REPO_ROOT / service) for service in SERVICES}
+
+    for module_name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None) or ""
+        if os.path.dirname(module_file) in service_dirs:
+            _unregister_metrics(module)
+            del sys.modules[module_name]
+
+    sys.path[:] = [path for path in sys.path if path not in service_dirs]
+    sys.path.insert(0, str(service_dir))
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ.update(env)
+
+    return importlib.import_module
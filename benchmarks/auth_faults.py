@@ -0,0 +1,106 @@
+"""Token verification under auth-service faults: timeouts, breaker, hedging, grace.
+
+Runs question-service's verify_token against the in-process stub while the
+stub moves through phases of healthy, slow, failing and hung behaviour, and
+reports outcomes, latency and breaker state per phase.
+
+    python -m benchmarks.auth_faults
+    python -m benchmarks.auth_faults --hedge-delay-ms 0 --grace-seconds 0
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from benchmarks._service import load_service
+from benchmarks import stub_auth
+
+PHASES = (
+    ("healthy", stub_auth.Faults()),
+    ("slow tail", stub_auth.Faults(latency_ms=5, jitter_ms=400)),
+    ("errors", stub_auth.Faults(error_rate=1.0)),
+    ("recovered", stub_auth.Faults()),
+    ("hung", stub_auth.Faults(hang_rate=1.0)),
+    ("recovered", stub_auth.Faults()),
+)
+
+
+async def run_phase(auth_middleware, HTTPException, requests: int, concurrency: int, users: int):
+    outcomes = Counter()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await auth_middleware.verify_token(f"stub-{index % users + 1}")
+                outcomes["ok"] += 1
+            except HTTPException as exc:
+                outcomes[str(exc.status_code)] += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    latencies.sort()
+    return outcomes, latencies
+
+
+async def run(args, auth_middleware, metrics, HTTPException):
+    states = {0: "closed", 1: "half-open", 2: "open"}
+    for name, faults in PHASES:
+        stub_auth.faults = faults
+        if name == "recovered":
+            # Let the breaker's reset timeout pass and send the probe that closes it
+            await asyncio.sleep(args.reset_seconds)
+            try:
+                await auth_middleware.verify_token("stub-1")
+            except HTTPException:
+                pass
+        grace_before = metrics.AUTH_GRACE_ACCEPTS._value.get()
+        hedges_before = metrics.AUTH_HEDGED_REQUESTS._value.get()
+        outcomes, latencies = await run_phase(
+            auth_middleware, HTTPException, args.requests, args.concurrency, args.users
+        )
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(
+            f"{name:<11}{dict(outcomes)!s:<28}{p50:>9.1f}{p99:>9.1f}"
+            f"{int(metrics.AUTH_HEDGED_REQUESTS._value.get() - hedges_before):>8}"
+            f"{int(metrics.AUTH_GRACE_ACCEPTS._value.get() - grace_before):>8}"
+            f"   {states[auth_middleware.breaker.state]}"
+        )
+    await auth_middleware.close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="verifications per phase")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="distinct tokens")
+    parser.add_argument("--read-timeout", type=float, default=0.5)
+    parser.add_argument("--hedge-delay-ms", type=float, default=50.0)
+    parser.add_argument("--grace-seconds", type=float, default=60.0)
+    parser.add_argument("--threshold", type=int, default=5)
+    parser.add_argument("--reset-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with stub_auth.StubAuthServer() as stub:
+        import_module = load_service(
+            "question-service",
+            AUTH_SERVICE_URL=stub.url,
+            AUTH_READ_TIMEOUT=str(args.read_timeout),
+            AUTH_HEDGE_DELAY_MS=str(args.hedge_delay_ms),
+            AUTH_GRACE_SECONDS=str(args.grace_seconds),
+            AUTH_BREAKER_THRESHOLD=str(args.threshold),
+            AUTH_BREAKER_RESET_SECONDS=str(args.reset_seconds),
+        )
+        auth_middleware = import_module("auth_middleware")
+        metrics = import_module("metrics")
+        from fastapi import HTTPException
+
+        print(f"{'phase':<11}{'outcomes':<28}{'p50 ms':>9}{'p99 ms':>9}{'hedged':>8}{'grace':>8}   breaker")
+        asyncio.run(run(args, auth_middleware, metrics, HTTPException))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Storage saved by compressed bodies against the cost of reading them back.
+
+Stores question, answer and blog-sized bodies through question-service's
+CompressedText codec plain, with zlib, with zstd and with zstd and a
+dictionary trained on a separate sample, and reports the stored size and
+the per-body encode and decode times, plus a 20-answer thread read back
+through SQLite.
+
+    python -m benchmarks.body_compression --bodies 2000
+
+The synthetic vocabulary is small, so its ratios flatter real text: pass
+--sample-db with a copy of a question-service database to measure stored
+bodies instead.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+
+from benchmarks._service import load_service
+from benchmarks.dataset import paragraphs
+from benchmarks.distributions import long_tail_words
+
+# (kind, median words, cap) as generated by benchmarks.dataset
+KINDS = (("question", 120, 4000), ("answer", 80, 3000), ("blog", 600, 20000))
+THREAD_ANSWERS = 20
+
+
+def synthetic_bodies(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    bodies = []
+    for i in range(count):
+        _, median, cap = KINDS[i % len(KINDS)]
+        bodies.append(paragraphs(rng, long_tail_words(rng, median=median, cap=cap)))
+    return bodies
+
+
+def stored_bodies(url: str, count: int, seed: int, compressed_text) -> list:
+    """Bodies of questions and answers sampled from an existing database"""
+    engine = create_engine(url)
+    bodies = []
+    with engine.connect() as connection:
+        for table in ("questions", "answers"):
+            result = connection.exec_driver_sql(f"SELECT content FROM {table} ORDER BY id DESC LIMIT {count}")
+            bodies.extend(compressed_text.decode(value) for (value,) in result)
+    random.Random(seed).shuffle(bodies)
+    return bodies
+
+
+def per_body_us(func, values: list, repeat: int) -> float:
+    """Best mean microseconds per value over several rounds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in values:
+            func(value)
+        best = min(best, (time.perf_counter() - start) / len(values))
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bodies", type=int, default=2000, help="bodies measured, and as many trained on")
+    parser.add_argument("--sample-db", help="question-service database URL to sample bodies from")
+    parser.add_argument("--min-bytes", type=int, default=512)
+    parser.add_argument("--level", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-compression-")
+    import_module = load_service(
+        "question-service",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'questions.db')}",
+        BODY_COMPRESSION="",
+        BODY_COMPRESSION_MIN_BYTES=str(args.min_bytes),
+        BODY_COMPRESSION_LEVEL=str(args.level),
+    )
+    database = import_module("database")
+    models = import_module("models")
+    compressed_text = import_module("compressed_text")
+    config = import_module("config")
+    database.init_db()
+
+    if args.sample_db:
+        bodies = stored_bodies(args.sample_db, args.bodies, args.seed, compressed_text)
+        training, bodies = bodies[: len(bodies) // 2], bodies[len(bodies) // 2:]
+    else:
+        training = synthetic_bodies(args.bodies, args.seed + 1)
+        bodies = synthetic_bodies(args.bodies, args.seed)
+    raw_bytes = sum(len(body.encode()) for body in bodies)
+    sizes = [len(body.encode()) for body in bodies]
+    print(
+        f"{len(bodies)} bodies, {raw_bytes / 1e6:.1f} MB, median {statistics.median(sizes):.0f} B, "
+        f"{sum(size >= args.min_bytes for size in sizes) / len(sizes):.0%} at or above {args.min_bytes} B"
+    )
+
+    # Training data goes in through the models, as the dictionary is trained on stored rows
+    with database.SessionLocal() as db:
+        question = models.Question(title="Training bodies", content=training[0], user_id=1)
+        db.add(question)
+        db.flush()
+        db.execute(insert(models.Answer.__table__), [
+            {"content": body, "question_id": question.id, "user_id": 1} for body in training
+        ])
+        db.commit()
+
+    print(f"\n{'mode':<16}{'stored MB':>10}{'ratio':>8}{'encode us':>11}{'decode us':>11}{'thread ms':>11}")
+    for name, mode, trained in (("plain", "", False), ("zlib", "zlib", False), ("zstd", "zstd", False),
+                                ("zstd + dict", "zstd", True)):
+        if trained and not compressed_text._dictionaries:
+            compressed_text.train(len(training))
+        config.settings.body_compression = mode
+        stored = [compressed_text.encode(body, mode) for body in bodies]
+        assert all(compressed_text.decode(value) == body for value, body in zip(stored, bodies))
+        stored_bytes = sum(len(value) for value in stored)
+        encode_us = per_body_us(lambda body: compressed_text.encode(body, mode), bodies, args.repeat)
+        decode_us = per_body_us(compressed_text.decode, stored, args.repeat)
+
+        # A thread's answers read back through the column type
+        with database.SessionLocal() as db:
+            thread = models.Question(title=f"Thread {name}", content=bodies[0], user_id=1)
+            db.add(thread)
+            db.flush()
+            db.add_all(
+                models.Answer(content=body, question_id=thread.id, user_id=1)
+                for body in bodies[:THREAD_ANSWERS]
+            )
+            db.commit()
+            query = select(models.Answer.content).where(models.Answer.question_id == thread.id)
+            best = float("inf")
+            for _ in range(args.repeat * 4):
+                start = time.perf_counter()
+                db.execute(query).scalars().all()
+                best = min(best, time.perf_counter() - start)
+
+        print(
+            f"{name:<16}{stored_bytes / 1e6:>10.2f}{raw_bytes / stored_bytes:>8.2f}"
+            f"{encode_us:>11.1f}{decode_us:>11.1f}{best * 1e3:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import bisect
+import itertools
+import random
+
+
+class ZipfSampler:
+    """Draw ids from 1..n with Zipfian popularity.
+
+    Ranks are mapped to ids through a seeded permutation, so the dataset
+    generator and the load driver agree on which ids are hot without the hot
+    set simply being the oldest rows.
+    """
+
+    def __init__(self, n: int, exponent: float = 1.1, seed: int = 0):
+        self.n = n
+        weights = [1.0 / (rank ** exponent) for rank in range(1, n + 1)]
+        self._cumulative = list(itertools.accumulate(weights))
+        self._ids = list(range(1, n + 1))
+        random.Random(seed).shuffle(self._ids)
+
+    def sample(self, rng: random.Random) -> int:
+        rank = bisect.bisect_left(self._cumulative, rng.random() * self._cumulative[-1])
+        return self._ids[min(rank, self.n - 1)]
+
+
+def long_tail_words(rng: random.Random, median: int, cap: int) -> int:
+    """Content length in words: mostly near the median, occasionally very long"""
+    return min(cap, max(5, int(rng.paretovariate(1.3) * median * 0.6)))
@@ -0,0 +1,113 @@
+"""Per-row cost of the question list endpoint: ORM hydration vs Core projection.
+
+Seeds a temporary SQLite database through question-service's models and times
+building the GET /questions response (query, row mapping, response validation
+and JSON serialization) the old way and the new way.
+
+    python -m benchmarks.list_projection --questions 2000 --page-sizes 20 100 500
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+from benchmarks._service import load_service
+
+
+def seed(db, models, questions: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for i in range(questions):
+        question = models.Question(
+            title=f"Benchmark question number {i}",
+            content="lorem ipsum dolor sit amet " * rng.randint(10, 400),
+            user_id=rng.randint(1, 200),
+            views=rng.randint(0, 5000),
+        )
+        db.add(question)
+        db.flush()
+        for _ in range(rng.randint(0, 5)):
+            db.add(models.Answer(content="an answer " * 20, question_id=question.id, user_id=1))
+        for user_id in range(rng.randint(0, 10)):
+            db.add(models.Vote(question_id=question.id, user_id=user_id, vote_type=models.VoteType.UPVOTE))
+    db.commit()
+
+
+def orm_page(db, models, skip: int, limit: int) -> list:
+    """The list path before the Core projection: full ORM rows and two COUNTs per row"""
+    Question, Answer, Vote = models.Question, models.Answer, models.Vote
+    questions = db.query(Question).offset(skip).limit(limit).all()
+    result = []
+    for question in questions:
+        answer_count = db.query(Answer).filter(Answer.question_id == question.id).count()
+        vote_count = db.query(Vote).filter(Vote.question_id == question.id).count()
+        result.append({**question.__dict__, "answer_count": answer_count, "vote_count": vote_count})
+    return result
+
+
+def orm_hydration_page(db, models, skip: int, limit: int) -> list:
+    """ORM hydration alone, without the per-row COUNT queries"""
+    questions = db.query(models.Question).offset(skip).limit(limit).all()
+    return [{**question.__dict__, "answer_count": 0, "vote_count": 0} for question in questions]
+
+
+def core_page(db, main, skip: int, limit: int) -> list:
+    """The current list path"""
+    return db.execute(main.QUESTION_SUMMARY_SELECT.offset(skip).limit(limit)).mappings().all()
+
+
+def measure(build, adapter, session_factory, limit: int, repeat: int) -> float:
+    """Best seconds to build, validate and serialize one page"""
+    best = float("inf")
+    for _ in range(repeat):
+        db = session_factory()
+        try:
+            start = time.perf_counter()
+            rows = build(db, 0, limit)
+            adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+            best = min(best, time.perf_counter() - start)
+        finally:
+            db.close()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-list-")
+    import_module = load_service(
+        "question-service", DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'questions.db')}"
+    )
+    database = import_module("database")
+    models = import_module("models")
+    schemas = import_module("schemas")
+    service_main = import_module("main")
+    from pydantic import TypeAdapter
+
+    database.init_db()
+    db = database.SessionLocal()
+    seed(db, models, args.questions)
+    db.close()
+
+    old_adapter = TypeAdapter(List[schemas.QuestionResponse])
+    new_adapter = TypeAdapter(List[schemas.QuestionSummaryResponse])
+    variants = [
+        ("orm + per-row counts (before)", lambda db, s, l: orm_page(db, models, s, l), old_adapter),
+        ("orm hydration only", lambda db, s, l: orm_hydration_page(db, models, s, l), old_adapter),
+        ("core projection (after)", lambda db, s, l: core_page(db, service_main, s, l), new_adapter),
+    ]
+
+    print(f"{'variant':<32}{'page':>6}{'ms/page':>10}{'us/row':>10}")
+    for limit in args.page_sizes:
+        for name, build, adapter in variants:
+            elapsed = measure(build, adapter, database.SessionLocal, limit, args.repeat)
+            print(f"{name:<32}{limit:>6}{elapsed * 1e3:>10.2f}{elapsed / limit * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Replay a weighted mix of forum traffic against running services.
+
+Each virtual user logs in once and then loops over scenarios picked from the
+mix until the duration elapses. Question and blog ids are drawn with the same
+Zipfian popularity the dataset generator used.
+
+    python -m benchmarks.loadtest --users 50 --duration 60 --output results.json
+    python -m benchmarks.loadtest --duration 60 --compare results.json
+
+Run auth-service or `python -m benchmarks.stub_auth` on --auth-url.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+from benchmarks.dataset import PASSWORD, paragraphs, words
+from benchmarks.distributions import ZipfSampler
+
+DEFAULT_MIX = (
+    "browse_questions=30,open_thread=25,browse_blogs=15,open_blog=10,"
+    "vote=8,answer=5,login=4,write_blog=3"
+)
+
+
+class Recorder:
+    """Latency samples and errors per endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.recording = False
+
+    def record(self, endpoint: str, elapsed: float, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.latencies[endpoint].append(elapsed)
+        if not ok:
+            self.errors[endpoint] += 1
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Context:
+    def __init__(self, args, clients: dict, recorder: Recorder):
+        self.args = args
+        self.clients = clients
+        self.recorder = recorder
+        self.questions = ZipfSampler(args.questions, exponent=1.05, seed=args.seed)
+        self.blogs = ZipfSampler(args.blogs, exponent=1.05, seed=args.seed + 1)
+
+    async def call(self, service: str, endpoint: str, method: str, url: str, token: str = None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        start = time.perf_counter()
+        try:
+            response = await self.clients[service].request(method, url, headers=headers, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        return response
+
+
+class VirtualUser:
+    def __init__(self, context: Context, user_id: int, seed: int):
+        self.context = context
+        self.user_id = user_id
+        self.rng = random.Random(seed)
+        self.token = None
+
+    async def login(self):
+        response = await self.context.call(
+            "auth", "POST /auth/login", "POST", "/auth/login",
+            json={"username": f"user{self.user_id}", "password": PASSWORD},
+        )
+        if response is not None and response.status_code == 200:
+            self.token = response.json()["access_token"]
+
+    async def browse_questions(self):
+        skip = int(self.rng.paretovariate(1.5) - 1) * 20
+        await self.context.call("question", "GET /questions", "GET", "/questions", params={"skip": skip, "limit": 20})
+
+    async def open_thread(self):
+        question_id = self.context.questions.sample(self.rng)
+        # The question page issues these three requests in parallel
+        await asyncio.gather(
+            self.context.call("question", "GET /questions/{id}", "GET", f"/questions/{question_id}"),
+            self.context.call("question", "GET /answers/question/{id}", "GET", f"/answers/question/{question_id}"),
+            self.context.call("question", "GET /votes/question/{id}/stats", "GET", f"/votes/question/{question_id}/stats"),
+        )
+
+    async def browse_blogs(self):
+        skip = int(self.rng.paretovariate(1.5) - 1) * 20
+        await self.context.call("blog", "GET /blogs", "GET", "/blogs", params={"skip": skip, "limit": 20})
+
+    async def open_blog(self):
+        blog_id = self.context.blogs.sample(self.rng)
+        await self.context.call("blog", "GET /blogs/{id}", "GET", f"/blogs/{blog_id}")
+
+    async def vote(self):
+        await self.context.call(
+            "question", "POST /votes", "POST", "/votes", token=self.token,
+            json={
+                "question_id": self.context.questions.sample(self.rng),
+                "vote_type": "upvote" if self.rng.random() < 0.85 else "downvote",
+            },
+        )
+
+    async def answer(self):
+        await self.context.call(
+            "question", "POST /answers", "POST", "/answers", token=self.token,
+            json={
+                "question_id": self.context.questions.sample(self.rng),
+                "content": paragraphs(self.rng, self.rng.randint(20, 200)),
+            },
+        )
+
+    async def write_blog(self):
+        await self.context.call(
+            "blog", "POST /blogs", "POST", "/blogs", token=self.token,
+            json={
+                "title": words(self.rng, 6).title(),
+                "content": paragraphs(self.rng, self.rng.randint(100, 1500)),
+                "summary": words(self.rng, 20),
+            },
+        )
+
+    async def run(self, scenarios: list, weights: list, deadline: float):
+        await self.login()
+        while time.perf_counter() < deadline:
+            scenario = self.rng.choices(scenarios, weights)[0]
+            if scenario == "login":
+                await self.login()
+            else:
+                await getattr(self, scenario)()
+            if self.context.args.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.context.args.think_time))
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not hasattr(VirtualUser, name) and name != "login":
+            raise SystemExit(f"Unknown scenario: {name}")
+        weights[name] = float(weight)
+    return weights
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.latencies.items()):
+        samples.sort()
+        endpoints[endpoint] = {
+            "count": len(samples),
+            "errors": recorder.errors[endpoint],
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
+    return endpoints
+
+
+def print_report(endpoints: dict, baseline: dict = None) -> None:
+    header = f"{'endpoint':<32}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:<32}{stats['count']:>8}{stats['errors']:>8}{stats['throughput_rps']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+        previous = (baseline or {}).get(endpoint)
+        if previous:
+            deltas = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if previous[key]:
+                    deltas.append(f"{key} {(stats[key] - previous[key]) / previous[key] * 100:+.1f}%")
+            print(f"{'':<32}vs baseline: " + ", ".join(deltas))
+
+
+async def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    scenarios, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users * 3, max_keepalive_connections=args.users * 3)
+    timeout = httpx.Timeout(args.timeout)
+
+    async with httpx.AsyncClient(base_url=args.auth_url, limits=limits, timeout=timeout) as auth, \
+            httpx.AsyncClient(base_url=args.question_url, limits=limits, timeout=timeout) as question, \
+            httpx.AsyncClient(base_url=args.blog_url, limits=limits, timeout=timeout) as blog:
+        context = Context(args, {"auth": auth, "question": question, "blog": blog}, recorder)
+        user_ids = ZipfSampler(args.max_user_id, exponent=1.2, seed=args.seed)
+        seeder = random.Random(args.seed)
+        start = time.perf_counter()
+        deadline = start + args.warmup + args.duration
+        users = [
+            VirtualUser(context, user_ids.sample(seeder), seed=args.seed + index)
+            for index in range(args.users)
+        ]
+        tasks = [asyncio.create_task(user.run(scenarios, weights, deadline)) for user in users]
+
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measured_from = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - measured_from
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(),
+            "duration_s": round(elapsed, 2),
+            "users": args.users,
+            "mix": mix,
+        },
+        "endpoints": summarize(recorder, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--auth-url", default="http://localhost:8001")
+    parser.add_argument("--question-url", default="http://localhost:8002")
+    parser.add_argument("--blog-url", default="http://localhost:8003")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before recording")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between scenarios")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--questions", type=int, default=5000, help="questions in the dataset")
+    parser.add_argument("--blogs", type=int, default=2000, help="blogs in the dataset")
+    parser.add_argument("--max-user-id", type=int, default=1000, help="users in the dataset")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["endpoints"]
+    print(f"commit {results['meta']['commit']}, {args.users} users, {results['meta']['duration_s']}s")
+    print_report(results["endpoints"], baseline)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
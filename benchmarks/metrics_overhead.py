@@ -0,0 +1,72 @@
+"""Hot-path cost of the metrics layer.
+
+Times a trivial ASGI endpoint called directly and through MetricsMiddleware,
+and a SQLite statement with and without the engine instrumentation.
+
+    python -m benchmarks.metrics_overhead --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._service import load_service
+
+
+async def _endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message):
+    pass
+
+
+async def time_asgi(app, requests: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), _receive, _send)
+    return (time.perf_counter() - start) / requests
+
+
+def time_queries(engine, queries: int) -> float:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        statement = text("SELECT 1")
+        start = time.perf_counter()
+        for _ in range(queries):
+            conn.execute(statement).scalar()
+        return (time.perf_counter() - start) / queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--service", default="question-service")
+    args = parser.parse_args()
+
+    import_module = load_service(args.service)
+    metrics = import_module("metrics")
+    from sqlalchemy import create_engine
+
+    bare = asyncio.run(time_asgi(_endpoint, args.requests))
+    wrapped = asyncio.run(time_asgi(metrics.MetricsMiddleware(_endpoint), args.requests))
+    print(f"asgi request   bare {bare * 1e6:8.2f} us   with metrics {wrapped * 1e6:8.2f} us"
+          f"   overhead {(wrapped - bare) * 1e6:6.2f} us/request")
+
+    plain_engine = create_engine("sqlite://")
+    instrumented_engine = create_engine("sqlite://")
+    metrics.instrument_engine(instrumented_engine)
+    plain = time_queries(plain_engine, args.requests)
+    instrumented = time_queries(instrumented_engine, args.requests)
+    print(f"sql statement  bare {plain * 1e6:8.2f} us   with metrics {instrumented * 1e6:8.2f} us"
+          f"   overhead {(instrumented - plain) * 1e6:6.2f} us/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Micro-benchmarks for the per-request CPU hot paths, with a regression gate.
+
+Each benchmark is calibrated to run for at least --min-time per round; the
+median of --rounds rounds is reported and compared with the stored baseline.
+The command exits non-zero if any median is more than --threshold slower.
+
+    python -m benchmarks.micro --save-baseline      # record on the reference commit
+    python -m benchmarks.micro                      # compare, fail on regressions
+    python -m benchmarks.micro --filter validate
+
+Baselines are machine specific, so they are kept out of the repository.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+from benchmarks._service import load_service
+from benchmarks.stub_auth import StubAuthServer
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "micro_baseline.json"
+PAGE_SIZES = (20, 100, 500)
+
+
+def measure(func: Callable[[], object], rounds: int, min_time: float) -> List[float]:
+    """Seconds per call for each round, with the loop count calibrated to min_time"""
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return timings
+
+
+def _seed(db, rows) -> None:
+    db.add_all(rows)
+    db.commit()
+
+
+def auth_benchmarks(workdir: str):
+    import_module = load_service("auth-service", DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'auth.db')}")
+    database = import_module("database")
+    models = import_module("models")
+    schemas = import_module("schemas")
+    auth = import_module("auth")
+    from pydantic import TypeAdapter
+
+    token = auth.create_access_token({"sub": "42", "username": "user42", "role_id": 1})
+    hashed = auth.get_password_hash("benchmark-password")
+    yield "auth.create_access_token", lambda: auth.create_access_token(
+        {"sub": "42", "username": "user42", "role_id": 1}
+    )
+    yield "auth.decode_token", lambda: auth.decode_token(token)
+    yield "auth.verify_password", lambda: auth.verify_password("benchmark-password", hashed)
+    yield "auth.get_password_hash", lambda: auth.get_password_hash("benchmark-password")
+
+    database.init_db()
+    db = database.SessionLocal()
+    now = datetime.utcnow()
+    _seed(db, [
+        models.User(
+            username=f"user{i}", email=f"user{i}@example.com", hashed_password=hashed,
+            full_name=f"User {i}", is_active=True, created_at=now, updated_at=now,
+        )
+        for i in range(max(PAGE_SIZES))
+    ])
+    users = db.query(models.User).all()
+    adapter = TypeAdapter(List[schemas.UserResponse])
+    for size in PAGE_SIZES:
+        page = users[:size]
+        yield f"validate.UserResponse[{size}]", lambda page=page: adapter.validate_python(page, from_attributes=True)
+    db.close()
+
+
+def question_benchmarks(workdir: str, auth_url: str):
+    import_module = load_service(
+        "question-service",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'questions.db')}",
+        AUTH_SERVICE_URL=auth_url,
+    )
+    database = import_module("database")
+    models = import_module("models")
+    schemas = import_module("schemas")
+    auth_middleware = import_module("auth_middleware")
+    from pydantic import TypeAdapter
+
+    database.init_db()
+    db = database.SessionLocal()
+    now = datetime.utcnow()
+    _seed(db, [
+        models.Question(
+            title=f"Benchmark question number {i}", content="lorem ipsum dolor sit amet " * 40,
+            user_id=i % 50 + 1, views=i, created_at=now - timedelta(minutes=i), updated_at=now,
+        )
+        for i in range(max(PAGE_SIZES))
+    ])
+    rows = [
+        {**question.__dict__, "answer_count": 3, "vote_count": 7}
+        for question in db.query(models.Question).all()
+    ]
+    db.close()
+
+    adapter = TypeAdapter(List[schemas.QuestionResponse])
+    for size in PAGE_SIZES:
+        page = rows[:size]
+        yield f"validate.QuestionResponse[{size}]", lambda page=page: adapter.validate_python(page)
+
+    def hydrate(size: int):
+        session = database.SessionLocal()
+        try:
+            return session.query(models.Question).limit(size).all()
+        finally:
+            session.close()
+
+    for size in PAGE_SIZES:
+        yield f"hydrate.Question[{size}]", lambda size=size: hydrate(size)
+
+    loop = asyncio.new_event_loop()
+    yield "auth_middleware.verify_token", lambda: loop.run_until_complete(
+        auth_middleware.verify_token("stub-42")
+    )
+    loop.run_until_complete(auth_middleware.close_client())
+    loop.close()
+
+
+def blog_benchmarks(workdir: str):
+    import_module = load_service("blog-service", DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'blogs.db')}")
+    database = import_module("database")
+    models = import_module("models")
+    schemas = import_module("schemas")
+    renderer = import_module("renderer")
+    from pydantic import TypeAdapter
+
+    database.init_db()
+    db = database.SessionLocal()
+    now = datetime.utcnow()
+    blogs = []
+    for i in range(max(PAGE_SIZES)):
+        blog = models.Blog(
+            title=f"Benchmark blog post {i}", content="lorem ipsum dolor sit amet\n\n" * 200,
+            summary="A benchmark post", user_id=i % 50 + 1, is_published=True, views=i,
+            created_at=now - timedelta(minutes=i), updated_at=now,
+        )
+        renderer.apply_rendering(blog)
+        blogs.append(blog)
+    _seed(db, blogs)
+    blogs = db.query(models.Blog).all()
+
+    adapter = TypeAdapter(List[schemas.BlogResponse])
+    for size in PAGE_SIZES:
+        page = blogs[:size]
+        yield f"validate.BlogResponse[{size}]", lambda page=page: adapter.validate_python(page, from_attributes=True)
+    db.close()
+
+    def hydrate(size: int):
+        session = database.SessionLocal()
+        try:
+            return session.query(models.Blog).limit(size).all()
+        finally:
+            session.close()
+
+    for size in PAGE_SIZES:
+        yield f"hydrate.Blog[{size}]", lambda size=size: hydrate(size)
+
+
+def run(args) -> dict:
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="bench-micro-")
+    with StubAuthServer() as stub:
+        groups = [
+            auth_benchmarks(workdir),
+            question_benchmarks(workdir, stub.url),
+            blog_benchmarks(workdir),
+        ]
+        for group in groups:
+            # Benchmarks are generated lazily so each one runs while its service is loaded
+            for name, func in group:
+                if args.filter and args.filter not in name:
+                    continue
+                timings = measure(func, args.rounds, args.min_time)
+                results[name] = {
+                    "median_us": statistics.median(timings) * 1e6,
+                    "min_us": min(timings) * 1e6,
+                    "stdev_pct": statistics.pstdev(timings) / statistics.mean(timings) * 100,
+                }
+                print(format_result(name, results[name], args.baseline_results.get(name)), flush=True)
+    return results
+
+
+def format_result(name: str, result: dict, previous: dict = None) -> str:
+    line = f"{name:<36}{result['median_us']:>12.1f}{result['min_us']:>12.1f}{result['stdev_pct']:>8.1f}%"
+    if previous:
+        change = (result["median_us"] - previous["median_us"]) / previous["median_us"] * 100
+        line += f"{change:>+10.1f}%"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per round")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed median slowdown (0.15 = 15%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    args.baseline_results = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            args.baseline_results = json.load(baseline_file)["results"]
+
+    print(f"{'benchmark':<36}{'median us':>12}{'min us':>12}{'stdev':>9}{'vs base':>11}")
+    results = run(args)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({"python": sys.version.split()[0], "results": results}, baseline_file, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    regressions = [
+        name for name, result in results.items()
+        if name in args.baseline_results
+        and result["median_us"] > args.baseline_results[name]["median_us"] * (1 + args.threshold)
+    ]
+    if regressions:
+        print(f"regressions beyond {args.threshold:.0%}: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compare JSON encoders and response compression on blog list payloads.
+
+Run from the repository root:
+
+    python -m benchmarks.serialization --items 20 100
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks._service import load_service
+
+WORDS = (
+    "python fastapi service database query index cache latency request response "
+    "postgres session token schema model async worker pool thread vote answer"
+).split()
+
+
+def build_blog_page(items: int, with_content: bool, seed: int = 0) -> list:
+    """Build a page of blogs shaped like the already-validated response content"""
+    rng = random.Random(seed)
+    now = datetime(2024, 1, 1)
+    page = []
+    for i in range(items):
+        # Long-tail article sizes: most are short, a few are very long
+        words = int(rng.paretovariate(1.2) * 300)
+        content = " ".join(rng.choice(WORDS) for _ in range(min(words, 20000)))
+        item = {
+            "id": i + 1,
+            "title": " ".join(rng.choice(WORDS) for _ in range(6)).title(),
+            "summary": " ".join(rng.choice(WORDS) for _ in range(25)),
+            "user_id": rng.randint(1, 500),
+            "is_published": True,
+            "views": rng.randint(0, 10000),
+            "created_at": (now - timedelta(days=i)).isoformat(),
+            "updated_at": now.isoformat(),
+        }
+        if with_content:
+            item["content"] = content
+        else:
+            item["excerpt"] = content[:300]
+        page.append(item)
+    return page
+
+
+def best_of(func, repeat: int = 5, number: int = 20) -> float:
+    """Return the best mean seconds per call over several rounds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def compress_all(compressor, body: bytes) -> bytes:
+    return compressor.compress(body) + compressor.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[20, 100])
+    args = parser.parse_args()
+
+    import_module = load_service("blog-service")
+    fast_response = import_module("fast_response")
+    from fastapi.responses import JSONResponse
+
+    for shape in ("full", "summary"):
+        for items in args.items:
+            page = build_blog_page(items, with_content=(shape == "full"))
+            stdlib_body = JSONResponse(page).body
+            orjson_body = fast_response.ORJSONResponse(page).body
+
+            stdlib_time = best_of(lambda: JSONResponse(page))
+            orjson_time = best_of(lambda: fast_response.ORJSONResponse(page))
+
+            print(f"\n{shape} blog page, {items} items")
+            print(f"  {'encoder':<10}{'bytes':>12}{'us/render':>12}")
+            print(f"  {'json':<10}{len(stdlib_body):>12,}{stdlib_time * 1e6:>12.1f}")
+            print(f"  {'orjson':<10}{len(orjson_body):>12,}{orjson_time * 1e6:>12.1f}"
+                  f"   ({stdlib_time / orjson_time:.1f}x faster)")
+
+            print(f"  {'encoding':<10}{'bytes':>12}{'us/body':>12}{'ratio':>8}")
+            for encoding in fast_response.SUPPORTED_ENCODINGS:
+                compressed = compress_all(fast_response.new_compressor(encoding), orjson_body)
+                elapsed = best_of(lambda: compress_all(fast_response.new_compressor(encoding), orjson_body))
+                print(f"  {encoding:<10}{len(compressed):>12,}{elapsed * 1e6:>12.1f}"
+                      f"{len(orjson_body) / len(compressed):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
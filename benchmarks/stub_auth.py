@@ -0,0 +1,155 @@
+"""Stand-in for auth-service so the other services can be load tested alone.
+
+Tokens are "stub-<user_id>"; any password is accepted for "user<id>" names.
+Faults (latency, errors, hung requests) can be injected on the command line
+or at runtime with PUT /faults.
+
+    python -m benchmarks.stub_auth --port 8001
+    python -m benchmarks.stub_auth --latency-ms 20 --jitter-ms 300 --error-rate 0.1
+"""
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import List
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, status
+from pydantic import BaseModel, Field
+
+app = FastAPI(title="Stub Auth Service")
+
+TOKEN_PREFIX = "stub-"
+CREATED_AT = datetime(2024, 1, 1).isoformat()
+
+
+class Credentials(BaseModel):
+    username: str
+    password: str
+
+
+class Faults(BaseModel):
+    latency_ms: float = Field(0.0, ge=0)
+    jitter_ms: float = Field(0.0, ge=0)
+    error_rate: float = Field(0.0, ge=0, le=1)
+    hang_rate: float = Field(0.0, ge=0, le=1)
+
+
+faults = Faults()
+
+
+async def inject_faults(request: Request):
+    delay = faults.latency_ms + random.uniform(0, faults.jitter_ms)
+    if delay:
+        await asyncio.sleep(delay / 1000)
+    if random.random() < faults.hang_rate:
+        # Don't answer until the caller's read timeout gives up on the connection
+        while not await request.is_disconnected():
+            await asyncio.sleep(0.05)
+    if random.random() < faults.error_rate:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Injected fault")
+
+
+def user_payload(user_id: int) -> dict:
+    return {
+        "id": user_id,
+        "username": f"user{user_id}",
+        "email": f"user{user_id}@example.com",
+        "full_name": f"Load Test User {user_id}",
+        "is_active": True,
+        "role_id": 1,
+        "created_at": CREATED_AT,
+        "updated_at": CREATED_AT,
+    }
+
+
+def _user_id_from_token(authorization: str) -> int:
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.startswith(TOKEN_PREFIX):
+        raise ValueError(token)
+    return int(token[len(TOKEN_PREFIX):])
+
+
+@app.post("/auth/login", dependencies=[Depends(inject_faults)])
+async def login(credentials: Credentials):
+    if not credentials.username.startswith("user"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unknown stub user")
+    token = TOKEN_PREFIX + credentials.username[len("user"):]
+    return {"access_token": token, "refresh_token": token, "token_type": "bearer"}
+
+
+@app.get("/auth/me", dependencies=[Depends(inject_faults)])
+async def get_me(authorization: str = Header("")):
+    try:
+        user_id = _user_id_from_token(authorization)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_payload(user_id)
+
+
+@app.get("/auth/users", dependencies=[Depends(inject_faults)])
+async def get_users(ids: List[int] = Query([])):
+    return [{"id": user_id, "username": f"user{user_id}"} for user_id in sorted(set(ids))]
+
+
+@app.put("/faults")
+async def set_faults(new_faults: Faults):
+    global faults
+    faults = new_faults
+    return faults
+
+
+class StubAuthServer:
+    """The stub served from a background thread of the current process"""
+
+    def __init__(self):
+        import uvicorn
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=self.port, log_level="warning",
+            lifespan="off", timeout_graceful_shutdown=1,
+        ))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    import uvicorn
+
+    global faults
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random latency up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of requests never answered")
+    args = parser.parse_args()
+    faults = Faults(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, hang_rate=args.hang_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
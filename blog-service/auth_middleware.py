@@ -1,33 +1,150 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+import hashlib
 import httpx
+import time
 from config import settings
+from circuit_breaker import CircuitBreaker
+from metrics import AUTH_CALL_LATENCY, AUTH_GRACE_ACCEPTS, AUTH_HEDGED_REQUESTS
+import rate_limit
+import tracing
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+breaker = CircuitBreaker(
+    "auth-service",
+    failure_threshold=settings.auth_breaker_threshold,
+    reset_timeout=settings.auth_breaker_reset_seconds,
+)
+
+# Recently verified users by token digest, oldest first; only used in grace mode
+_verified: "OrderedDict[bytes, tuple]" = OrderedDict()
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """The worker's pooled client for auth-service, created on first use"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=settings.auth_service_url,
+            timeout=httpx.Timeout(
+                settings.auth_read_timeout,
+                connect=settings.auth_connect_timeout,
+                pool=settings.auth_connect_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.auth_max_connections,
+                max_keepalive_connections=settings.auth_max_connections,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _get_me(client: httpx.AsyncClient, token: str) -> httpx.Response:
+    """One GET /auth/me, traced and carrying the trace context when traced"""
+    with tracing.span("GET /auth/me", tracing.CLIENT, **{"server.address": settings.auth_service_url}) as span:
+        response = await client.get("/auth/me", headers=tracing.inject({"Authorization": f"Bearer {token}"}))
+        if span is not None:
+            span.set("http.response.status_code", response.status_code)
+            span.error = response.status_code >= 500
+        return response
+
+
+async def _fetch_user(token: str) -> httpx.Response:
+    """GET /auth/me, hedged with a second request if the first is slow"""
+    client = get_client()
+    if settings.auth_hedge_delay_ms <= 0:
+        return await _get_me(client, token)
+
+    first = asyncio.ensure_future(_get_me(client, token))
+    done, _ = await asyncio.wait({first}, timeout=settings.auth_hedge_delay_ms / 1000)
+    if done:
+        return first.result()
+
+    AUTH_HEDGED_REQUESTS.inc()
+    pending = {first, asyncio.ensure_future(_get_me(client, token))}
+    try:
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not pending:
+                raise task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def _remember(token: str, user: dict) -> None:
+    key = _token_digest(token)
+    _verified[key] = (time.monotonic(), user)
+    _verified.move_to_end(key)
+    while len(_verified) > settings.auth_grace_cache_size:
+        _verified.popitem(last=False)
+
+
+def _grace_or_unavailable(token: str) -> dict:
+    """Accept a recently verified token, or report auth-service as unavailable"""
+    if settings.auth_grace_seconds > 0:
+        entry = _verified.get(_token_digest(token))
+        if entry is not None and time.monotonic() - entry[0] <= settings.auth_grace_seconds:
+            AUTH_GRACE_ACCEPTS.inc()
+            return entry[1]
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Auth service unavailable"
+    )
+
 
 async def verify_token(token: str = Depends(oauth2_scheme)) -> dict:
+    if not breaker.allow():
+        return _grace_or_unavailable(token)
+
+    start = time.perf_counter()
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.auth_service_url}/auth/me",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid authentication credentials",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-            
-            return response.json()
-    except httpx.RequestError:
+        response = await _fetch_user(token)
+    except httpx.HTTPError:
+        response = None
+
+    if response is None or response.status_code >= 500:
+        # Timeouts, connection errors and server errors count against the breaker
+        breaker.record_failure()
+        AUTH_CALL_LATENCY.labels("error").observe(time.perf_counter() - start)
+        return _grace_or_unavailable(token)
+
+    breaker.record_success()
+    if response.status_code != 200:
+        AUTH_CALL_LATENCY.labels("rejected").observe(time.perf_counter() - start)
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Auth service unavailable"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
 
+    AUTH_CALL_LATENCY.labels("ok").observe(time.perf_counter() - start)
+    user = response.json()
+    if settings.auth_grace_seconds > 0:
+        _remember(token, user)
+    rate_limit.remember_user(token, user["id"])
+    return user
+
 
 async def get_current_user(user_data: dict = Depends(verify_token)) -> dict:
     return user_data
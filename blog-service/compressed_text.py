@@ -0,0 +1,261 @@
+"""Compressed storage for large text columns.
+
+CompressedText columns keep their TEXT type, so enabling, disabling or
+converting needs no schema change and compressed and plain rows coexist.
+With BODY_COMPRESSION set, a value of at least body_compression_min_bytes
+is stored as a marker character, a codec letter and the compressed bytes
+in base64, whenever that is smaller than the value itself:
+
+- "zstd": zstd frames, with the newest dictionary from
+  compression_dictionaries once one has been trained; a frame records its
+  dictionary's id, so rows written with older dictionaries stay readable
+- "zlib": zlib streams
+
+Values are decompressed when a query selects the column, never otherwise:
+list queries select stored excerpts instead of bodies, and endpoints that
+load a row without returning its body defer the column. Workers pick up
+a newly trained dictionary for writes when they restart.
+
+Existing rows are converted in batches by the command line:
+
+    python compressed_text.py --train        # train and store a zstd dictionary
+    python compressed_text.py                # compress plain rows
+    python compressed_text.py --recompress   # also re-encode compressed rows
+    python compressed_text.py --decompress   # store every row plain again
+"""
+import argparse
+import base64
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import zstandard
+from sqlalchemy import Text, bindparam, select, text, type_coerce, update
+from sqlalchemy.types import TypeDecorator
+
+from config import settings
+from database import Base, SessionLocal, engine
+
+# Never the first character of a plain value: one that starts with it is
+# stored escaped as MARKER + RAW
+MARKER = "\x01"
+ZSTD = "z"
+ZLIB = "g"
+RAW = "r"
+
+# Trained dictionaries by id, and the newest one's id; loaded on first use
+_dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+_newest: Optional[int] = None
+_loaded = False
+_load_lock = threading.Lock()
+# Compressor and decompressor objects are not thread-safe
+_local = threading.local()
+
+
+def load_dictionaries() -> None:
+    global _newest, _loaded
+    with _load_lock:
+        with engine.connect() as connection:
+            rows = connection.execute(text("SELECT id, data FROM compression_dictionaries ORDER BY id")).all()
+        for dictionary_id, data in rows:
+            if dictionary_id not in _dictionaries:
+                _dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(bytes(data))
+        _newest = rows[-1][0] if rows else None
+        _loaded = True
+
+
+def _dictionary(dictionary_id: int) -> zstandard.ZstdCompressionDict:
+    if dictionary_id not in _dictionaries:
+        # Trained after this worker loaded its dictionaries
+        load_dictionaries()
+    return _dictionaries[dictionary_id]
+
+
+def _compressor() -> zstandard.ZstdCompressor:
+    if not _loaded:
+        load_dictionaries()
+    key = (_newest, settings.body_compression_level)
+    cached = getattr(_local, "compressor", None)
+    if cached is None or cached[0] != key:
+        dictionary = _dictionaries[_newest] if _newest is not None else None
+        cached = (key, zstandard.ZstdCompressor(level=settings.body_compression_level, dict_data=dictionary))
+        _local.compressor = cached
+    return cached[1]
+
+
+def _decompressor(dictionary_id: int) -> zstandard.ZstdDecompressor:
+    decompressors = getattr(_local, "decompressors", None)
+    if decompressors is None:
+        decompressors = _local.decompressors = {}
+    decompressor = decompressors.get(dictionary_id)
+    if decompressor is None:
+        dictionary = _dictionary(dictionary_id) if dictionary_id else None
+        decompressor = decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return decompressor
+
+
+def encode(value: str, mode: Optional[str] = None) -> str:
+    """The stored form of a value under `mode` (default: BODY_COMPRESSION)"""
+    mode = settings.body_compression if mode is None else mode
+    escape = value.startswith(MARKER)
+    data = value.encode() if mode else b""
+    if len(data) >= settings.body_compression_min_bytes:
+        if mode == "zstd":
+            codec, compressed = ZSTD, _compressor().compress(data)
+        elif mode == "zlib":
+            codec, compressed = ZLIB, zlib.compress(data, min(settings.body_compression_level, 9))
+        else:
+            raise ValueError(f"Unknown body compression {mode!r}")
+        stored = MARKER + codec + base64.b64encode(compressed).decode()
+        if len(stored) < len(data) or escape:
+            return stored
+    return MARKER + RAW + value if escape else value
+
+
+def decode(stored: str) -> str:
+    if not stored.startswith(MARKER):
+        return stored
+    codec, payload = stored[1], stored[2:]
+    if codec == RAW:
+        return payload
+    data = base64.b64decode(payload)
+    if codec == ZSTD:
+        return _decompressor(zstandard.get_frame_parameters(data).dict_id).decompress(data).decode()
+    if codec == ZLIB:
+        return zlib.decompress(data).decode()
+    raise ValueError(f"Unknown stored text codec {codec!r}")
+
+
+def is_compressed(stored: str) -> bool:
+    return stored.startswith(MARKER) and stored[1:2] != RAW
+
+
+class CompressedText(TypeDecorator):
+    """TEXT whose large values are stored compressed; see the module docstring"""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else encode(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decode(value)
+
+
+def compressed_columns() -> Dict[object, list]:
+    """CompressedText columns by table"""
+    # models imports this module, so the tables are registered by now
+    tables = {}
+    for table in Base.metadata.sorted_tables:
+        columns = [column for column in table.columns if isinstance(column.type, CompressedText)]
+        if columns:
+            tables[table] = columns
+    return tables
+
+
+def convert_table(table, columns: list, mode: str, recompress: bool = False, batch_size: int = 500) -> Tuple[int, int, int]:
+    """Re-store a table's rows under `mode` ("" stores them plain), one
+    batch per transaction; returns (rows rewritten, bytes before, after)"""
+    (key,) = table.primary_key.columns
+    stored = [type_coerce(column, Text) for column in columns]
+    # A row changed since it was read is left for the next run
+    statement = update(table).where(
+        key == bindparam("row_id"),
+        *[value == bindparam(f"old_{column.name}") for value, column in zip(stored, columns)],
+    ).values({
+        **{column.name: type_coerce(bindparam(f"new_{column.name}"), Text) for column in columns},
+        # Re-encoding is not an edit
+        **{column.name: column for column in table.columns if column.onupdate is not None},
+    })
+    rewritten = before = after = 0
+    last_id = 0
+    while True:
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(key, *stored).where(key > last_id).order_by(key).limit(batch_size)
+            ).all()
+            if not rows:
+                return rewritten, before, after
+            changes = []
+            for row in rows:
+                change = {"row_id": row[0]}
+                for column, old in zip(columns, row[1:]):
+                    new = old
+                    if old is not None and (recompress or not mode or not is_compressed(old)):
+                        new = encode(decode(old), mode)
+                    change[f"old_{column.name}"], change[f"new_{column.name}"] = old, new
+                    before += len(old.encode()) if old is not None else 0
+                    after += len(new.encode()) if new is not None else 0
+                if any(change[f"old_{c.name}"] != change[f"new_{c.name}"] for c in columns):
+                    changes.append(change)
+            if changes:
+                db.execute(statement, changes)
+                db.commit()
+            rewritten += len(changes)
+            last_id = rows[-1][0]
+
+
+def train(sample_rows: int) -> Tuple[int, int]:
+    """Train a zstd dictionary on stored bodies and store it; returns (id, samples)"""
+    samples: List[bytes] = []
+    for table, columns in compressed_columns().items():
+        (key,) = table.primary_key.columns
+        with SessionLocal() as db:
+            for column in columns:
+                # Newest rows, which are the most like the ones still to be written
+                values = db.execute(
+                    select(column).where(column.isnot(None)).order_by(key.desc()).limit(sample_rows)
+                ).scalars()
+                samples.extend(value.encode() for value in values if value)
+    if len(samples) < 100:
+        raise ValueError(f"Only {len(samples)} bodies stored, too few to train a dictionary on")
+    with engine.begin() as connection:
+        dictionary_id = connection.execute(text("SELECT coalesce(max(id), 0) + 1 FROM compression_dictionaries")).scalar()
+        dictionary = zstandard.train_dictionary(
+            settings.body_compression_dictionary_bytes, samples,
+            dict_id=dictionary_id, level=settings.body_compression_level,
+        )
+        connection.execute(
+            text("INSERT INTO compression_dictionaries (id, data, created_at) VALUES (:id, :data, :now)"),
+            {"id": dictionary_id, "data": dictionary.as_bytes(), "now": datetime.utcnow()},
+        )
+    load_dictionaries()
+    return dictionary_id, len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert stored bodies to or from compressed storage")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--train", action="store_true", help="train a zstd dictionary on stored bodies")
+    mode.add_argument("--recompress", action="store_true", help="re-encode compressed rows too, e.g. with a new dictionary")
+    mode.add_argument("--decompress", action="store_true", help="store every row plain")
+    parser.add_argument("--samples", type=int, default=2000, help="rows sampled per column for --train")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    # Registers the tables on Base.metadata
+    import models  # noqa: F401
+
+    if args.train:
+        dictionary_id, samples = train(args.samples)
+        print(f"stored dictionary {dictionary_id}, trained on {samples} bodies")
+        return
+    target = "" if args.decompress else settings.body_compression
+    if not args.decompress and not target:
+        parser.error("BODY_COMPRESSION is not set")
+    for table, columns in compressed_columns().items():
+        start = time.perf_counter()
+        rewritten, before, after = convert_table(table, columns, target, args.recompress, args.batch_size)
+        print(
+            f"{table.name}: rewrote {rewritten} rows in {time.perf_counter() - start:.1f}s, "
+            f"stored bodies {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    # Through the imported module: its CompressedText is the one models use
+    import compressed_text
+    compressed_text.main()
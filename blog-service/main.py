@@ -1,14 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
+from sqlalchemy import select, func
 from typing import List
+import asyncio
 
-from database import get_db, init_db
-from models import Blog
-from schemas import BlogCreate, BlogResponse, BlogUpdate
-from auth_middleware import get_current_user
+from database import engine, get_db, warm_pool, check_database
+from models import Blog, EXCERPT_LENGTH
+from renderer import RENDERER_VERSION, apply_rendering
+from schemas import BlogCreate, BlogResponse, BlogUpdate, BlogSummaryResponse, RelatedBlogResponse
+from auth_middleware import get_current_user, close_client
+from config import settings
+from fast_response import ORJSONResponse, CompressionMiddleware
+from metrics import MetricsMiddleware, instrument_engine, metrics_response, mark_process_dead
+import coalesce
+from coalesce import coalesced
+import idempotency
+import profiling
+import query_inspector
+from query_inspector import query_budget
+import tracing
+import views
+import rate_limit
+import related
 
-app = FastAPI(title="Blog Service", version="1.0.0")
+app = FastAPI(title="Blog Service", version="1.0.0", default_response_class=ORJSONResponse)
+
+# List views select plain columns: no ORM hydration and no content column.
+# Rows not yet rendered fall back to a database-side substring.
+BLOG_SUMMARY_SELECT = select(
+    Blog.id, Blog.title, Blog.summary,
+    func.coalesce(Blog.excerpt, func.substr(Blog.content, 1, EXCERPT_LENGTH)).label("excerpt"),
+    Blog.reading_time_minutes, Blog.user_id,
+    Blog.is_published, Blog.views, Blog.created_at, Blog.updated_at
+)
+
+# For endpoints that load a blog without returning its bodies, which would
+# otherwise be read and decompressed for nothing
+WITHOUT_BODY = (defer(Blog.content), defer(Blog.content_html))
+
+# Identical anonymous reads share one execution; see coalesce.py. Added
+# first so rate limits, metrics and tracing still see every request
+if settings.coalesce_enabled:
+    app.add_middleware(coalesce.CoalescingMiddleware, router=app.router)
+
+# Token-bucket rate limits. Added before CORS so it runs inside it and a 429
+# still carries the CORS headers the browser needs to read it
+if settings.rate_limit_enabled:
+    app.add_middleware(rate_limit.RateLimitMiddleware, name="blog-service")
 
 # CORS middleware
 app.add_middleware(
@@ -19,6 +59,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Store and replay the responses of POSTs sent with an Idempotency-Key
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_exception_handler(idempotency.StoredResponse, idempotency.replay_handler)
+
+# Compress responses above the configured size
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
+
+# Request, status and DB metrics exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
+# Query budgets, N+1 and slow query reports; see query_inspector.py
+if settings.query_inspection != "off":
+    app.add_middleware(query_inspector.QueryInspectionMiddleware)
+    query_inspector.instrument_engine(engine)
+
+# Opt-in distributed tracing; nothing is mounted unless enabled
+if settings.tracing_enabled:
+    app.add_middleware(tracing.TracingMiddleware, service="blog-service")
+    tracing.instrument_engine(engine)
+
+# Opt-in request profiling; nothing is mounted unless enabled
+if settings.profiling_enabled:
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
+
 
 @app.get("/")
 def read_root():
@@ -30,7 +96,63 @@ def read_root():
     }
 
 
-@app.post("/blogs", response_model=BlogResponse, status_code=status.HTTP_201_CREATED)
+@app.get("/ready", include_in_schema=False)
+def ready():
+    """Readiness probe: the database is reachable through the pool"""
+    if not check_database():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database unavailable"
+        )
+    return {"status": "ready"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics endpoint"""
+    return metrics_response()
+
+
+blog_views = views.ViewCounter(Blog)
+
+# Periodic deletion of expired idempotency keys and writes of counted views,
+# one of each per worker
+cleanup_task = None
+view_task = None
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Write counted views, close the auth-service connections, export queued
+    trace spans and release this worker's live metrics"""
+    if cleanup_task is not None:
+        cleanup_task.cancel()
+    if view_task is not None:
+        view_task.cancel()
+    try:
+        await run_in_threadpool(blog_views.flush)
+    except Exception:
+        # Lost, as when a worker dies
+        pass
+    await close_client()
+    tracing.shutdown()
+    mark_process_dead()
+
+
+@app.on_event("startup")
+async def on_startup():
+    """Connect the pool before this worker accepts requests"""
+    global cleanup_task, view_task
+    cleanup_task = asyncio.create_task(idempotency.cleanup_loop())
+    view_task = asyncio.create_task(blog_views.flush_loop())
+    warm_pool()
+
+
+@app.post(
+    "/blogs", response_model=BlogResponse, status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(idempotency.idempotent)]
+)
+@query_budget(7)
 def create_blog(
     blog_data: BlogCreate,
     current_user: dict = Depends(get_current_user),
@@ -44,15 +166,20 @@ def create_blog(
         user_id=current_user["id"],
         is_published=blog_data.is_published
     )
+    apply_rendering(new_blog)
     
     db.add(new_blog)
+    db.flush()
+    related.index_blog(db, new_blog.id, new_blog.title, new_blog.summary, new_blog.content)
     db.commit()
     db.refresh(new_blog)
     
     return new_blog
 
 
-@app.get("/blogs", response_model=List[BlogResponse])
+@app.get("/blogs", response_model=List[BlogSummaryResponse])
+@query_budget(1)
+@coalesced()
 def get_blogs(
     skip: int = 0,
     limit: int = 20,
@@ -60,16 +187,18 @@ def get_blogs(
     db: Session = Depends(get_db)
 ):
     """Get all blog articles with pagination"""
-    query = db.query(Blog)
+    query = BLOG_SUMMARY_SELECT
     
     if published_only:
-        query = query.filter(Blog.is_published == True)
+        query = query.where(Blog.is_published == True)
     
-    blogs = query.offset(skip).limit(limit).all()
-    return blogs
+    rows = db.execute(query.offset(skip).limit(limit)).mappings().all()
+    return rows
 
 
 @app.get("/blogs/{blog_id}", response_model=BlogResponse)
+@query_budget(3)
+@coalesced(on_shared=lambda params: blog_views.add(int(params["blog_id"])))
 def get_blog(blog_id: int, db: Session = Depends(get_db)):
     """Get a specific blog article by ID"""
     blog = db.query(Blog).filter(Blog.id == blog_id).first()
@@ -80,14 +209,45 @@ def get_blog(blog_id: int, db: Session = Depends(get_db)):
             detail="Blog not found"
         )
     
-    blog.views += 1
-    db.commit()
-    db.refresh(blog)
+    # Only rows written before the current renderer are rendered here, once
+    if blog.render_version != RENDERER_VERSION:
+        apply_rendering(blog)
+        db.commit()
+        db.refresh(blog)
     
-    return blog
+    # Count the view; written with the others by view_task
+    return {**blog.__dict__, "views": blog.views + blog_views.add(blog.id)}
+
+
+@app.get("/blogs/{blog_id}/related", response_model=List[RelatedBlogResponse])
+@query_budget(2)
+def get_related_blogs(
+    blog_id: int,
+    limit: int = Query(5, ge=1, le=settings.related_top_k),
+    db: Session = Depends(get_db)
+):
+    """Precomputed related published blogs, most similar first; empty until related.py has run"""
+    matches = related.neighbours(db, blog_id, limit)
+    if matches is None:
+        exists = db.execute(select(Blog.id).where(Blog.id == blog_id)).first()
+        if exists is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Blog not found"
+            )
+        return []
+    similarity = dict(matches)
+    rows = db.execute(BLOG_SUMMARY_SELECT.where(
+        Blog.id.in_(similarity),
+        Blog.is_published == True
+    )).mappings().all()
+    results = [{**row, "similarity": similarity[row["id"]]} for row in rows]
+    results.sort(key=lambda row: row["similarity"], reverse=True)
+    return results
 
 
 @app.put("/blogs/{blog_id}", response_model=BlogResponse)
+@query_budget(5)
 def update_blog(
     blog_id: int,
     blog_data: BlogUpdate,
@@ -113,10 +273,15 @@ def update_blog(
         blog.title = blog_data.title
     if blog_data.content is not None:
         blog.content = blog_data.content
+        apply_rendering(blog)
     if blog_data.summary is not None:
         blog.summary = blog_data.summary
     if blog_data.is_published is not None:
         blog.is_published = blog_data.is_published
+    # Edited or newly published blogs get fresh neighbours on the next related.py run
+    edited = any(value is not None for value in (blog_data.title, blog_data.content, blog_data.summary))
+    if edited or blog_data.is_published:
+        related.index_blog(db, blog.id, blog.title, blog.summary, blog.content)
     
     db.commit()
     db.refresh(blog)
@@ -125,13 +290,14 @@ def update_blog(
 
 
 @app.delete("/blogs/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(3)
 def delete_blog(
     blog_id: int,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a blog article (only by the author)"""
-    blog = db.query(Blog).filter(Blog.id == blog_id).first()
+    blog = db.query(Blog).options(*WITHOUT_BODY).filter(Blog.id == blog_id).first()
     
     if not blog:
         raise HTTPException(
@@ -145,13 +311,15 @@ def delete_blog(
             detail="Not authorized to delete this blog"
         )
     
+    related.remove_blog(db, blog.id)
     db.delete(blog)
     db.commit()
     
     return None
 
 
-@app.get("/blogs/user/{user_id}", response_model=List[BlogResponse])
+@app.get("/blogs/user/{user_id}", response_model=List[BlogSummaryResponse])
+@query_budget(1)
 def get_blogs_by_user(
     user_id: int,
     skip: int = 0,
@@ -159,14 +327,18 @@ def get_blogs_by_user(
     db: Session = Depends(get_db)
 ):
     """Get all blogs by a specific user"""
-    blogs = db.query(Blog).filter(
+    rows = db.execute(BLOG_SUMMARY_SELECT.where(
         Blog.user_id == user_id,
         Blog.is_published == True
-    ).offset(skip).limit(limit).all()
+    ).offset(skip).limit(limit)).mappings().all()
     
-    return blogs
+    return rows
 
 
 if __name__ == "__main__":
+    # Development server; production runs migrate.py and then server.py
     import uvicorn
+    from migrate import migrate
+
+    migrate()
     uvicorn.run(app, host="0.0.0.0", port=8003)
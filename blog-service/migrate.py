@@ -0,0 +1,41 @@
+"""Create tables and columns, then re-render blogs left by an older renderer.
+
+Run once per deploy before the servers:
+
+    python migrate.py
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from database import engine, init_db
+from renderer import rerender_stale
+
+# Serializes concurrent migrate runs, e.g. init containers of several replicas
+MIGRATION_LOCK_ID = 8003
+
+
+@contextmanager
+def migration_lock():
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def migrate():
+    with migration_lock():
+        init_db()
+    # Batches use SKIP LOCKED, so this is safe to run alongside other replicas
+    rendered = rerender_stale()
+    if rendered:
+        print(f"Re-rendered {rendered} blogs")
+
+
+if __name__ == "__main__":
+    migrate()
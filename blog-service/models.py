@@ -1,17 +1,63 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, LargeBinary, JSON, ForeignKey
 from datetime import datetime
+from compressed_text import CompressedText
 from database import Base
 
+# Number of characters of the body returned by list endpoints
+EXCERPT_LENGTH = 300
+
 
 class Blog(Base):
     __tablename__ = "blogs"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)
     summary = Column(String(500))
     user_id = Column(Integer, nullable=False, index=True)
     is_published = Column(Boolean, default=True)
     views = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Rendered once on write by renderer.py; render_version marks stale output
+    content_html = Column(CompressedText)
+    excerpt = Column(String(EXCERPT_LENGTH))
+    reading_time_minutes = Column(Integer)
+    render_version = Column(Integer, index=True)
+
+
+# Hashed term vector of a blog and its precomputed related blogs, see related.py
+class BlogRelated(Base):
+    __tablename__ = "blog_related"
+
+    blog_id = Column(Integer, ForeignKey("blogs.id", ondelete="CASCADE"), primary_key=True)
+    terms = Column(LargeBinary, nullable=False)
+    frequencies = Column(LargeBinary, nullable=False)
+    # [[blog_id, score], ...] best first; null until the next related.py run
+    neighbours = Column(JSON(none_as_null=True))
+
+
+# Response of the first request made with an Idempotency-Key, replayed to
+# retries; status_code is null while that request is still running. See
+# idempotency.py
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer)
+    body = Column(LargeBinary)
+    content_type = Column(String(100))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+# zstd dictionaries trained on stored bodies, see compressed_text.py; the id
+# is the one recorded in every frame compressed with the dictionary
+class CompressionDictionary(Base):
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,264 @@
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+PROFILE_HEADER = "x-profile-token"
+
+# Frames are attributed to the first category found walking from the leaf up
+CATEGORIES = (
+    ("bcrypt", ("passlib", "bcrypt")),
+    ("jwt", ("jose",)),
+    ("sql", ("sqlalchemy/engine", "sqlalchemy/pool", "psycopg2")),
+    ("orm_hydration", ("sqlalchemy/orm",)),
+    ("serialization", ("pydantic", "fastapi/routing.py", "fastapi/encoders.py", "fast_response.py")),
+)
+
+# Leaf frames of threads that are parked rather than working
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+_IDLE_FUNCTIONS = {"wait", "select", "get", "_wait_for_tstate_lock"}
+
+
+class ProfilingState:
+    """Runtime profiling switches, adjustable through the admin endpoint"""
+
+    def __init__(self):
+        self.sample_rate = settings.profiling_sample_rate
+        self.path_prefix = settings.profiling_path_prefix
+
+
+state = ProfilingState()
+
+
+class _Session:
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.ticks = 0
+
+
+class StackSampler:
+    """Periodically sample the stacks of all busy threads while sessions are active.
+
+    Sync endpoints run in the threadpool and async code on the event loop, so
+    samples are taken process-wide; profile one request at a time for exact
+    attribution.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sessions: List[_Session] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> _Session:
+        session = _Session()
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: _Session) -> None:
+        with self._lock:
+            self._sessions.remove(session)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                sessions = list(self._sessions)
+
+            for session in sessions:
+                session.ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                stack = _collapse(frame)
+                for session in sessions:
+                    session.stacks[stack] += 1
+                    session.samples += 1
+
+            time.sleep(self.interval)
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return code.co_name in _IDLE_FUNCTIONS and os.path.basename(code.co_filename) in _IDLE_FILES
+
+
+def _short_filename(filename: str) -> str:
+    filename = filename.replace("\\", "/")
+    _, marker, package_path = filename.rpartition("-packages/")
+    return package_path if marker else os.path.basename(filename)
+
+
+def _collapse(frame) -> str:
+    """Render a stack as root-to-leaf 'file:function' entries joined by ';'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{_short_filename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _categorize(stack: str) -> str:
+    for entry in reversed(stack.split(";")):
+        filename = entry.rsplit(":", 1)[0]
+        for category, markers in CATEGORIES:
+            if any(marker in filename for marker in markers):
+                return category
+    return "other"
+
+
+sampler = StackSampler(settings.profiling_interval_ms / 1000)
+
+
+def _should_profile(scope: Scope) -> bool:
+    token = Headers(scope=scope).get(PROFILE_HEADER)
+    if token is not None:
+        return bool(settings.profiling_token) and secrets.compare_digest(token, settings.profiling_token)
+    if scope["path"].startswith("/admin/"):
+        return False
+    return (
+        state.sample_rate > 0
+        and scope["path"].startswith(state.path_prefix)
+        and random.random() < state.sample_rate
+    )
+
+
+def _save_profile(session: _Session, scope: Scope, status_code: int, elapsed: float) -> str:
+    os.makedirs(settings.profiling_dir, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", scope["path"]).strip("-") or "root"
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{scope['method']}-{slug}-{random.randrange(16 ** 6):06x}"
+
+    with open(os.path.join(settings.profiling_dir, name + ".collapsed"), "w") as collapsed:
+        for stack, count in session.stacks.most_common():
+            collapsed.write(f"{stack} {count}\n")
+
+    categories = Counter()
+    for stack, count in session.stacks.items():
+        categories[_categorize(stack)] += count
+    # Each tick covers the same slice of wall time in every busy thread
+    tick_ms = elapsed * 1000 / session.ticks if session.ticks else 0.0
+    summary = {
+        "method": scope["method"],
+        "path": scope["path"],
+        "status": status_code,
+        "duration_ms": round(elapsed * 1000, 3),
+        "samples": session.samples,
+        "categories_ms": {
+            category: round(count * tick_ms, 3) for category, count in categories.most_common()
+        },
+    }
+    with open(os.path.join(settings.profiling_dir, name + ".json"), "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    return name
+
+
+class ProfilingMiddleware:
+    """Sample stacks for requests carrying the profiling token or chosen by the sample rate.
+
+    Only mounted when PROFILING_ENABLED is set, so disabled deployments pay nothing.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        session = sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            sampler.stop(session)
+            _save_profile(session, scope, status_code, elapsed)
+
+
+class ProfilingSettings(BaseModel):
+    sample_rate: float = Field(..., ge=0.0, le=1.0)
+    path_prefix: str = ""
+
+
+router = APIRouter(prefix="/admin", include_in_schema=False)
+
+
+def _check_token(token: Optional[str]) -> None:
+    if not settings.profiling_token or not secrets.compare_digest(token or "", settings.profiling_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid profiling token"
+        )
+
+
+@router.put("/profiling", response_model=ProfilingSettings)
+def update_profiling(
+    profiling: ProfilingSettings,
+    x_profile_token: Optional[str] = Header(None)
+):
+    """Change the sampled share of traffic for this worker"""
+    _check_token(x_profile_token)
+    state.sample_rate = profiling.sample_rate
+    state.path_prefix = profiling.path_prefix
+    return profiling
+
+
+@router.get("/profiles")
+def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """List captured profiles, newest first"""
+    _check_token(x_profile_token)
+    if not os.path.isdir(settings.profiling_dir):
+        return []
+
+    profiles = []
+    for filename in sorted(os.listdir(settings.profiling_dir), reverse=True):
+        if filename.endswith(".json"):
+            with open(os.path.join(settings.profiling_dir, filename)) as summary_file:
+                profiles.append({"name": filename[:-len(".json")], **json.load(summary_file)})
+    return profiles
+
+
+@router.get("/profiles/{name}", response_class=PlainTextResponse)
+def get_profile(name: str, x_profile_token: Optional[str] = Header(None)):
+    """Download a profile's collapsed stacks (flamegraph.pl / speedscope format)"""
+    _check_token(x_profile_token)
+    path = os.path.join(settings.profiling_dir, os.path.basename(name) + ".collapsed")
+    if not os.path.isfile(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    with open(path) as collapsed:
+        return collapsed.read()
@@ -0,0 +1,163 @@
+"""Per-request SQL inspection: query budgets, N+1 detection and slow queries.
+
+Every statement a request runs is counted by its shape, the SQL text with
+parameter lists collapsed. After the request:
+
+- more statements than the endpoint's @query_budget is a budget overrun
+- one shape run query_repeat_threshold times or more is an N+1 pattern,
+  a query issued per row of an earlier result
+- statements slower than query_slow_ms are reported with the endpoint and
+  the shape of their parameters, never their values
+
+QUERY_INSPECTION selects what happens then:
+
+- "log": production; problems are logged and counted in query_problems,
+  for a QUERY_INSPECTION_SAMPLE_RATE fraction of requests
+- "raise": tests; every request is inspected and an overrun or N+1
+  raises QueryBudgetExceeded, which TestClient re-raises in the test
+- "off": nothing is mounted
+"""
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import settings
+from metrics import QUERY_PROBLEMS
+
+logger = logging.getLogger("query_inspector")
+
+# Bind parameter lists, as rendered for IN (...) and multi-row VALUES
+_PARAMETER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+MAX_CACHED_SHAPES = 2000
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries than its endpoint's budget, or an N+1 pattern"""
+
+
+def query_budget(max_queries: int) -> Callable:
+    """Declare the most SQL statements one request to an endpoint may run:
+
+        @app.get("/questions")
+        @query_budget(2)
+        def get_questions(...):
+    """
+    def decorate(endpoint: Callable) -> Callable:
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorate
+
+
+_shapes: Dict[str, str] = {}
+
+
+def statement_shape(statement: str) -> str:
+    shape = _shapes.get(statement)
+    if shape is None:
+        shape = _PARAMETER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+        if len(_shapes) >= MAX_CACHED_SHAPES:
+            _shapes.clear()
+        _shapes[statement] = shape
+    return shape
+
+
+def parameters_shape(parameters, executemany: bool) -> str:
+    """Parameter names and types, e.g. {id_1: int, param_1: int}"""
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} x {parameters_shape(rows[0], False)}" if rows else "0 rows"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+class _Inspection:
+    __slots__ = ("queries", "shapes", "slow")
+
+    def __init__(self):
+        self.queries = 0
+        self.shapes: Counter = Counter()
+        # (milliseconds, shape, parameters shape)
+        self.slow: List[Tuple[float, str, str]] = []
+
+
+_inspection: ContextVar[Optional[_Inspection]] = ContextVar("query_inspection", default=None)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record the statements run by inspected requests"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _inspection.get() is not None:
+            context._inspection_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        inspection = _inspection.get()
+        if inspection is None:
+            return
+        elapsed_ms = (time.perf_counter() - context._inspection_start) * 1000
+        shape = statement_shape(statement)
+        inspection.queries += 1
+        inspection.shapes[shape] += 1
+        if elapsed_ms >= settings.query_slow_ms:
+            inspection.slow.append((elapsed_ms, shape, parameters_shape(parameters, executemany)))
+
+
+def problems(inspection: _Inspection, budget: Optional[int]) -> List[Tuple[str, str]]:
+    """(kind, description) of each problem found in a request's statements"""
+    found = []
+    if budget is not None and inspection.queries > budget:
+        found.append(("over_budget", f"{inspection.queries} queries, budget {budget}"))
+    for shape, count in inspection.shapes.most_common():
+        if count < settings.query_repeat_threshold:
+            break
+        found.append(("repeated", f"{count} x {shape}"))
+    return found
+
+
+class QueryInspectionMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.raise_errors = settings.query_inspection == "raise"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (
+            not self.raise_errors and random.random() >= settings.query_inspection_sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        inspection = _Inspection()
+        token = _inspection.set(inspection)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _inspection.reset(token)
+
+        route = scope.get("route")
+        if route is None:
+            return
+        method = scope["method"]
+        endpoint = f"{method} {route.path}"
+        found = problems(inspection, getattr(getattr(route, "endpoint", None), "query_budget", None))
+        for kind, description in found:
+            QUERY_PROBLEMS.labels(method, route.path, kind).inc()
+            logger.warning("%s: %s", endpoint, description)
+        for elapsed_ms, shape, parameters in inspection.slow:
+            QUERY_PROBLEMS.labels(method, route.path, "slow").inc()
+            logger.warning("%s: slow query %.1fms %s with %s", endpoint, elapsed_ms, shape, parameters)
+        if found and self.raise_errors:
+            raise QueryBudgetExceeded(f"{endpoint}: " + "; ".join(description for _, description in found))
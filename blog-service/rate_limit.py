@@ -0,0 +1,308 @@
+"""Token-bucket rate limiting, mounted inside CORS.
+
+Every request is charged its route's cost against one bucket: its user's
+when it carries a token this worker has seen verified, otherwise its
+client IP's. The client IP is the connecting address, unless that is a
+trusted proxy: uvicorn resolves X-Forwarded-For from the addresses in
+FORWARDED_ALLOW_IPS, client_ip from the networks in
+FORWARDED_ALLOW_NETWORKS, taking the last entry that is not a trusted
+proxy. A client can't pick its own bucket. Buckets refill continuously
+at their rate up to their burst size; a request that finds too few
+tokens gets 429 with Retry-After.
+Responses carry RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset and
+RateLimit-Policy headers.
+
+Buckets live in a store:
+
+- "shared": a memory-mapped table shared by all workers on the node
+  (default; a few microseconds per request)
+- "redis": one Redis for every replica, for limits that must hold across
+  nodes; needs the redis package
+- "local": this worker only, the stand-in for a single process or tests
+"""
+import fcntl
+import functools
+import hashlib
+import ipaddress
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from metrics import RATE_LIMITED
+
+# Health checks and scrapes are never limited
+EXEMPT_PATHS = frozenset(("/", "/ready", "/metrics"))
+
+# Shared table slot: key hash (0 when empty), tokens, last update
+SLOT = struct.Struct("<Qdd")
+WAYS = 4
+
+TOO_MANY_REQUESTS_BODY = b'{"detail":"Too many requests"}'
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class LocalStore:
+    """Buckets in this worker's memory"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: Dict[bytes, Tuple[float, float]] = {}
+
+    async def take(self, key: bytes, cost: float, rate: float, burst: float) -> Tuple[bool, float]:
+        """Charge `cost` tokens if available; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = _refill(tokens, updated, now, rate, burst)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        # Re-inserting keeps the dict in least recently used order
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+        return allowed, tokens
+
+
+class SharedMemoryStore:
+    """Buckets in a memory-mapped file shared by the workers on a node.
+
+    The file is a fixed table of sets of WAYS slots. A key hashes to one set
+    and takes its own slot there, or else the least recently updated one,
+    whose bucket has usually refilled by then anyway. A byte-range lock on
+    the set serializes workers; within a worker the update never awaits, so
+    the event loop cannot interleave two of them.
+    """
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.sets = max(1, slots // WAYS)
+        self.set_size = WAYS * SLOT.size
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+
+    def _open(self) -> None:
+        size = self.sets * self.set_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            # Zero-filled, which reads as empty slots
+            os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+        self._fd = fd
+
+    async def take(self, key: bytes, cost: float, rate: float, burst: float) -> Tuple[bool, float]:
+        if self._map is None:
+            self._open()
+        table, fd = self._map, self._fd
+        key_hash = int.from_bytes(key[:8], "little") or 1
+        base = (key_hash % self.sets) * self.set_size
+
+        fcntl.lockf(fd, fcntl.LOCK_EX, self.set_size, base)
+        try:
+            # Read under the lock, so updates are written in time order
+            now = time.monotonic()
+            victim, oldest = base, math.inf
+            for offset in range(base, base + self.set_size, SLOT.size):
+                slot_key, tokens, updated = SLOT.unpack_from(table, offset)
+                if slot_key == key_hash:
+                    tokens = _refill(tokens, updated, now, rate, burst)
+                    break
+                if updated < oldest:
+                    victim, oldest = offset, updated
+            else:
+                offset, tokens = victim, burst
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            SLOT.pack_into(table, offset, key_hash, tokens, now)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, self.set_size, base)
+        return allowed, tokens
+
+
+# Refill and charge atomically on the Redis server, timed by its clock.
+# Tokens are returned as a string: Lua numbers would be truncated.
+_REDIS_TAKE = """
+local cost, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = burst
+if state[1] then
+    tokens = math.min(burst, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'u', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisStore:
+    """Buckets in Redis, shared by every replica; one script call per request.
+
+    If Redis is unreachable requests are allowed: an outage of the limiter
+    must not become an outage of the service.
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio
+
+        self._client = redis.asyncio.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self._take = self._client.register_script(_REDIS_TAKE)
+
+    async def take(self, key: bytes, cost: float, rate: float, burst: float) -> Tuple[bool, float]:
+        try:
+            allowed, tokens = await self._take(keys=[b"rate-limit:" + key], args=[cost, rate, burst])
+        except Exception:
+            return True, burst
+        return bool(allowed), float(tokens)
+
+
+def create_store(name: str):
+    if settings.rate_limit_store == "redis":
+        return RedisStore(settings.rate_limit_redis_url)
+    if settings.rate_limit_store == "local":
+        return LocalStore()
+    directory = settings.rate_limit_dir or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+    return SharedMemoryStore(os.path.join(directory, f"{name}-rate-limit"), settings.rate_limit_slots)
+
+
+def parse_costs(spec: str) -> List[Tuple[str, str, bool, float]]:
+    """Rules from "POST /auth/login=10,GET /blogs/*=2": method, path, prefix, cost"""
+    rules = []
+    for rule in filter(None, (part.strip() for part in spec.split(","))):
+        route, cost = rule.rsplit("=", 1)
+        method, path = route.split()
+        prefix = path.endswith("*")
+        rules.append((method.upper(), path.rstrip("*"), prefix, float(cost)))
+    return rules
+
+
+# Digests of tokens verified by this worker, mapped to their user ids
+_verified_users: Dict[bytes, int] = {}
+
+
+def _token_key(token: bytes) -> bytes:
+    return hashlib.blake2b(token, digest_size=16).digest()
+
+
+def remember_user(token: str, user_id: int) -> None:
+    """Charge later requests with this token to the user instead of the IP"""
+    key = _token_key(token.encode())
+    if key in _verified_users:
+        return
+    _verified_users[key] = user_id
+    if len(_verified_users) > settings.rate_limit_token_cache_size:
+        del _verified_users[next(iter(_verified_users))]
+
+
+def parse_networks(spec: str) -> list:
+    return [ipaddress.ip_network(network.strip(), strict=False) for network in spec.split(",") if network.strip()]
+
+
+TRUSTED_NETWORKS = parse_networks(settings.forwarded_allow_networks)
+
+
+@functools.lru_cache(maxsize=4096)
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_NETWORKS)
+
+
+def client_ip(scope: Scope) -> str:
+    """The connecting address, or when that is a proxy in a trusted network,
+    the last X-Forwarded-For entry that is not one"""
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not TRUSTED_NETWORKS or not is_trusted_proxy(address):
+        return address
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            for forwarded in reversed(value.decode("latin-1").split(",")):
+                forwarded = forwarded.strip()
+                if forwarded and not is_trusted_proxy(forwarded):
+                    return forwarded
+            break
+    return address
+
+
+def _bucket_key(scope: Scope) -> Tuple[bytes, bool]:
+    """(hashed bucket key, whether it is a user's)"""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            if value[:7].lower() == b"bearer ":
+                user_id = _verified_users.get(_token_key(value[7:]))
+                if user_id is not None:
+                    return hashlib.blake2b(b"user:%d" % user_id, digest_size=8).digest(), True
+            break
+    return hashlib.blake2b(b"ip:" + client_ip(scope).encode(), digest_size=8).digest(), False
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, name: str) -> None:
+        self.app = app
+        self.rules = parse_costs(settings.rate_limit_costs)
+        self.store = create_store(name)
+
+    def cost(self, method: str, path: str) -> float:
+        if path in EXEMPT_PATHS:
+            return 0.0
+        for rule_method, rule_path, prefix, cost in self.rules:
+            if method == rule_method and (path.startswith(rule_path) if prefix else path == rule_path):
+                return cost
+        return 1.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cost = self.cost(scope["method"], scope["path"])
+        if cost <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        key, is_user = _bucket_key(scope)
+        if is_user:
+            rate, burst = settings.rate_limit_user_rate, settings.rate_limit_user_burst
+        else:
+            rate, burst = settings.rate_limit_ip_rate, settings.rate_limit_ip_burst
+        allowed, tokens = await self.store.take(key, cost, rate, burst)
+
+        headers = [
+            (b"ratelimit-limit", b"%d" % burst),
+            (b"ratelimit-remaining", b"%d" % tokens),
+            (b"ratelimit-reset", b"%d" % math.ceil((burst - tokens) / rate)),
+            (b"ratelimit-policy", b"%d;w=%d" % (burst, math.ceil(burst / rate))),
+        ]
+        if not allowed:
+            RATE_LIMITED.labels("user" if is_user else "ip").inc()
+            headers.append((b"retry-after", b"%d" % math.ceil((cost - tokens) / rate)))
+            headers.append((b"content-type", b"application/json"))
+            headers.append((b"content-length", b"%d" % len(TOO_MANY_REQUESTS_BODY)))
+            await send({"type": "http.response.start", "status": 429, "headers": headers})
+            await send({"type": "http.response.body", "body": TOO_MANY_REQUESTS_BODY})
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,278 @@
+"""Related posts: hashed TF-IDF vectors with precomputed nearest neighbours.
+
+Words are hashed into a fixed feature space, so a blog's term vector is
+stored as it is written, with no vocabulary to refit. This job weights the
+stored vectors by IDF over the published blogs, finds each blog's top-K
+cosine neighbours in batches across a process pool and stores them next to
+the vector, so GET /blogs/{id}/related is one primary-key lookup.
+
+An incremental run scores only published blogs without neighbours (new,
+edited or just published) against the corpus and merges them into the lists
+of the blogs they are close to. A full run recomputes every list with fresh IDF weights.
+
+    python related.py              # new, edited and newly published blogs
+    python related.py --full
+"""
+import argparse
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import bindparam, delete, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal, engine
+from models import Blog, BlogRelated
+
+N_FEATURES = 1 << 18
+TITLE_WEIGHT = 2
+# Each batch scores BATCH_SIZE rows against the corpus as a dense block
+BATCH_SIZE = 64
+# Neighbours kept per scored row when merging it into other lists
+MERGE_CANDIDATES = 4
+# Corpora whose used-term matrix fits in this many bytes are scored with dense BLAS
+DENSE_BYTES = 256 << 20
+# Only one job at a time; a second one exits
+JOB_LOCK_ID = 18003
+
+RELATED_TABLE = BlogRelated.__table__
+RELATED_INSERT = insert(RELATED_TABLE)
+NEIGHBOURS_UPDATE = (
+    update(RELATED_TABLE)
+    .where(RELATED_TABLE.c.blog_id == bindparam("row_id"))
+    .values(neighbours=bindparam("neighbours"))
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+Matrix = Union[np.ndarray, sparse.csr_matrix]
+
+
+def term_vector(fields: Iterable[Tuple[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed feature indices and sublinear term frequencies of weighted text fields"""
+    counts = Counter()
+    for field, weight in fields:
+        for token in _TOKEN.findall(field.lower()):
+            counts[zlib.crc32(token.encode()) % N_FEATURES] += weight
+    terms = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    frequencies = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    order = np.argsort(terms)
+    return terms[order], frequencies[order]
+
+
+def _vector_row(blog_id: int, title: str, summary: Optional[str], content: str) -> dict:
+    terms, frequencies = term_vector(((title, TITLE_WEIGHT), (summary or "", 1), (content, 1)))
+    return {
+        "blog_id": blog_id,
+        "terms": terms.tobytes(),
+        "frequencies": frequencies.tobytes(),
+        "neighbours": None,
+    }
+
+
+def index_blog(db: Session, blog_id: int, title: str, summary: Optional[str], content: str) -> None:
+    """Store a blog's vector; its neighbours are found by the next job run"""
+    db.execute(delete(BlogRelated).where(BlogRelated.blog_id == blog_id))
+    db.execute(RELATED_INSERT, [_vector_row(blog_id, title, summary, content)])
+
+
+def remove_blog(db: Session, blog_id: int) -> None:
+    db.execute(delete(BlogRelated).where(BlogRelated.blog_id == blog_id))
+
+
+def neighbours(db: Session, blog_id: int, limit: int) -> Optional[List[Tuple[int, float]]]:
+    """Stored (id, score) neighbours, best first; None when the blog isn't indexed"""
+    row = db.execute(
+        select(BlogRelated.neighbours).where(BlogRelated.blog_id == blog_id)
+    ).first()
+    if row is None:
+        return None
+    return [(related_id, score) for related_id, score in (row[0] or [])[:limit]]
+
+
+def load_corpus(db: Session) -> Tuple[np.ndarray, np.ndarray, Matrix]:
+    """Ids, whether each still needs neighbours, and the IDF-weighted, normalized vectors
+    of published blogs"""
+    rows = db.execute(
+        select(
+            BlogRelated.blog_id, BlogRelated.terms,
+            BlogRelated.frequencies, BlogRelated.neighbours.is_(None),
+        )
+        .join(Blog, Blog.id == BlogRelated.blog_id)
+        .where(Blog.is_published == True)
+        .order_by(BlogRelated.blog_id)
+    ).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool), np.empty((0, 0), dtype=np.float32)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    pending = np.fromiter((row[3] for row in rows), dtype=bool, count=len(rows))
+    indices = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.int32)
+    data = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float32)
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row[1]) // 4 for row in rows], out=indptr[1:])
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(rows), N_FEATURES))
+
+    # Terms in most blogs say little about relatedness but dominate the
+    # cost of scoring; the rest are packed into consecutive columns
+    document_frequency = np.bincount(matrix.indices, minlength=N_FEATURES)
+    used = np.flatnonzero(
+        (document_frequency > 0) & (document_frequency <= settings.related_max_df * len(rows))
+    )
+    idf = (np.log((1 + len(rows)) / (1 + document_frequency[used])) + 1).astype(np.float32)
+    matrix = matrix[:, used] @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sparse.csr_matrix(sparse.diags(1 / norms) @ matrix, dtype=np.float32)
+    if len(rows) * len(used) * 4 <= DENSE_BYTES:
+        return ids, pending, matrix.toarray()
+    return ids, pending, matrix
+
+
+# Set in each pool worker; with fork the matrix is inherited rather than pickled
+_matrix: Optional[Matrix] = None
+
+
+def _init_worker(matrix: Matrix) -> None:
+    global _matrix
+    _matrix = matrix
+
+
+def _top_neighbours(rows: np.ndarray, keep: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and cosine scores of each row's `keep` nearest other rows"""
+    scores = _matrix[rows] @ _matrix.T
+    if sparse.issparse(scores):
+        scores = scores.toarray()
+    scores[np.arange(len(rows)), rows] = -1
+    keep = min(keep, scores.shape[1] - 1)
+    if keep <= 0:
+        return np.empty((len(rows), 0), dtype=np.int64), np.empty((len(rows), 0), dtype=np.float32)
+    best = np.argpartition(scores, -keep, axis=1)[:, -keep:]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _as_list(ids: np.ndarray, columns: np.ndarray, scores: np.ndarray, top_k: int) -> list:
+    return [
+        [int(ids[column]), round(float(score), 4)]
+        for column, score in zip(columns[:top_k], scores[:top_k])
+        if score >= settings.related_min_score
+    ]
+
+
+def _merge(current: list, additions: Dict[int, float], top_k: int) -> list:
+    merged = dict(current)
+    merged.update(additions)
+    best = sorted(merged.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [[related_id, score] for related_id, score in best]
+
+
+@contextmanager
+def _job_lock():
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect() as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": JOB_LOCK_ID}).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": JOB_LOCK_ID})
+
+
+def build_neighbours(full: bool = False, workers: int = 0) -> int:
+    """Compute and store neighbour lists; returns how many lists were computed"""
+    top_k = settings.related_top_k
+    with SessionLocal() as db:
+        ids, pending, matrix = load_corpus(db)
+    rows = np.arange(len(ids)) if full else np.flatnonzero(pending)
+    if not len(rows):
+        return 0
+
+    keep = top_k if full else top_k * MERGE_CANDIDATES
+    batches = [rows[start:start + BATCH_SIZE] for start in range(0, len(rows), BATCH_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    computed = {}
+    additions: Dict[int, Dict[int, float]] = {}
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(batches)),
+        mp_context=get_context("fork"),
+        initializer=_init_worker,
+        initargs=(matrix,),
+    ) as pool:
+        results = pool.map(_top_neighbours, batches, [keep] * len(batches))
+        for batch, (columns, scores) in zip(batches, results):
+            for row, row_columns, row_scores in zip(batch, columns, scores):
+                computed[int(ids[row])] = _as_list(ids, row_columns, row_scores, top_k)
+                if full:
+                    continue
+                # Similarity is symmetric: offer this row to the lists of its nearest rows
+                for column, score in zip(row_columns, row_scores):
+                    if not pending[column] and score >= settings.related_min_score:
+                        additions.setdefault(int(ids[column]), {})[int(ids[row])] = round(float(score), 4)
+
+    with SessionLocal() as db:
+        if additions:
+            current = dict(db.execute(
+                select(BlogRelated.blog_id, BlogRelated.neighbours)
+                .where(BlogRelated.blog_id.in_(list(additions)))
+            ).all())
+            for blog_id, offered in additions.items():
+                if current.get(blog_id) is not None:
+                    computed[blog_id] = _merge(current[blog_id], offered, top_k)
+        updates = [{"row_id": blog_id, "neighbours": value} for blog_id, value in computed.items()]
+        for start in range(0, len(updates), 1000):
+            db.execute(NEIGHBOURS_UPDATE, updates[start:start + 1000])
+            db.commit()
+    return len(rows)
+
+
+def index_missing(batch_size: int = 1000) -> int:
+    """Store vectors for blogs written outside the API, e.g. bulk loads"""
+    indexed = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            batch = db.execute(
+                select(Blog.id, Blog.title, Blog.summary, Blog.content)
+                .outerjoin(BlogRelated, BlogRelated.blog_id == Blog.id)
+                .where(Blog.id > last_id, BlogRelated.blog_id.is_(None))
+                .order_by(Blog.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                return indexed
+            db.execute(RELATED_INSERT, [_vector_row(*row) for row in batch])
+            db.commit()
+            indexed += len(batch)
+            last_id = batch[-1][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute related blogs")
+    parser.add_argument("--full", action="store_true", help="recompute every list with fresh IDF weights")
+    parser.add_argument("--workers", type=int, default=0, help="processes scoring batches (default: CPUs)")
+    args = parser.parse_args()
+
+    with _job_lock() as acquired:
+        if not acquired:
+            print("another related job is running")
+            return
+        start = time.perf_counter()
+        vectorized = index_missing()
+        computed = build_neighbours(full=args.full, workers=args.workers)
+        print(f"vectorized {vectorized}, computed {computed} neighbour lists in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
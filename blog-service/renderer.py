@@ -0,0 +1,144 @@
+import html
+import math
+import re
+from dataclasses import dataclass
+
+from sqlalchemy import or_, select, update
+
+from database import SessionLocal
+from models import Blog, EXCERPT_LENGTH
+
+# Bump whenever render_content output changes; stale rows are re-rendered in the background
+RENDERER_VERSION = 1
+
+WORDS_PER_MINUTE = 200
+
+_URL_RE = re.compile(r"https?://[^\s<]+[^\s<.,;:!?)\]'\"]")
+_FENCE = "```"
+
+
+@dataclass
+class RenderedContent:
+    html: str
+    excerpt: str
+    reading_time_minutes: int
+
+
+def _render_inline(text: str) -> str:
+    """Escape text and turn bare URLs into links"""
+    escaped = html.escape(text, quote=True)
+    return _URL_RE.sub(
+        lambda match: f'<a href="{match.group(0)}" rel="nofollow noopener noreferrer">{match.group(0)}</a>',
+        escaped,
+    )
+
+
+def _render_html(content: str) -> str:
+    """Render plain text into sanitized HTML.
+
+    Every character of the source is escaped before any markup is added, so the
+    output can only contain the tags produced here: paragraphs, line breaks,
+    fenced code blocks and links.
+    """
+    parts = []
+    paragraph = []
+    code = None
+
+    def close_paragraph():
+        if paragraph:
+            parts.append("<p>" + "<br>".join(_render_inline(line) for line in paragraph) + "</p>")
+            paragraph.clear()
+
+    for line in content.replace("\r\n", "\n").split("\n"):
+        if line.strip().startswith(_FENCE):
+            if code is None:
+                close_paragraph()
+                code = []
+            else:
+                parts.append("<pre><code>" + html.escape("\n".join(code)) + "</code></pre>")
+                code = None
+        elif code is not None:
+            code.append(line)
+        elif line.strip():
+            paragraph.append(line)
+        else:
+            close_paragraph()
+
+    close_paragraph()
+    if code is not None:
+        parts.append("<pre><code>" + html.escape("\n".join(code)) + "</code></pre>")
+    return "".join(parts)
+
+
+def _make_excerpt(content: str) -> str:
+    """Plain-text excerpt cut at a word boundary"""
+    text = " ".join(word for word in content.split() if word != _FENCE)
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH]
+    space = cut.rfind(" ")
+    return cut[:space] if space > 0 else cut
+
+
+def render_content(content: str) -> RenderedContent:
+    """Compute the stored presentation fields for a blog body"""
+    words = len(content.split())
+    return RenderedContent(
+        html=_render_html(content),
+        excerpt=_make_excerpt(content),
+        reading_time_minutes=max(1, math.ceil(words / WORDS_PER_MINUTE)),
+    )
+
+
+def apply_rendering(blog: Blog) -> None:
+    """Store freshly rendered output on a blog instance"""
+    rendered = render_content(blog.content)
+    blog.content_html = rendered.html
+    blog.excerpt = rendered.excerpt
+    blog.reading_time_minutes = rendered.reading_time_minutes
+    blog.render_version = RENDERER_VERSION
+
+
+def rerender_stale(batch_size: int = 100) -> int:
+    """Re-render blogs produced by an older renderer, one batch per transaction.
+
+    Rows are claimed with SKIP LOCKED so several workers can run this
+    concurrently without rendering the same blog twice.
+    """
+    stale = or_(Blog.render_version.is_(None), Blog.render_version < RENDERER_VERSION)
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(Blog.id, Blog.content)
+                .where(stale)
+                .order_by(Blog.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                return total
+
+            for blog_id, content in rows:
+                rendered = render_content(content)
+                db.execute(
+                    update(Blog)
+                    .where(Blog.id == blog_id)
+                    .values(
+                        content_html=rendered.html,
+                        excerpt=rendered.excerpt,
+                        reading_time_minutes=rendered.reading_time_minutes,
+                        render_version=RENDERER_VERSION,
+                        # Re-rendering is not an edit
+                        updated_at=Blog.updated_at,
+                    )
+                )
+            db.commit()
+            total += len(rows)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    print(f"Re-rendered {rerender_stale()} blogs")
@@ -25,8 +25,31 @@ class BlogResponse(BlogBase):
     id: int
     user_id: int
     views: int
+    content_html: Optional[str] = None
+    excerpt: Optional[str] = None
+    reading_time_minutes: Optional[int] = None
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class BlogSummaryResponse(BaseModel):
+    id: int
+    title: str
+    summary: Optional[str] = None
+    excerpt: str
+    reading_time_minutes: Optional[int] = None
+    user_id: int
+    is_published: bool
+    views: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class RelatedBlogResponse(BlogSummaryResponse):
+    similarity: float
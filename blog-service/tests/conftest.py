@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Service modules are imported flat and read their settings at import time
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/blogs.db")
+os.environ.update(QUERY_INSPECTION="raise", RATE_LIMIT_ENABLED="false", TRACING_ENABLED="false")
@@ -0,0 +1,48 @@
+"""Endpoints run under QUERY_INSPECTION=raise, so a request over its
+@query_budget or repeating a statement per row fails its test"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import migrate
+
+# More than query_repeat_threshold, so a statement run per row shows
+BLOGS = 6
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate.migrate()
+    client = TestClient(main.app)
+    blog_ids = []
+    for number in range(BLOGS):
+        main.app.dependency_overrides[main.get_current_user] = lambda: {"id": 1 + number % 2}
+        response = client.post("/blogs", json={
+            "title": f"Seeded blog number {number}",
+            "content": f"Content of seeded blog {number}. " * 5,
+            "is_published": number != 0,
+        })
+        assert response.status_code == 201
+        blog_ids.append(response.json()["id"])
+    main.app.dependency_overrides.clear()
+    client.blog_ids = blog_ids
+    return client
+
+
+def test_list_blogs(client):
+    response = client.get("/blogs")
+    assert response.status_code == 200
+    assert len(response.json()) == BLOGS - 1
+    assert len(client.get("/blogs", params={"published_only": False}).json()) == BLOGS
+
+
+def test_blogs_by_user(client):
+    response = client.get("/blogs/user/2")
+    assert response.status_code == 200
+    assert len(response.json()) == BLOGS // 2
+
+
+def test_blog_detail(client):
+    response = client.get(f"/blogs/{client.blog_ids[1]}")
+    assert response.status_code == 200
+    assert response.json()["content_html"]
@@ -0,0 +1,42 @@
+from pydantic_settings import BaseSettings
+from pydantic import Field
+
+
+class Settings(BaseSettings):
+    auth_service_url: str = Field(default="http://localhost:8001", env="AUTH_SERVICE_URL")
+    question_service_url: str = Field(default="http://localhost:8002", env="QUESTION_SERVICE_URL")
+    blog_service_url: str = Field(default="http://localhost:8003", env="BLOG_SERVICE_URL")
+    # Per upstream: a slow service only empties its own sections of a page
+    auth_timeout: float = Field(default=1.0, env="AUTH_TIMEOUT")
+    question_timeout: float = Field(default=2.0, env="QUESTION_TIMEOUT")
+    blog_timeout: float = Field(default=2.0, env="BLOG_TIMEOUT")
+    connect_timeout: float = Field(default=0.5, env="CONNECT_TIMEOUT")
+    upstream_max_connections: int = Field(default=100, env="UPSTREAM_MAX_CONNECTIONS")
+    breaker_threshold: int = Field(default=5, env="BREAKER_THRESHOLD")
+    breaker_reset_seconds: float = Field(default=10.0, env="BREAKER_RESET_SECONDS")
+    list_cache_seconds: float = Field(default=5.0, env="LIST_CACHE_SECONDS")
+    user_cache_seconds: float = Field(default=60.0, env="USER_CACHE_SECONDS")
+    cache_size: int = Field(default=10000, env="CACHE_SIZE")
+    compression_minimum_size: int = Field(default=1024, env="COMPRESSION_MINIMUM_SIZE")
+    host: str = Field(default="0.0.0.0", env="HOST")
+    port: int = Field(default=8004, env="PORT")
+    # 0 starts one worker per CPU available to the container
+    web_concurrency: int = Field(default=0, env="WEB_CONCURRENCY")
+    backlog: int = Field(default=2048, env="BACKLOG")
+    keepalive_timeout: int = Field(default=75, env="KEEPALIVE_TIMEOUT")
+    graceful_timeout: int = Field(default=25, env="GRACEFUL_TIMEOUT")
+    access_log: bool = Field(default=False, env="ACCESS_LOG")
+    # Comma-separated addresses of the proxies (gateway, ingress) trusted to
+    # set X-Forwarded-For; anyone else's header is ignored and the client is
+    # the connecting address. "*" would let any client pick its address.
+    forwarded_allow_ips: str = Field(default="127.0.0.1", env="FORWARDED_ALLOW_IPS")
+    # Comma-separated CIDRs of further trusted proxies, for those whose
+    # addresses change, like gateway pods: e.g. the cluster's pod network
+    forwarded_allow_networks: str = Field(default="", env="FORWARDED_ALLOW_NETWORKS")
+
+    class Config:
+        env_file = ".env"
+        case_sensitive = False
+
+
+settings = Settings()
@@ -0,0 +1,238 @@
+from fastapi import FastAPI, Header, HTTPException, Query, status
+from fastapi.middleware.cors import CORSMiddleware
+from typing import Dict, Iterable, Optional
+import asyncio
+
+import upstream
+from upstream import TTLCache, UpstreamError
+from config import settings
+from fast_response import ORJSONResponse, CompressionMiddleware
+from metrics import DEGRADED_SECTIONS, MetricsMiddleware, metrics_response, mark_process_dead
+
+app = FastAPI(title="Gateway Service", version="1.0.0", default_response_class=ORJSONResponse)
+
+# CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Compress responses above the configured size
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
+
+# Request and status metrics exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Upstream calls carry the client's address for the services' rate limits
+app.add_middleware(upstream.ClientAddressMiddleware)
+
+# Public sections are shared by every viewer, so they are cached briefly
+list_cache = TTLCache("lists", settings.list_cache_seconds, settings.cache_size)
+user_cache = TTLCache("users", settings.user_cache_seconds, settings.cache_size)
+
+MAX_USER_LOOKUP = 100
+
+
+class Page:
+    """Collects a page's sections; a failed upstream empties only its own sections"""
+
+    def __init__(self):
+        self.sections = {}
+        self.errors = {}
+
+    async def section(self, name: str, coroutine):
+        try:
+            self.sections[name] = await coroutine
+        except UpstreamError as exc:
+            self.sections[name] = None
+            self.errors[name] = exc.reason
+            DEGRADED_SECTIONS.labels(name).inc()
+        return self.sections[name]
+
+    def render(self, **extra) -> dict:
+        return {**self.sections, **extra, "errors": self.errors}
+
+
+def error_detail(response) -> Optional[str]:
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    return body.get("detail") if isinstance(body, dict) else None
+
+
+async def fetch_json(
+    service: upstream.Upstream, path: str, params: dict = None, cache: TTLCache = None,
+    primary: bool = False, authorization: Optional[str] = None
+):
+    """GET JSON from an upstream, through the cache if given.
+
+    An upstream 4xx is passed on for the page's primary resource and only
+    degrades any other section. Reads for a signed-in viewer carry their
+    Authorization and skip the cache, so they see their own writes at once.
+    """
+    key = (path, tuple(sorted((params or {}).items())))
+    if authorization:
+        cache = None
+    value = cache.get(key) if cache is not None else None
+    if value is None:
+        headers = {"Authorization": authorization} if authorization else {}
+        response = await service.get(path, params=params, headers=headers)
+        if response.status_code >= 400:
+            if primary:
+                raise HTTPException(status_code=response.status_code, detail=error_detail(response))
+            raise UpstreamError(service.name, f"status {response.status_code}")
+        value = response.json()
+        if cache is not None:
+            cache.set(key, value)
+    return value
+
+
+async def get_viewer(authorization: Optional[str]) -> Optional[dict]:
+    """Verify the caller's token once per page; anonymous when absent or rejected"""
+    if not authorization:
+        return None
+    response = await upstream.auth.get("/auth/me", headers={"Authorization": authorization})
+    return response.json() if response.status_code == 200 else None
+
+
+async def get_users(ids: Iterable[int]) -> Dict[int, dict]:
+    """Public user profiles by id, fetching only those not cached in one batch call"""
+    users, missing = {}, []
+    for user_id in set(ids):
+        cached = user_cache.get(user_id)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            users[user_id] = cached
+
+    for start in range(0, len(missing), MAX_USER_LOOKUP):
+        response = await upstream.auth.get(
+            "/auth/users", params={"ids": missing[start:start + MAX_USER_LOOKUP]}
+        )
+        if response.status_code != 200:
+            raise UpstreamError(upstream.auth.name, f"status {response.status_code}")
+        for user in response.json():
+            user_cache.set(user["id"], user)
+            users[user["id"]] = user
+    return users
+
+
+async def attach_authors(page: Page, *names: str) -> None:
+    """Add an `author` to the items of the named sections, None where it can't be resolved"""
+    sections = {name: page.sections.get(name) for name in names}
+    user_ids = []
+    for value in sections.values():
+        if isinstance(value, list):
+            user_ids.extend(item["user_id"] for item in value)
+        elif value is not None:
+            user_ids.append(value["user_id"])
+
+    users = await page.section("authors", get_users(user_ids)) or {}
+    page.sections.pop("authors")
+    # Copies, since section values may be shared with the cache
+    for name, value in sections.items():
+        if isinstance(value, list):
+            page.sections[name] = [{**item, "author": users.get(item["user_id"])} for item in value]
+        elif value is not None:
+            page.sections[name] = {**value, "author": users.get(value["user_id"])}
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Close upstream connections and release this worker's live metrics"""
+    await upstream.close_all()
+    mark_process_dead()
+
+
+@app.get("/")
+def read_root():
+    """Health check endpoint"""
+    return {
+        "service": "Gateway Service",
+        "status": "running",
+        "version": "1.0.0"
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics endpoint"""
+    return metrics_response()
+
+
+@app.get("/pages/home")
+async def home_page(
+    limit: int = Query(10, ge=1, le=50),
+    authorization: Optional[str] = Header(None)
+):
+    """Latest questions and blogs with author names, plus the signed-in viewer"""
+    page = Page()
+    await asyncio.gather(
+        page.section("viewer", get_viewer(authorization)),
+        page.section("questions", fetch_json(upstream.questions, "/questions", {"limit": limit}, list_cache)),
+        page.section("blogs", fetch_json(upstream.blogs, "/blogs", {"limit": limit}, list_cache)),
+    )
+    await attach_authors(page, "questions", "blogs")
+    return page.render()
+
+
+@app.get("/pages/questions/{question_id}")
+async def question_page(question_id: int, authorization: Optional[str] = Header(None)):
+    """A question with its answers, vote stats, related questions, author names and the viewer"""
+    page = Page()
+    # The question itself is not cached: fetching it counts a view. A
+    # signed-in viewer may just have answered or voted, so their thread
+    # reads go past the cache
+    await asyncio.gather(
+        page.section("viewer", get_viewer(authorization)),
+        page.section("question", fetch_json(
+            upstream.questions, f"/questions/{question_id}", primary=True, authorization=authorization
+        )),
+        page.section("answers", fetch_json(
+            upstream.questions, f"/answers/question/{question_id}", cache=list_cache, authorization=authorization
+        )),
+        page.section("vote_stats", fetch_json(
+            upstream.questions, f"/votes/question/{question_id}/stats", cache=list_cache, authorization=authorization
+        )),
+        page.section("related", fetch_json(upstream.questions, f"/questions/{question_id}/related", cache=list_cache)),
+    )
+    if page.sections["question"] is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Question service unavailable"
+        )
+    await attach_authors(page, "question", "answers")
+    return page.render()
+
+
+@app.get("/pages/users/{user_id}")
+async def user_page(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    authorization: Optional[str] = Header(None)
+):
+    """A user's public profile with their questions and published blogs"""
+    page = Page()
+    await asyncio.gather(
+        page.section("viewer", get_viewer(authorization)),
+        page.section("user", get_users([user_id])),
+        page.section("questions", fetch_json(upstream.questions, f"/questions/user/{user_id}", {"limit": limit}, list_cache)),
+        page.section("blogs", fetch_json(upstream.blogs, f"/blogs/user/{user_id}", {"limit": limit}, list_cache)),
+    )
+    users = page.sections.pop("user")
+    if users is not None and user_id not in users:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return page.render(user=users[user_id] if users else None)
+
+
+if __name__ == "__main__":
+    # Development server; production runs server.py
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8004)
@@ -0,0 +1,142 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# With several workers each process writes its samples to this directory and
+# /metrics aggregates them; it must exist before the first metric is created
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    multiprocess_mode="livesum",
+)
+RESPONSES = Counter(
+    "http_responses",
+    "HTTP responses by route template and status code",
+    ["method", "route", "status"],
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to the backing services",
+    ["upstream", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+DEGRADED_SECTIONS = Counter(
+    "gateway_degraded_sections",
+    "Page sections left empty because their upstream failed",
+    ["section"],
+)
+CACHE_LOOKUPS = Counter(
+    "gateway_cache_lookups",
+    "Partial-result cache lookups",
+    ["cache", "result"],
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open",
+    ["upstream"],
+    multiprocess_mode="max",
+)
+CIRCUIT_BREAKER_TRIPS = Counter(
+    "circuit_breaker_trips",
+    "Times a circuit breaker opened",
+    ["upstream"],
+)
+
+
+def _route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+# Labelled children resolved once per route; labels() takes a lock on every call
+_route_children = {}
+_response_children = {}
+
+
+def _latency_for(method: str, route: str):
+    latency = _route_children.get((method, route))
+    if latency is None:
+        latency = REQUEST_LATENCY.labels(method, route)
+        _route_children[(method, route)] = latency
+    return latency
+
+
+def _response_counter(method: str, route: str, status_code: int):
+    counter = _response_children.get((method, route, status_code))
+    if counter is None:
+        counter = RESPONSES.labels(method, route, str(status_code))
+        _response_children[(method, route, status_code)] = counter
+    return counter
+
+
+class MetricsMiddleware:
+    """Record latency, in-flight requests and status codes per route"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+
+            method = scope["method"]
+            route = _route_template(scope)
+            _latency_for(method, route).observe(elapsed)
+            _response_counter(method, route, status_code).inc()
+
+
+def metrics_response() -> Response:
+    """Render all metrics, aggregated across worker processes when enabled"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the shared directory on shutdown"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
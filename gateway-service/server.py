@@ -0,0 +1,70 @@
+"""Production entry point: prefork uvicorn workers on uvloop and httptools.
+
+    python server.py
+"""
+import math
+import os
+import shutil
+
+import uvicorn
+
+from config import settings
+
+# Workers share metrics through this directory unless the environment sets one
+DEFAULT_MULTIPROC_DIR = "/tmp/prometheus-multiproc"
+
+
+def _cgroup_cpu_limit():
+    """CPUs granted by the container's cgroup v2 quota, if one is set"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+    except (OSError, ValueError):
+        return None
+    if quota == "max":
+        return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+
+def worker_count() -> int:
+    if settings.web_concurrency > 0:
+        return settings.web_concurrency
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    return min(available, limit) if limit else available
+
+
+def reset_metrics_dir() -> None:
+    """Clear samples left by workers of a previous run before any worker starts"""
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def main():
+    workers = worker_count()
+    if workers > 1:
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", DEFAULT_MULTIPROC_DIR)
+    reset_metrics_dir()
+
+    uvicorn.run(
+        "main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=settings.backlog,
+        # Longer than the upstream proxies' idle timeout so they close first
+        timeout_keep_alive=settings.keepalive_timeout,
+        # In-flight requests get this long to finish after SIGTERM
+        timeout_graceful_shutdown=settings.graceful_timeout,
+        access_log=settings.access_log,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.forwarded_allow_ips,
+    )
+
+
+if __name__ == "__main__":
+    main()
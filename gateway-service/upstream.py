@@ -0,0 +1,180 @@
+import functools
+import ipaddress
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from circuit_breaker import CircuitBreaker
+from config import settings
+from metrics import CACHE_LOOKUPS, UPSTREAM_LATENCY
+
+
+# Address of the client whose request is being served, forwarded upstream
+# so the services rate limit clients rather than the gateway itself
+client_address: ContextVar[Optional[str]] = ContextVar("client_address", default=None)
+
+
+TRUSTED_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in settings.forwarded_allow_networks.split(",") if network.strip()
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_NETWORKS)
+
+
+def client_ip(scope: Scope) -> str:
+    """The connecting address, or when that is a proxy in a trusted network
+    (an ingress), the last X-Forwarded-For entry that is not one"""
+    address = scope["client"][0]
+    if not TRUSTED_NETWORKS or not is_trusted_proxy(address):
+        return address
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            for forwarded in reversed(value.decode("latin-1").split(",")):
+                forwarded = forwarded.strip()
+                if forwarded and not is_trusted_proxy(forwarded):
+                    return forwarded
+            break
+    return address
+
+
+class ClientAddressMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope.get("client"):
+            client_address.set(client_ip(scope))
+        await self.app(scope, receive, send)
+
+
+class UpstreamError(Exception):
+    """An upstream could not answer: breaker open, timeout, connection error or
+    5xx, or a 4xx for a section the page can do without"""
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream}: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class Upstream:
+    """Pooled client for one backing service, guarded by its own circuit breaker"""
+
+    def __init__(self, name: str, base_url: str, timeout: float):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.breaker_threshold,
+            reset_timeout=settings.breaker_reset_seconds,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._latency = {
+            outcome: UPSTREAM_LATENCY.labels(name, outcome) for outcome in ("ok", "client_error", "error")
+        }
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(
+                    self.timeout,
+                    connect=min(settings.connect_timeout, self.timeout),
+                    pool=min(settings.connect_timeout, self.timeout),
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.upstream_max_connections,
+                    max_keepalive_connections=settings.upstream_max_connections,
+                ),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        """GET a path; 4xx responses are returned, everything else failing raises"""
+        if not self.breaker.allow():
+            raise UpstreamError(self.name, "circuit open")
+
+        address = client_address.get()
+        if address is not None:
+            kwargs["headers"] = {**kwargs.get("headers", {}), "X-Forwarded-For": address}
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.get(path, **kwargs)
+        except httpx.TimeoutException:
+            self._failed(start)
+            raise UpstreamError(self.name, "timeout")
+        except httpx.HTTPError:
+            self._failed(start)
+            raise UpstreamError(self.name, "unavailable")
+
+        if response.status_code >= 500:
+            self._failed(start)
+            raise UpstreamError(self.name, f"status {response.status_code}")
+
+        self.breaker.record_success()
+        outcome = "ok" if response.status_code < 400 else "client_error"
+        self._latency[outcome].observe(time.perf_counter() - start)
+        return response
+
+    def _failed(self, start: float) -> None:
+        self.breaker.record_failure()
+        self._latency["error"].observe(time.perf_counter() - start)
+
+
+class TTLCache:
+    """Small per-worker cache of upstream results, evicting the oldest entries first"""
+
+    def __init__(self, name: str, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._hits = CACHE_LOOKUPS.labels(name, "hit")
+        self._misses = CACHE_LOOKUPS.labels(name, "miss")
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._misses.inc()
+            return None
+        self._hits.inc()
+        return entry[1]
+
+    def set(self, key, value) -> None:
+        if self.ttl <= 0:
+            return
+        # Re-inserting moves the key to the end of the insertion order
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        while len(self._entries) > self.max_size:
+            del self._entries[next(iter(self._entries))]
+
+
+auth = Upstream("auth-service", settings.auth_service_url, settings.auth_timeout)
+questions = Upstream("question-service", settings.question_service_url, settings.question_timeout)
+blogs = Upstream("blog-service", settings.blog_service_url, settings.blog_timeout)
+
+UPSTREAMS = (auth, questions, blogs)
+
+
+async def close_all() -> None:
+    for upstream in UPSTREAMS:
+        await upstream.close()
@@ -0,0 +1,63 @@
+import time
+
+from metrics import CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRIPS
+
+
+class CircuitBreaker:
+    """Fail fast while an upstream keeps failing.
+
+    Closed: calls go through and consecutive failures are counted. Open: calls
+    are refused until reset_timeout has passed. Half-open: a single trial call
+    decides whether to close again or stay open. State lives in the worker
+    process and is only touched from its event loop, so no locking is needed.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self._state_gauge = CIRCUIT_BREAKER_STATE.labels(name)
+        self._trips = CIRCUIT_BREAKER_TRIPS.labels(name)
+        self._state_gauge.set(self.CLOSED)
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now"""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self._set_state(self.HALF_OPEN)
+            self._probe_started = now
+            return True
+        # Half-open: one probe at a time; a probe that never reported back
+        # (e.g. its request was cancelled) is replaced after reset_timeout
+        if now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self.failures >= self.failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+            self._trips.inc()
+
+    def _set_state(self, state: int) -> None:
+        self.state = state
+        self._state_gauge.set(state)
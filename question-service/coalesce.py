@@ -0,0 +1,157 @@
+"""Single-flight coalescing of identical anonymous reads.
+
+When a question or post goes viral, thousands of identical GETs arrive
+within a second, each running the same queries. Endpoints marked
+@coalesced share them instead: the first anonymous GET of a path and
+query string runs the endpoint, and identical GETs arriving while it
+runs wait for its response rather than running their own. With
+COALESCE_CACHE_MS set, a 200 response is also reused for that many
+milliseconds, absorbing the herd that arrives just after it. Database
+work then grows with the number of distinct URLs, not of requests.
+
+- requests with an Authorization or Cookie header always run on their
+  own, so nobody is sent a response built for someone else and a user
+  sees their own writes at once
+- a shared response is at most as old as the request that built it,
+  plus COALESCE_CACHE_MS when caching
+- if the request being waited for fails, one of its waiters runs in its
+  place; the others wait for that one
+- requests are shared within a worker, not across workers
+
+coalesced_requests counts requests by route and outcome: "leader" ran the
+endpoint, "waiter" and "cached" were sent a shared response. The
+coalescing ratio is (waiter + cached) / all; coalesce_waiters is the
+number of requests waiting right now.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.routing import Match, Router
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from metrics import COALESCE_WAITERS, COALESCED_REQUESTS
+
+# Headers that make a request one user's own
+PRIVATE_HEADERS = frozenset((b"authorization", b"cookie"))
+
+
+def coalesced(on_shared: Optional[Callable[[dict], None]] = None) -> Callable:
+    """Let identical anonymous GETs of an endpoint share one execution.
+    `on_shared(path_params)` is called for each request sent a shared 200
+    response, for work every request must do, like counting a view:
+
+        @app.get("/questions/{question_id}")
+        @coalesced(on_shared=lambda params: count_view(params["question_id"]))
+        def get_question(...):
+    """
+    def decorate(endpoint: Callable) -> Callable:
+        endpoint.coalesce = on_shared or (lambda path_params: None)
+        return endpoint
+    return decorate
+
+
+class _Response:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    async def send_to(self, send: Send) -> None:
+        # Outer middlewares add their headers to the list they are given
+        await send({"type": "http.response.start", "status": self.status, "headers": list(self.headers)})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class CoalescingMiddleware:
+    def __init__(self, app: ASGIApp, router: Router) -> None:
+        self.app = app
+        self.router = router
+        # Responses being built, by request key; None when the request failed
+        self.in_flight: Dict[bytes, asyncio.Future] = {}
+        # (expiry, response) by request key, oldest first
+        self.cache: Dict[bytes, Tuple[float, _Response]] = {}
+
+    def route(self, scope: Scope) -> Optional[Tuple[object, dict]]:
+        """The @coalesced route a request is for and its child scope, as the
+        router would match it"""
+        for route in self.router.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                if hasattr(getattr(route, "endpoint", None), "coalesce"):
+                    return route, child_scope
+                return None
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or any(
+            name in PRIVATE_HEADERS for name, _ in scope["headers"]
+        ):
+            await self.app(scope, receive, send)
+            return
+        matched = self.route(scope)
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+        route, child_scope = matched
+        # Metrics and query inspection label requests by their route
+        scope.update(child_scope)
+        key = scope["path"].encode() + b"?" + scope["query_string"]
+
+        while True:
+            cached = self.cache.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    await self.share(route, child_scope, "cached", cached[1], send)
+                    return
+                del self.cache[key]
+
+            flight = self.in_flight.get(key)
+            if flight is None:
+                await self.lead(route, key, scope, receive, send)
+                return
+            COALESCE_WAITERS.inc()
+            try:
+                # Shielded: a waiter that goes away must not cancel the others
+                response = await asyncio.shield(flight)
+            finally:
+                COALESCE_WAITERS.dec()
+            if response is not None:
+                await self.share(route, child_scope, "waiter", response, send)
+                return
+
+    async def share(self, route, child_scope: dict, outcome: str, response: _Response, send: Send) -> None:
+        COALESCED_REQUESTS.labels(route.path, outcome).inc()
+        if response.status == 200:
+            route.endpoint.coalesce(child_scope["path_params"])
+        await response.send_to(send)
+
+    async def lead(self, route, key: bytes, scope: Scope, receive: Receive, send: Send) -> None:
+        COALESCED_REQUESTS.labels(route.path, "leader").inc()
+        flight = self.in_flight[key] = asyncio.get_running_loop().create_future()
+        start: Optional[Message] = None
+        chunks = []
+        response = None
+
+        async def send_recorded(message: Message) -> None:
+            nonlocal start, response
+            if message["type"] == "http.response.start":
+                start = {"status": message["status"], "headers": list(message.get("headers", []))}
+            else:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response = _Response(start["status"], start["headers"], b"".join(chunks))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_recorded)
+        finally:
+            del self.in_flight[key]
+            flight.set_result(response)
+            if response is not None and response.status == 200 and settings.coalesce_cache_ms > 0:
+                self.cache[key] = (time.monotonic() + settings.coalesce_cache_ms / 1000, response)
+                if len(self.cache) > settings.coalesce_cache_size:
+                    del self.cache[next(iter(self.cache))]
@@ -5,6 +5,137 @@ from pydantic import Field
 class Settings(BaseSettings):
     database_url: str = Field(..., env="DATABASE_URL")
     auth_service_url: str = Field(default="http://localhost:8001", env="AUTH_SERVICE_URL")
+    auth_connect_timeout: float = Field(default=0.5, env="AUTH_CONNECT_TIMEOUT")
+    auth_read_timeout: float = Field(default=2.0, env="AUTH_READ_TIMEOUT")
+    auth_max_connections: int = Field(default=100, env="AUTH_MAX_CONNECTIONS")
+    auth_breaker_threshold: int = Field(default=5, env="AUTH_BREAKER_THRESHOLD")
+    auth_breaker_reset_seconds: float = Field(default=10.0, env="AUTH_BREAKER_RESET_SECONDS")
+    # 0 disables hedging: otherwise a second request is sent after this delay
+    auth_hedge_delay_ms: float = Field(default=0.0, env="AUTH_HEDGE_DELAY_MS")
+    # 0 disables grace mode: otherwise tokens verified this recently are
+    # accepted while auth-service is unavailable
+    auth_grace_seconds: float = Field(default=0.0, env="AUTH_GRACE_SECONDS")
+    auth_grace_cache_size: int = Field(default=10000, env="AUTH_GRACE_CACHE_SIZE")
+    compression_minimum_size: int = Field(default=1024, env="COMPRESSION_MINIMUM_SIZE")
+    profiling_enabled: bool = Field(default=False, env="PROFILING_ENABLED")
+    profiling_token: str = Field(default="", env="PROFILING_TOKEN")
+    profiling_sample_rate: float = Field(default=0.0, env="PROFILING_SAMPLE_RATE")
+    profiling_path_prefix: str = Field(default="/", env="PROFILING_PATH_PREFIX")
+    profiling_interval_ms: float = Field(default=1.0, env="PROFILING_INTERVAL_MS")
+    profiling_dir: str = Field(default="/tmp/profiles", env="PROFILING_DIR")
+    tracing_enabled: bool = Field(default=False, env="TRACING_ENABLED")
+    # Fraction of requests without a sampled traceparent that start a trace
+    tracing_sample_rate: float = Field(default=0.01, env="TRACING_SAMPLE_RATE")
+    # "file" writes OTLP/JSON lines to tracing_dir, "otlp" posts them to
+    # tracing_otlp_endpoint
+    tracing_exporter: str = Field(default="file", env="TRACING_EXPORTER")
+    tracing_dir: str = Field(default="/tmp/traces", env="TRACING_DIR")
+    tracing_otlp_endpoint: str = Field(default="http://localhost:4318/v1/traces", env="TRACING_OTLP_ENDPOINT")
+    # Finished spans waiting for export per worker; more are dropped
+    tracing_max_queue: int = Field(default=10000, env="TRACING_MAX_QUEUE")
+    tracing_batch_size: int = Field(default=512, env="TRACING_BATCH_SIZE")
+    tracing_flush_seconds: float = Field(default=2.0, env="TRACING_FLUSH_SECONDS")
+    # "log" logs query budget overruns, N+1 patterns and slow statements of
+    # a sample of requests; "raise" fails every offending request (tests)
+    query_inspection: str = Field(default="log", env="QUERY_INSPECTION")
+    query_inspection_sample_rate: float = Field(default=0.01, env="QUERY_INSPECTION_SAMPLE_RATE")
+    # A statement run this many times in one request is reported as N+1
+    query_repeat_threshold: int = Field(default=5, env="QUERY_REPEAT_THRESHOLD")
+    query_slow_ms: float = Field(default=100.0, env="QUERY_SLOW_MS")
+    host: str = Field(default="0.0.0.0", env="HOST")
+    port: int = Field(default=8002, env="PORT")
+    # 0 starts one worker per CPU available to the container
+    web_concurrency: int = Field(default=0, env="WEB_CONCURRENCY")
+    backlog: int = Field(default=2048, env="BACKLOG")
+    keepalive_timeout: int = Field(default=75, env="KEEPALIVE_TIMEOUT")
+    graceful_timeout: int = Field(default=25, env="GRACEFUL_TIMEOUT")
+    access_log: bool = Field(default=False, env="ACCESS_LOG")
+    # Comma-separated addresses of the proxies (gateway, ingress) trusted to
+    # set X-Forwarded-For; anyone else's header is ignored and the client is
+    # the connecting address. "*" would let any client pick its address.
+    forwarded_allow_ips: str = Field(default="127.0.0.1", env="FORWARDED_ALLOW_IPS")
+    # Comma-separated CIDRs of further trusted proxies, for those whose
+    # addresses change, like gateway pods: e.g. the cluster's pod network
+    forwarded_allow_networks: str = Field(default="", env="FORWARDED_ALLOW_NETWORKS")
+    # Per worker: a pod holds up to workers * (pool size + overflow) connections
+    db_pool_size: int = Field(default=5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=5, env="DB_MAX_OVERFLOW")
+    db_pool_recycle: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    # "local" fans events out within one process; "postgres" relays them
+    # between replicas with LISTEN/NOTIFY
+    events_broker: str = Field(default="local", env="EVENTS_BROKER")
+    events_max_subscribers: int = Field(default=10000, env="EVENTS_MAX_SUBSCRIBERS")
+    # Frames buffered per stream before a slow client is disconnected
+    events_queue_size: int = Field(default=32, env="EVENTS_QUEUE_SIZE")
+    events_keepalive_seconds: float = Field(default=15.0, env="EVENTS_KEEPALIVE_SECONDS")
+    events_max_stream_seconds: float = Field(default=600.0, env="EVENTS_MAX_STREAM_SECONDS")
+    events_retry_ms: int = Field(default=3000, env="EVENTS_RETRY_MS")
+    # Estimated Jaccard similarity of word shingles above which questions
+    # are reported as likely duplicates
+    dedup_threshold: float = Field(default=0.5, env="DEDUP_THRESHOLD")
+    dedup_max_results: int = Field(default=5, env="DEDUP_MAX_RESULTS")
+    dedup_max_candidates: int = Field(default=200, env="DEDUP_MAX_CANDIDATES")
+    related_top_k: int = Field(default=10, env="RELATED_TOP_K")
+    # Cosine similarity below which questions are not considered related
+    related_min_score: float = Field(default=0.1, env="RELATED_MIN_SCORE")
+    # Terms found in more than this fraction of questions are ignored
+    related_max_df: float = Field(default=0.5, env="RELATED_MAX_DF")
+    # Monthly votes partitions are created this many months ahead (Postgres)
+    votes_partition_months_ahead: int = Field(default=3, env="VOTES_PARTITION_MONTHS_AHEAD")
+    # Votes on questions with no new votes for this long are folded into totals
+    votes_rollup_after_days: int = Field(default=180, env="VOTES_ROLLUP_AFTER_DAYS")
+    # Responses to requests with an Idempotency-Key are replayed for this long
+    idempotency_ttl_seconds: int = Field(default=86400, env="IDEMPOTENCY_TTL_SECONDS")
+    # How long a duplicate waits for the original request before a 409
+    idempotency_wait_seconds: float = Field(default=10.0, env="IDEMPOTENCY_WAIT_SECONDS")
+    idempotency_cleanup_seconds: float = Field(default=300.0, env="IDEMPOTENCY_CLEANUP_SECONDS")
+    # Threads with more answers and votes than this are hidden at once and
+    # deleted in the background, in batches
+    question_purge_sync_limit: int = Field(default=1000, env="QUESTION_PURGE_SYNC_LIMIT")
+    question_purge_batch_size: int = Field(default=1000, env="QUESTION_PURGE_BATCH_SIZE")
+    # Background deletes without progress for this long are resumed
+    question_purge_interval_seconds: float = Field(default=300.0, env="QUESTION_PURGE_INTERVAL_SECONDS")
+    # Reputation points for a vote on one's question, an answer posted and an
+    # answer accepted; run `python reputation.py` after changing them
+    reputation_upvote: int = Field(default=10, env="REPUTATION_UPVOTE")
+    reputation_downvote: int = Field(default=-2, env="REPUTATION_DOWNVOTE")
+    reputation_answer: int = Field(default=2, env="REPUTATION_ANSWER")
+    reputation_accepted_answer: int = Field(default=15, env="REPUTATION_ACCEPTED_ANSWER")
+    # "zstd" or "zlib" stores bodies of at least body_compression_min_bytes
+    # compressed, see compressed_text.py; empty stores them plain
+    body_compression: str = Field(default="", env="BODY_COMPRESSION")
+    body_compression_min_bytes: int = Field(default=512, env="BODY_COMPRESSION_MIN_BYTES")
+    body_compression_level: int = Field(default=3, env="BODY_COMPRESSION_LEVEL")
+    body_compression_dictionary_bytes: int = Field(default=32768, env="BODY_COMPRESSION_DICTIONARY_BYTES")
+    rate_limit_enabled: bool = Field(default=True, env="RATE_LIMIT_ENABLED")
+    # "shared" keeps buckets in shared memory for the workers on a node,
+    # "redis" in one Redis for all replicas, "local" per worker
+    rate_limit_store: str = Field(default="shared", env="RATE_LIMIT_STORE")
+    rate_limit_redis_url: str = Field(default="redis://localhost:6379/0", env="RATE_LIMIT_REDIS_URL")
+    # Directory of the shared bucket table; empty uses /dev/shm
+    rate_limit_dir: str = Field(default="", env="RATE_LIMIT_DIR")
+    rate_limit_slots: int = Field(default=65536, env="RATE_LIMIT_SLOTS")
+    # Tokens per second and bucket size, for users with a verified token and
+    # for everyone else by client IP
+    rate_limit_user_rate: float = Field(default=10.0, env="RATE_LIMIT_USER_RATE")
+    rate_limit_user_burst: float = Field(default=100.0, env="RATE_LIMIT_USER_BURST")
+    rate_limit_ip_rate: float = Field(default=20.0, env="RATE_LIMIT_IP_RATE")
+    rate_limit_ip_burst: float = Field(default=200.0, env="RATE_LIMIT_IP_BURST")
+    # "METHOD /path=cost" pairs, comma-separated; a trailing * matches a
+    # path prefix and cost 0 exempts the route. Other routes cost 1.
+    rate_limit_costs: str = Field(
+        default="POST /questions=5,POST /answers=3,POST /votes=2,POST /questions/similar=3",
+        env="RATE_LIMIT_COSTS",
+    )
+    rate_limit_token_cache_size: int = Field(default=10000, env="RATE_LIMIT_TOKEN_CACHE_SIZE")
+    # Identical anonymous GETs of @coalesced endpoints share one execution,
+    # see coalesce.py; a 200 response is also reused for COALESCE_CACHE_MS
+    # when set, e.g. 250 to absorb thundering herds
+    coalesce_enabled: bool = Field(default=True, env="COALESCE_ENABLED")
+    coalesce_cache_ms: int = Field(default=0, env="COALESCE_CACHE_MS")
+    coalesce_cache_size: int = Field(default=1000, env="COALESCE_CACHE_SIZE")
+    # Views are counted in memory and written this often, see views.py
+    view_flush_seconds: float = Field(default=1.0, env="VIEW_FLUSH_SECONDS")
 
     class Config:
         env_file = ".env"
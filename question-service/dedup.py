@@ -0,0 +1,227 @@
+"""Near-duplicate questions: MinHash signatures and a locality-sensitive index.
+
+Each question's word shingles are reduced to a MinHash signature whose
+matching positions estimate Jaccard similarity. Signatures are split into
+bands and every band is stored as one bucket key, so candidates for a new
+question are the rows sharing any of its buckets: one indexed lookup
+instead of a comparison against every question.
+
+New and edited questions are indexed as they are written. Rows written
+outside the API (bulk loads, rows older than the index) are indexed by:
+
+    python dedup.py              # questions without a signature
+    python dedup.py --full       # rebuild everything
+"""
+import argparse
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import Question, QuestionBucket, QuestionSignature
+
+# Core inserts: the index rows are plain tuples, with no ORM bookkeeping needed
+SIGNATURE_INSERT = insert(QuestionSignature.__table__)
+BUCKET_INSERT = insert(QuestionBucket.__table__)
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 2
+# Long bodies add little beyond their opening; this bounds per-question work
+MAX_TEXT_BYTES = 16384
+# Shingles hashed per vectorized step: NUM_PERM * CHUNK uint64s of scratch
+CHUNK_SHINGLES = 16384
+
+# Multiply-shift hashing: the high 32 bits of a * x + b, wrapping at 2**64
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(0, 1 << 63, size=(NUM_PERM, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 1 << 63, size=(NUM_PERM, 1), dtype=np.uint64)
+_SHIFT32 = np.uint64(32)
+_BAND_SALT = np.arange(1, BANDS + 1, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+# Words are runs of ASCII letters and digits, hashed with a polynomial over
+# their bytes: prefix sums of byte * BASE**i give any word's hash from its
+# end points, with BASE**-i (BASE is odd, so invertible mod 2**64) removing
+# the word's offset. Tables cover the longest text hashed.
+_WORD_BYTE = np.zeros(256, dtype=bool)
+_WORD_BYTE[np.frombuffer(b"abcdefghijklmnopqrstuvwxyz0123456789", dtype=np.uint8)] = True
+_BASE = 1099511628211
+
+
+def _powers(base: int) -> np.ndarray:
+    """base ** i mod 2**64 for i in [0, MAX_TEXT_BYTES]"""
+    steps = np.full(MAX_TEXT_BYTES, base, dtype=np.uint64)
+    return np.concatenate(([np.uint64(1)], np.cumprod(steps, dtype=np.uint64)))
+
+
+_POWERS = _powers(_BASE)
+_INVERSE_POWERS = _powers(pow(_BASE, -1, 1 << 64))
+
+
+def shingles(title: str, content: str) -> np.ndarray:
+    """Distinct 32-bit hashes of a question's word shingles"""
+    data = np.frombuffer(f"{title} {content}".lower().encode()[:MAX_TEXT_BYTES], dtype=np.uint8)
+    edges = np.diff(np.concatenate(([False], _WORD_BYTE[data], [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    prefix = np.concatenate(([np.uint64(0)], np.cumsum(data * _POWERS[:len(data)], dtype=np.uint64)))
+    words = (prefix[ends] - prefix[starts]) * _INVERSE_POWERS[starts]
+
+    # Each shingle folds its words' hashes together, so no shingle strings are built
+    grams = words[:len(words) - SHINGLE_SIZE + 1] if len(words) >= SHINGLE_SIZE else words
+    for offset in range(1, min(SHINGLE_SIZE, len(words))):
+        grams = grams * _MIX + words[offset:offset + len(grams)]
+    return np.unique((grams * _MIX) >> _SHIFT32)
+
+
+def signatures(shingle_sets: Sequence[np.ndarray]) -> np.ndarray:
+    """MinHash signatures, one row per non-empty shingle set, hashed in bulk"""
+    rows = []
+    start = 0
+    while start < len(shingle_sets):
+        # Group sets until the chunk is full, always taking at least one
+        end, total = start, 0
+        while end < len(shingle_sets) and (end == start or total + len(shingle_sets[end]) <= CHUNK_SHINGLES):
+            total += len(shingle_sets[end])
+            end += 1
+        chunk = shingle_sets[start:end]
+        values = np.concatenate(chunk)
+        offsets = np.cumsum([0] + [len(s) for s in chunk[:-1]])
+        hashed = (_A * values + _B) >> _SHIFT32
+        rows.append(np.minimum.reduceat(hashed, offsets, axis=1).T.astype(np.uint32))
+        start = end
+    if not rows:
+        return np.empty((0, NUM_PERM), dtype=np.uint32)
+    return np.concatenate(rows)
+
+
+def signature(title: str, content: str) -> Optional[np.ndarray]:
+    """A question's signature, or None when its text has no words"""
+    values = shingles(title, content)
+    if not len(values):
+        return None
+    return signatures([values])[0]
+
+
+def band_keys(sigs: np.ndarray) -> np.ndarray:
+    """One signed 64-bit bucket key per band, shape (questions, BANDS)"""
+    bands = sigs.reshape(-1, BANDS, ROWS).astype(np.uint64)
+    keys = np.broadcast_to(_BAND_SALT, bands.shape[:2]).copy()
+    for row in range(ROWS):
+        keys = keys * _MIX + bands[:, :, row]
+    return keys.view(np.int64)
+
+
+def find_similar(
+    db: Session, sig: np.ndarray, limit: int, exclude_id: Optional[int] = None
+) -> List[Tuple[int, float]]:
+    """Indexed questions estimated at least dedup_threshold similar, best first"""
+    keys = band_keys(sig[np.newaxis])[0].tolist()
+    candidates = select(QuestionBucket.question_id).where(QuestionBucket.bucket.in_(keys))
+    if exclude_id is not None:
+        candidates = candidates.where(QuestionBucket.question_id != exclude_id)
+    # Questions sharing the most bands first, so a crowded bucket can't flood the scoring
+    candidates = (
+        candidates.group_by(QuestionBucket.question_id)
+        .order_by(func.count().desc())
+        .limit(settings.dedup_max_candidates)
+    )
+    rows = db.execute(
+        select(QuestionSignature.question_id, QuestionSignature.signature)
+        .where(QuestionSignature.question_id.in_(candidates.scalar_subquery()))
+    ).all()
+    if not rows:
+        return []
+
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.uint32).reshape(len(rows), NUM_PERM)
+    similarity = (matrix == sig).mean(axis=1)
+    keep = np.flatnonzero(similarity >= settings.dedup_threshold)
+    best = keep[np.argsort(-similarity[keep], kind="stable")][:limit]
+    return [(int(ids[i]), round(float(similarity[i]), 3)) for i in best]
+
+
+def index_question(db: Session, question_id: int, sig: Optional[np.ndarray]) -> None:
+    """Add a question's signature and buckets; committed with the caller's transaction"""
+    if sig is None:
+        return
+    db.execute(SIGNATURE_INSERT, [{"question_id": question_id, "signature": sig.tobytes()}])
+    db.execute(BUCKET_INSERT, [
+        {"bucket": key, "question_id": question_id}
+        for key in set(band_keys(sig[np.newaxis])[0].tolist())
+    ])
+
+
+def remove_question(db: Session, question_id: int) -> None:
+    db.execute(delete(QuestionBucket).where(QuestionBucket.question_id == question_id))
+    db.execute(delete(QuestionSignature).where(QuestionSignature.question_id == question_id))
+
+
+def _index_batch(db: Session, questions: Iterable[Tuple[int, str, str]]) -> int:
+    ids, shingle_sets = [], []
+    for question_id, title, content in questions:
+        values = shingles(title, content)
+        if len(values):
+            ids.append(question_id)
+            shingle_sets.append(values)
+    if not ids:
+        return 0
+
+    sigs = signatures(shingle_sets)
+    keys = band_keys(sigs)
+    db.execute(SIGNATURE_INSERT, [
+        {"question_id": question_id, "signature": sig.tobytes()} for question_id, sig in zip(ids, sigs)
+    ])
+    db.execute(BUCKET_INSERT, [
+        {"bucket": key, "question_id": question_id}
+        for question_id, row in zip(ids, keys.tolist())
+        for key in set(row)
+    ])
+    return len(ids)
+
+
+def build_index(full: bool = False, batch_size: int = 1000) -> int:
+    """Index questions in id order, one transaction per batch; returns the count indexed"""
+    indexed = 0
+    last_id = 0
+    with SessionLocal() as db:
+        if full:
+            db.execute(delete(QuestionBucket))
+            db.execute(delete(QuestionSignature))
+            db.commit()
+
+        while True:
+            batch = db.execute(
+                select(Question.id, Question.title, Question.content)
+                .outerjoin(QuestionSignature, QuestionSignature.question_id == Question.id)
+                .where(Question.id > last_id, QuestionSignature.question_id.is_(None), Question.deleted_at.is_(None))
+                .order_by(Question.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            indexed += _index_batch(db, batch)
+            db.commit()
+            last_id = batch[-1][0]
+    return indexed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the near-duplicate question index")
+    parser.add_argument("--full", action="store_true", help="drop the index and rebuild it")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    indexed = build_index(full=args.full, batch_size=args.batch_size)
+    print(f"indexed {indexed} questions in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
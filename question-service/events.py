@@ -0,0 +1,268 @@
+import asyncio
+import select
+import threading
+import time
+from typing import Callable, Dict, Optional, Set
+
+import orjson
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from config import settings
+from metrics import EVENT_SUBSCRIBERS, EVENT_SUBSCRIBERS_DROPPED, EVENTS_PUBLISHED
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_CHANNEL = "question_events"
+NOTIFY_MAX_PAYLOAD = 7900
+# Session.info key of the callbacks to run once its transaction commits
+AFTER_COMMIT = "events_after_commit"
+
+
+class TooManySubscribers(Exception):
+    """This process already serves its maximum number of event streams"""
+
+
+def encode_event(kind: str, data: dict) -> bytes:
+    """One server-sent event frame, encoded once and shared by every subscriber"""
+    return b"event: " + kind.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+def view_milestone(before: int, after: int) -> Optional[int]:
+    """The highest of 10, 20, 50, 100, 200, 500, ... views passed going from
+    `before` to `after` views, if any"""
+    if after < 10:
+        return None
+    magnitude = 10 ** (len(str(after)) - 1)
+    milestone = max(step for step in (1, 2, 5) if step * magnitude <= after) * magnitude
+    return milestone if milestone > before else None
+
+
+def after_commit(db: Session, callback: Callable[[], None]) -> None:
+    """Run `callback` once `db`'s transaction commits; never if it rolls back"""
+    db.info.setdefault(AFTER_COMMIT, []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for callback in session.info.pop(AFTER_COMMIT, ()):
+        callback()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_after_commit(session: Session, transaction) -> None:
+    # Rolled back, or closed uncommitted; a committed one ran them already
+    if transaction.parent is None:
+        session.info.pop(AFTER_COMMIT, None)
+
+
+class Subscription:
+    """One stream's bounded queue of encoded frames; None ends the stream"""
+
+    __slots__ = ("topic", "queue")
+
+    def __init__(self, topic: int, queue_size: int):
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+
+
+class LocalBroker:
+    """Fans events out to this process's subscribers.
+
+    Frames are encoded once per publish and handed to each subscriber's queue
+    without blocking; a subscriber whose queue is full is disconnected rather
+    than slowing the others, and its client reconnects and reloads the page.
+    On its own this is the single-replica stand-in for a cross-replica broker.
+    """
+
+    def __init__(self, max_subscribers: int, queue_size: int):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._topics: Dict[int, Set[Subscription]] = {}
+        self._count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def stop(self) -> None:
+        """End every open stream"""
+        for subscribers in list(self._topics.values()):
+            for subscription in list(subscribers):
+                self._close(subscription)
+        self._loop = None
+
+    def subscribe(self, topic: int) -> Subscription:
+        """Must be called on the event loop"""
+        if self._count >= self.max_subscribers:
+            raise TooManySubscribers()
+        subscription = Subscription(topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        self._count += 1
+        EVENT_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._topics[subscription.topic]
+        self._count -= 1
+        EVENT_SUBSCRIBERS.dec()
+
+    def publish(self, db: Session, topic: int, kind: str, data: dict) -> None:
+        """Send an event when the write it reports, in `db`'s transaction,
+        commits. Safe to call from the threadpool that runs sync endpoints."""
+        frame = encode_event(kind, data)
+
+        def send() -> None:
+            EVENTS_PUBLISHED.labels(kind).inc()
+            self._dispatch(topic, frame)
+
+        after_commit(db, send)
+
+    def _dispatch(self, topic: int, frame: bytes) -> None:
+        loop = self._loop
+        if loop is None or topic not in self._topics:
+            return
+        try:
+            loop.call_soon_threadsafe(self.deliver, topic, frame)
+        except RuntimeError:
+            # The loop closed during shutdown
+            pass
+
+    def deliver(self, topic: int, frame: bytes) -> None:
+        for subscription in list(self._topics.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                EVENT_SUBSCRIBERS_DROPPED.inc()
+                self._close(subscription)
+
+    def _close(self, subscription: Subscription) -> None:
+        self.unsubscribe(subscription)
+        queue = subscription.queue
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+class PostgresBroker(LocalBroker):
+    """Relays events between replicas through Postgres LISTEN/NOTIFY.
+
+    Publishing sends one NOTIFY in the transaction of the write it reports,
+    so Postgres delivers it when that commits and drops it if it rolls back;
+    a listener thread in every process, this one included, receives it and
+    fans it out locally. Events too large for a
+    NOTIFY payload are sent as a reference that tells clients to reload.
+    """
+
+    def __init__(self, max_subscribers: int, queue_size: int):
+        super().__init__(max_subscribers, queue_size)
+        url = make_url(settings.database_url).set(drivername="postgresql")
+        self.dsn = url.render_as_string(hide_password=False)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        super().start(loop)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        super().stop()
+
+    def publish(self, db: Session, topic: int, kind: str, data: dict) -> None:
+        """Blocks on the database; call it from sync endpoints only, before commit"""
+        payload = orjson.dumps({"topic": topic, "kind": kind, "data": data})
+        if len(payload) > NOTIFY_MAX_PAYLOAD:
+            payload = orjson.dumps({"topic": topic, "kind": kind, "data": {"id": data.get("id"), "truncated": True}})
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFY_CHANNEL, "payload": payload.decode()},
+        )
+        after_commit(db, EVENTS_PUBLISHED.labels(kind).inc)
+
+    def _listen(self) -> None:
+        import psycopg2
+
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while not self._stopping.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        message = orjson.loads(connection.notifies.pop(0).payload)
+                        self._dispatch(message["topic"], encode_event(message["kind"], message["data"]))
+            except psycopg2.Error:
+                # Events published while reconnecting are lost; clients
+                # still see them on their next page load
+                time.sleep(1.0)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+async def _stream(subscription: Subscription):
+    deadline = time.monotonic() + settings.events_max_stream_seconds
+    yield f"retry: {settings.events_retry_ms}\n\n".encode()
+    while True:
+        timeout = min(settings.events_keepalive_seconds, deadline - time.monotonic())
+        if timeout <= 0:
+            # Bounded stream lifetime spreads reconnects across replicas after a rollout
+            break
+        try:
+            frame = await asyncio.wait_for(subscription.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            yield b": keep-alive\n\n"
+            continue
+        if frame is None:
+            break
+        yield frame
+
+
+class EventStreamResponse(StreamingResponse):
+    """Streams a subscription and unsubscribes when the response ends, also
+    when the client left before its body was started"""
+
+    def __init__(self, subscription: Subscription):
+        super().__init__(
+            _stream(subscription),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            broker.unsubscribe(self.subscription)
+
+
+def event_stream(topic: int) -> EventStreamResponse:
+    """Subscribe to a topic and stream its events; raises TooManySubscribers.
+    Subscribing before the response starts lets a full worker answer 503."""
+    return EventStreamResponse(broker.subscribe(topic))
+
+
+def create_broker() -> LocalBroker:
+    if settings.events_broker == "postgres":
+        return PostgresBroker(settings.events_max_subscribers, settings.events_queue_size)
+    return LocalBroker(settings.events_max_subscribers, settings.events_queue_size)
+
+
+broker = create_broker()
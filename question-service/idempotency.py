@@ -0,0 +1,265 @@
+"""Idempotency-Key support for POST endpoints.
+
+A client that retries a write sends the same Idempotency-Key header. The
+first request claims the key for its user in the idempotency_keys table;
+its response (status and body) is stored when it completes and replayed
+for every retry within the TTL, without running the endpoint again. A
+duplicate that arrives while the first is still running waits for it.
+Reusing a key for a different request is rejected with 422.
+
+Endpoints opt in by depending on `idempotent`; `IdempotencyMiddleware`
+stores the response of each request that claimed a key.
+"""
+import asyncio
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from auth_middleware import get_current_user
+from config import settings
+from database import SessionLocal
+from metrics import IDEMPOTENCY_REPLAYS, IDEMPOTENCY_WAITS
+from models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# A claim this old without a response belongs to a request that died
+IN_FLIGHT_TIMEOUT = timedelta(seconds=60)
+CLEANUP_BATCH_SIZE = 1000
+
+KEYS_TABLE = IdempotencyKey.__table__
+KEY_INSERT = insert(KEYS_TABLE)
+
+# Requests in this process holding a key, so local duplicates wake as soon
+# as it is released instead of at their next poll
+_in_flight: Dict[Tuple[int, str], asyncio.Event] = {}
+
+
+class StoredResponse(Exception):
+    """Raised by `idempotent` to answer a retry with the stored response"""
+
+    def __init__(self, status_code: int, body: bytes, content_type: str):
+        self.status_code = status_code
+        self.body = body
+        self.content_type = content_type
+
+
+async def replay_handler(request: Request, exc: StoredResponse) -> Response:
+    return Response(
+        content=exc.body,
+        status_code=exc.status_code,
+        media_type=exc.content_type,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.url.path}?{request.url.query}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _claim(user_id: int, key: str, fingerprint: str) -> Optional[tuple]:
+    """Claim the key; returns None if claimed, else the existing entry"""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        while True:
+            # Expired entries and abandoned claims are replaced
+            db.execute(delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                or_(
+                    IdempotencyKey.created_at < now - timedelta(seconds=settings.idempotency_ttl_seconds),
+                    and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.created_at < now - IN_FLIGHT_TIMEOUT),
+                ),
+            ))
+            try:
+                db.execute(KEY_INSERT, [{
+                    "user_id": user_id, "key": key, "fingerprint": fingerprint, "created_at": now,
+                }])
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+            entry = db.execute(
+                select(
+                    IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+                    IdempotencyKey.body, IdempotencyKey.content_type,
+                ).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            ).first()
+            if entry is not None:
+                return entry
+            # Released between the insert and the read: try again
+
+
+def _store(user_id: int, key: str, status_code: int, body: bytes, content_type: str) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(status_code=status_code, body=body, content_type=content_type)
+        )
+        db.commit()
+
+
+def _release(user_id: int, key: str) -> None:
+    with SessionLocal() as db:
+        db.execute(delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status_code.is_(None),
+        ))
+        db.commit()
+
+
+async def idempotent(request: Request, current_user: dict = Depends(get_current_user)) -> Optional[str]:
+    """Claim the request's Idempotency-Key, or replay the response stored for it"""
+    key = request.headers.get(HEADER)
+    if key is None:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"
+        )
+
+    user_id = current_user["id"]
+    fingerprint = _fingerprint(request, await request.body())
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    delay = 0.05
+    waited = False
+    while True:
+        entry = await run_in_threadpool(_claim, user_id, key, fingerprint)
+        if entry is None:
+            _in_flight[(user_id, key)] = asyncio.Event()
+            request.scope.setdefault("state", {})["idempotency"] = (user_id, key)
+            return key
+        if entry.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"{HEADER} was already used for a different request"
+            )
+        if entry.status_code is not None:
+            IDEMPOTENCY_REPLAYS.inc()
+            raise StoredResponse(entry.status_code, entry.body, entry.content_type)
+
+        # The first request is still running
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        if not waited:
+            IDEMPOTENCY_WAITS.inc()
+            waited = True
+        local = _in_flight.get((user_id, key))
+        try:
+            await asyncio.wait_for(local.wait() if local else asyncio.sleep(delay), min(delay, remaining))
+        except asyncio.TimeoutError:
+            pass
+        delay = min(delay * 2, 0.5)
+
+
+class IdempotencyMiddleware:
+    """Stores the response of each request that claimed an Idempotency-Key.
+
+    The response is held until it is stored, so a retry never finds the
+    claim still in flight after the client has its answer. Server errors
+    and exceptions release the claim instead, and a retry runs again.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        if HEADER.lower().encode() not in dict(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        chunks = []
+
+        async def send_recorded(message: Message) -> None:
+            nonlocal start
+            claim = scope.get("state", {}).get("idempotency")
+            if claim is None:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            await _finish(claim, start["status"], b"".join(chunks), start.get("headers", []))
+            await send(start)
+            await send({"type": "http.response.body", "body": b"".join(chunks)})
+
+        try:
+            await self.app(scope, receive, send_recorded)
+        except BaseException:
+            claim = scope.get("state", {}).get("idempotency")
+            if claim is not None and claim in _in_flight:
+                await _finish(claim, 500, b"", [])
+            raise
+
+
+async def _finish(claim: Tuple[int, str], status_code: int, body: bytes, headers: list) -> None:
+    user_id, key = claim
+    try:
+        if status_code >= 500:
+            await run_in_threadpool(_release, user_id, key)
+        else:
+            content_type = dict(headers).get(b"content-type", b"application/json").decode("latin-1")
+            await run_in_threadpool(_store, user_id, key, status_code, body, content_type)
+    finally:
+        event = _in_flight.pop(claim, None)
+        if event is not None:
+            event.set()
+
+
+def delete_expired(batch_size: int = CLEANUP_BATCH_SIZE) -> int:
+    """Delete expired entries in batches, each its own short transaction"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.idempotency_ttl_seconds)
+    deleted = 0
+    with SessionLocal() as db:
+        while True:
+            expired = (
+                select(IdempotencyKey.user_id, IdempotencyKey.key)
+                .where(IdempotencyKey.created_at < cutoff)
+                .limit(batch_size)
+            )
+            count = db.execute(
+                delete(KEYS_TABLE).where(tuple_(KEYS_TABLE.c.user_id, KEYS_TABLE.c.key).in_(expired))
+            ).rowcount
+            db.commit()
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+
+async def cleanup_loop() -> None:
+    """Run delete_expired periodically; jittered so workers don't line up"""
+    interval = settings.idempotency_cleanup_seconds
+    while True:
+        await asyncio.sleep(interval * random.uniform(0.5, 1.5))
+        try:
+            await run_in_threadpool(delete_expired)
+        except Exception:
+            # The next pass catches up
+            pass
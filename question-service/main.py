@@ -1,19 +1,90 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy.orm import Session, defer
+from sqlalchemy import func, select
+from datetime import datetime
+from typing import List, Literal
+import asyncio
 
-from database import get_db, init_db
-from models import Question, Answer, Vote, VoteType
+from database import engine, get_db, warm_pool, check_database, SessionLocal
+from models import Question, Answer, Vote, VoteType, VoteRollup, EXCERPT_LENGTH
 from schemas import (
-    QuestionCreate, QuestionResponse, QuestionUpdate,
+    QuestionCreate, QuestionResponse, QuestionUpdate, QuestionSummaryResponse,
+    QuestionCreatedResponse, SimilarQuestionsRequest, SimilarQuestionResponse,
     AnswerCreate, AnswerResponse, AnswerUpdate,
-    VoteCreate, VoteResponse, VoteStats
+    VoteCreate, VoteResponse, VoteStats, ReputationResponse, LeaderboardEntry
 )
-from auth_middleware import get_current_user
+from auth_middleware import get_current_user, close_client
+from config import settings
+from fast_response import ORJSONResponse, CompressionMiddleware
+from metrics import MetricsMiddleware, instrument_engine, metrics_response, mark_process_dead
+import dedup
+import events
+import coalesce
+from coalesce import coalesced
+import idempotency
+import profiling
+import query_inspector
+from query_inspector import query_budget
+import tracing
+import views
+import purge
+import rate_limit
+import related
+import reputation
+import rollup
 
-app = FastAPI(title="Question Service", version="1.0.0")
+app = FastAPI(title="Question Service", version="1.0.0", default_response_class=ORJSONResponse)
+
+# List views select plain columns: no ORM hydration and no content column,
+# with both counts computed in the same statement. Rows stored before
+# excerpts were fall back to a database-side substring.
+ANSWER_COUNT = (
+    select(func.count(Answer.id))
+    .where(Answer.question_id == Question.id)
+    .correlate(Question)
+    .scalar_subquery()
+)
+# Votes folded by rollup.py are counted from their question's rollup row
+VOTE_COUNT = (
+    select(func.count(Vote.id))
+    .where(Vote.question_id == Question.id)
+    .correlate(Question)
+    .scalar_subquery()
+) + func.coalesce(
+    select(VoteRollup.upvotes + VoteRollup.downvotes)
+    .where(VoteRollup.question_id == Question.id)
+    .correlate(Question)
+    .scalar_subquery(),
+    0
+)
+# Questions being purged by purge.py are gone as far as clients can tell
+LIVE_QUESTION = Question.deleted_at.is_(None)
+# For endpoints that load a question without returning its body, which
+# would otherwise be read and decompressed for nothing
+WITHOUT_BODY = defer(Question.content)
+QUESTION_SUMMARY_SELECT = select(
+    Question.id, Question.title,
+    func.coalesce(Question.excerpt, func.substr(Question.content, 1, EXCERPT_LENGTH)).label("excerpt"),
+    Question.user_id,
+    Question.views, Question.created_at, Question.updated_at,
+    ANSWER_COUNT.label("answer_count"), VOTE_COUNT.label("vote_count")
+).where(LIVE_QUESTION)
+ANSWER_SELECT = select(
+    Answer.id, Answer.content, Answer.question_id, Answer.user_id,
+    Answer.is_accepted, Answer.created_at, Answer.updated_at
+)
+
+# Identical anonymous reads share one execution; see coalesce.py. Added
+# first so rate limits, metrics and tracing still see every request
+if settings.coalesce_enabled:
+    app.add_middleware(coalesce.CoalescingMiddleware, router=app.router)
+
+# Token-bucket rate limits. Added before CORS so it runs inside it and a 429
+# still carries the CORS headers the browser needs to read it
+if settings.rate_limit_enabled:
+    app.add_middleware(rate_limit.RateLimitMiddleware, name="question-service")
 
 # CORS middleware
 app.add_middleware(
@@ -24,6 +95,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Store and replay the responses of POSTs sent with an Idempotency-Key
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_exception_handler(idempotency.StoredResponse, idempotency.replay_handler)
+
+# Compress responses above the configured size
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
+
+# Request, status and DB metrics exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
+# Query budgets, N+1 and slow query reports; see query_inspector.py
+if settings.query_inspection != "off":
+    app.add_middleware(query_inspector.QueryInspectionMiddleware)
+    query_inspector.instrument_engine(engine)
+
+# Opt-in distributed tracing; nothing is mounted unless enabled
+if settings.tracing_enabled:
+    app.add_middleware(tracing.TracingMiddleware, service="question-service")
+    tracing.instrument_engine(engine)
+
+# Opt-in request profiling; nothing is mounted unless enabled
+if settings.profiling_enabled:
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling.router)
+
 
 @app.get("/")
 def read_root():
@@ -35,14 +132,87 @@ def read_root():
     }
 
 
+@app.get("/ready", include_in_schema=False)
+def ready():
+    """Readiness probe: the database is reachable through the pool"""
+    if not check_database():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database unavailable"
+        )
+    return {"status": "ready"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics endpoint"""
+    return metrics_response()
+
+
+def publish_view_milestone(db: Session, question_id: int, before: int, after: int) -> None:
+    milestone = events.view_milestone(before, after)
+    if milestone is not None:
+        events.broker.publish(db, question_id, "views", {"views": milestone})
+
+
+question_views = views.ViewCounter(Question, on_flushed=publish_view_milestone)
+
+# Periodic deletion of expired idempotency keys, background purges of
+# deleted questions and writes of counted views, one of each per worker
+cleanup_task = None
+purge_task = None
+view_task = None
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """End event streams, write counted views, close the auth-service
+    connections, export queued trace spans and release this worker's live
+    metrics"""
+    events.broker.stop()
+    if cleanup_task is not None:
+        cleanup_task.cancel()
+    if purge_task is not None:
+        purge_task.cancel()
+    if view_task is not None:
+        view_task.cancel()
+    try:
+        await run_in_threadpool(question_views.flush)
+    except Exception:
+        # Lost, as when a worker dies
+        pass
+    await close_client()
+    tracing.shutdown()
+    mark_process_dead()
+
+
 @app.on_event("startup")
-def on_startup():
-    """Initialize DB tables on startup for development"""
-    # import models to make sure Base.metadata has table definitions
-    init_db()
+async def on_startup():
+    """Connect the pool before this worker accepts requests"""
+    global cleanup_task, purge_task, view_task
+    events.broker.start(asyncio.get_running_loop())
+    cleanup_task = asyncio.create_task(idempotency.cleanup_loop())
+    purge_task = asyncio.create_task(purge.purge_loop())
+    view_task = asyncio.create_task(question_views.flush_loop())
+    warm_pool()
+
 
+def similar_questions(db: Session, matches) -> list:
+    """Summaries for (id, similarity) matches, most similar first"""
+    if not matches:
+        return []
+    similarity = dict(matches)
+    rows = db.execute(QUESTION_SUMMARY_SELECT.where(Question.id.in_(similarity))).mappings().all()
+    results = [{**row, "similarity": similarity[row["id"]]} for row in rows]
+    results.sort(key=lambda row: row["similarity"], reverse=True)
+    return results
 
-@app.post("/questions", response_model=QuestionResponse, status_code=status.HTTP_201_CREATED)
+
+@app.post(
+    "/questions", response_model=QuestionCreatedResponse, status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(idempotency.idempotent)]
+)
+@query_budget(11)
 def create_question(
     question_data: QuestionCreate,
     current_user: dict = Depends(get_current_user),
@@ -56,43 +226,67 @@ def create_question(
     )
     
     db.add(new_question)
+    db.flush()
+    # Matched before indexing, so the question doesn't find itself
+    signature = dedup.signature(question_data.title, question_data.content)
+    matches = dedup.find_similar(db, signature, settings.dedup_max_results) if signature is not None else []
+    dedup.index_question(db, new_question.id, signature)
+    related.index_question(db, new_question.id, question_data.title, question_data.content)
     db.commit()
     db.refresh(new_question)
     
     return {
         **new_question.__dict__,
         "answer_count": 0,
-        "vote_count": 0
+        "vote_count": 0,
+        "similar_questions": similar_questions(db, matches)
     }
 
 
-@app.get("/questions", response_model=List[QuestionResponse])
+@app.post("/questions/similar", response_model=List[SimilarQuestionResponse])
+@query_budget(2)
+def find_similar_questions(query: SimilarQuestionsRequest, db: Session = Depends(get_db)):
+    """Likely duplicates of a question being written, checked before posting it"""
+    signature = dedup.signature(query.title, query.content)
+    if signature is None:
+        return []
+    return similar_questions(db, dedup.find_similar(db, signature, settings.dedup_max_results))
+
+
+@app.get("/questions", response_model=List[QuestionSummaryResponse])
+@query_budget(1)
+@coalesced()
 def get_questions(
     skip: int = 0,
     limit: int = 20,
     db: Session = Depends(get_db)
 ):
     """Get all questions with pagination"""
-    questions = db.query(Question).offset(skip).limit(limit).all()
-    
-    result = []
-    for question in questions:
-        answer_count = db.query(Answer).filter(Answer.question_id == question.id).count()
-        vote_count = db.query(Vote).filter(Vote.question_id == question.id).count()
-        
-        result.append({
-            **question.__dict__,
-            "answer_count": answer_count,
-            "vote_count": vote_count
-        })
-    
-    return result
+    rows = db.execute(QUESTION_SUMMARY_SELECT.offset(skip).limit(limit)).mappings().all()
+    return rows
+
+
+@app.get("/questions/user/{user_id}", response_model=List[QuestionSummaryResponse])
+@query_budget(1)
+def get_questions_by_user(
+    user_id: int,
+    skip: int = 0,
+    limit: int = 20,
+    db: Session = Depends(get_db)
+):
+    """Get all questions asked by a specific user"""
+    rows = db.execute(QUESTION_SUMMARY_SELECT.where(
+        Question.user_id == user_id
+    ).offset(skip).limit(limit)).mappings().all()
+    return rows
 
 
 @app.get("/questions/{question_id}", response_model=QuestionResponse)
+@query_budget(4)
+@coalesced(on_shared=lambda params: question_views.add(int(params["question_id"])))
 def get_question(question_id: int, db: Session = Depends(get_db)):
     """Get a specific question by ID"""
-    question = db.query(Question).filter(Question.id == question_id).first()
+    question = db.query(Question).filter(Question.id == question_id, LIVE_QUESTION).first()
     
     if not question:
         raise HTTPException(
@@ -100,21 +294,42 @@ def get_question(question_id: int, db: Session = Depends(get_db)):
             detail="Question not found"
         )
     
-    # Increment view count
-    question.views += 1
-    db.commit()
+    # Count the view; written with the others by view_task
+    view_count = question.views + question_views.add(question.id)
     
     answer_count = db.query(Answer).filter(Answer.question_id == question.id).count()
-    vote_count = db.query(Vote).filter(Vote.question_id == question.id).count()
+    vote_count = sum(rollup.vote_totals(db, question.id))
     
     return {
         **question.__dict__,
+        "views": view_count,
         "answer_count": answer_count,
         "vote_count": vote_count
     }
 
 
+@app.get("/questions/{question_id}/related", response_model=List[SimilarQuestionResponse])
+@query_budget(2)
+def get_related_questions(
+    question_id: int,
+    limit: int = Query(5, ge=1, le=settings.related_top_k),
+    db: Session = Depends(get_db)
+):
+    """Precomputed related questions, most similar first; empty until related.py has run"""
+    matches = related.neighbours(db, question_id, limit)
+    if matches is None:
+        exists = db.execute(select(Question.id).where(Question.id == question_id, LIVE_QUESTION)).first()
+        if exists is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Question not found"
+            )
+        matches = []
+    return similar_questions(db, matches)
+
+
 @app.put("/questions/{question_id}", response_model=QuestionResponse)
+@query_budget(12)
 def update_question(
     question_id: int,
     question_data: QuestionUpdate,
@@ -122,7 +337,7 @@ def update_question(
     db: Session = Depends(get_db)
 ):
     """Update a question (only by the author)"""
-    question = db.query(Question).filter(Question.id == question_id).first()
+    question = db.query(Question).filter(Question.id == question_id, LIVE_QUESTION).first()
     
     if not question:
         raise HTTPException(
@@ -140,12 +355,16 @@ def update_question(
         question.title = question_data.title
     if question_data.content is not None:
         question.content = question_data.content
+    if question_data.title is not None or question_data.content is not None:
+        dedup.remove_question(db, question.id)
+        dedup.index_question(db, question.id, dedup.signature(question.title, question.content))
+        related.index_question(db, question.id, question.title, question.content)
     
     db.commit()
     db.refresh(question)
     
     answer_count = db.query(Answer).filter(Answer.question_id == question.id).count()
-    vote_count = db.query(Vote).filter(Vote.question_id == question.id).count()
+    vote_count = sum(rollup.vote_totals(db, question.id))
     
     return {
         **question.__dict__,
@@ -155,13 +374,14 @@ def update_question(
 
 
 @app.delete("/questions/{question_id}", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(15)
 def delete_question(
     question_id: int,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete a question (only by the author)"""
-    question = db.query(Question).filter(Question.id == question_id).first()
+    """Delete a question (only by the author); large threads are purged after responding"""
+    question = db.query(Question).options(WITHOUT_BODY).filter(Question.id == question_id, LIVE_QUESTION).first()
     
     if not question:
         raise HTTPException(
@@ -175,20 +395,62 @@ def delete_question(
             detail="Not authorized to delete this question"
         )
     
-    db.delete(question)
+    deleted = purge.delete_question(db, question.id)
     db.commit()
+    if not deleted:
+        purge.schedule(question_id)
     
     return None
 
 
-@app.post("/answers", response_model=AnswerResponse, status_code=status.HTTP_201_CREATED)
+def question_exists(question_id: int) -> bool:
+    with SessionLocal() as db:
+        return db.execute(select(Question.id).where(Question.id == question_id, LIVE_QUESTION)).first() is not None
+
+
+def publish_vote_delta(db: Session, question_id: int, added: VoteType = None, removed: VoteType = None) -> None:
+    """Send the change in vote counts once `db` commits; subscribers apply it
+    to the stats they hold"""
+    delta = {"upvotes": 0, "downvotes": 0}
+    if added is not None:
+        delta["upvotes" if added == VoteType.UPVOTE else "downvotes"] += 1
+    if removed is not None:
+        delta["upvotes" if removed == VoteType.UPVOTE else "downvotes"] -= 1
+    delta["total"] = delta["upvotes"] - delta["downvotes"]
+    events.broker.publish(db, question_id, "votes", delta)
+
+
+@app.get("/questions/{question_id}/events", include_in_schema=False)
+async def question_events(question_id: int):
+    """Live answers, vote changes and view milestones for a question, as server-sent events"""
+    exists = await run_in_threadpool(question_exists, question_id)
+    if not exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Question not found"
+        )
+    try:
+        return events.event_stream(question_id)
+    except events.TooManySubscribers:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many event subscribers",
+            headers={"Retry-After": "30"}
+        )
+
+
+@app.post(
+    "/answers", response_model=AnswerResponse, status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(idempotency.idempotent)]
+)
+@query_budget(8)
 def create_answer(
     answer_data: AnswerCreate,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Verify question exists
-    question = db.query(Question).filter(Question.id == answer_data.question_id).first()
+    question = db.query(Question).options(WITHOUT_BODY).filter(Question.id == answer_data.question_id, LIVE_QUESTION).first()
     if not question:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -202,19 +464,87 @@ def create_answer(
     )
     
     db.add(new_answer)
+    db.flush()
+    reputation.record(db, new_answer.user_id, new_answer.created_at, answers=1)
+    answer = AnswerResponse.model_validate(new_answer)
+    events.broker.publish(db, answer.question_id, "answer", answer.model_dump(mode="json"))
     db.commit()
-    db.refresh(new_answer)
     
-    return new_answer
+    return answer
 
 
 @app.get("/answers/question/{question_id}", response_model=List[AnswerResponse])
+@query_budget(1)
+@coalesced()
 def get_answers_by_question(question_id: int, db: Session = Depends(get_db)):
     """Get all answers for a specific question"""
-    answers = db.query(Answer).filter(Answer.question_id == question_id).all()
-    return answers
+    rows = db.execute(
+        ANSWER_SELECT.join(Question, Question.id == Answer.question_id)
+        .where(Answer.question_id == question_id, LIVE_QUESTION)
+    ).mappings().all()
+    return rows
 
-@app.post("/votes", response_model=VoteResponse, status_code=status.HTTP_201_CREATED)
+
+@app.put("/answers/{answer_id}", response_model=AnswerResponse)
+@query_budget(8)
+def update_answer(
+    answer_id: int,
+    answer_data: AnswerUpdate,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Edit an answer (only by its author), or accept or unaccept it (only by the question's author)"""
+    answer = db.query(Answer).filter(Answer.id == answer_id).first()
+    question = answer and db.query(Question).options(WITHOUT_BODY).filter(
+        Question.id == answer.question_id, LIVE_QUESTION
+    ).first()
+    
+    if not question:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Answer not found"
+        )
+    
+    if answer_data.content is not None:
+        if answer.user_id != current_user["id"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to update this answer"
+            )
+        answer.content = answer_data.content
+    
+    if answer_data.is_accepted is not None and answer_data.is_accepted != bool(answer.is_accepted):
+        if question.user_id != current_user["id"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only the question's author can accept an answer"
+            )
+        if answer_data.is_accepted:
+            # A question has one accepted answer: accepting another one unaccepts it
+            previous = db.query(Answer).options(defer(Answer.content)).filter(
+                Answer.question_id == question.id, Answer.is_accepted == 1
+            ).all()
+            changes = [(accepted.user_id, accepted.accepted_at, {"accepted_answers": -1}) for accepted in previous]
+            for accepted in previous:
+                accepted.is_accepted, accepted.accepted_at = 0, None
+            answer.is_accepted, answer.accepted_at = 1, datetime.utcnow()
+            changes.append((answer.user_id, answer.accepted_at, {"accepted_answers": 1}))
+        else:
+            changes = [(answer.user_id, answer.accepted_at, {"accepted_answers": -1})]
+            answer.is_accepted, answer.accepted_at = 0, None
+        reputation.record_many(db, changes)
+    
+    db.commit()
+    db.refresh(answer)
+    
+    return answer
+
+
+@app.post(
+    "/votes", response_model=VoteResponse, status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(idempotency.idempotent)]
+)
+@query_budget(10)
 def create_vote(
     vote_data: VoteCreate,
     current_user: dict = Depends(get_current_user),
@@ -222,7 +552,7 @@ def create_vote(
 ):
     
     # Verify question exists
-    question = db.query(Question).filter(Question.id == vote_data.question_id).first()
+    question = db.query(Question).options(WITHOUT_BODY).filter(Question.id == vote_data.question_id, LIVE_QUESTION).first()
     if not question:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -234,10 +564,19 @@ def create_vote(
         Vote.question_id == vote_data.question_id,
         Vote.user_id == current_user["id"]
     ).first()
+    if existing_vote is None:
+        # Votes on inactive questions may have been folded by rollup.py
+        existing_vote = rollup.thaw_vote(db, vote_data.question_id, current_user["id"])
     
     if existing_vote:
         # Update existing vote
+        previous_type = existing_vote.vote_type
         existing_vote.vote_type = VoteType(vote_data.vote_type.value)
+        if existing_vote.vote_type != previous_type:
+            reputation.record(db, question.user_id, existing_vote.created_at, **{
+                reputation.vote_count(previous_type): -1, reputation.vote_count(existing_vote.vote_type): 1,
+            })
+            publish_vote_delta(db, existing_vote.question_id, added=existing_vote.vote_type, removed=previous_type)
         db.commit()
         db.refresh(existing_vote)
         return existing_vote
@@ -250,6 +589,9 @@ def create_vote(
     )
     
     db.add(new_vote)
+    db.flush()
+    reputation.record(db, question.user_id, new_vote.created_at, **{reputation.vote_count(new_vote.vote_type): 1})
+    publish_vote_delta(db, new_vote.question_id, added=new_vote.vote_type)
     db.commit()
     db.refresh(new_vote)
     
@@ -257,17 +599,11 @@ def create_vote(
 
 
 @app.get("/votes/question/{question_id}/stats", response_model=VoteStats)
+@query_budget(2)
+@coalesced()
 def get_vote_stats(question_id: int, db: Session = Depends(get_db)):
     """Get vote statistics for a question"""
-    upvotes = db.query(Vote).filter(
-        Vote.question_id == question_id,
-        Vote.vote_type == VoteType.UPVOTE
-    ).count()
-    
-    downvotes = db.query(Vote).filter(
-        Vote.question_id == question_id,
-        Vote.vote_type == VoteType.DOWNVOTE
-    ).count()
+    upvotes, downvotes = rollup.vote_totals(db, question_id)
     
     return {
         "upvotes": upvotes,
@@ -277,13 +613,15 @@ def get_vote_stats(question_id: int, db: Session = Depends(get_db)):
 
 
 @app.delete("/votes/{vote_id}", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(5)
 def delete_vote(
     vote_id: int,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a vote (only by the voter)"""
-    vote = db.query(Vote).filter(Vote.id == vote_id).first()
+    # A vote folded by rollup.py is deleted from the archive instead
+    vote = db.query(Vote).filter(Vote.id == vote_id).first() or rollup.archived_vote(db, vote_id)
     
     if not vote:
         raise HTTPException(
@@ -297,12 +635,41 @@ def delete_vote(
             detail="Not authorized to delete this vote"
         )
     
-    db.delete(vote)
+    question_id, vote_type = vote.question_id, vote.vote_type
+    author_id = db.execute(select(Question.user_id).where(Question.id == question_id)).scalar()
+    reputation.record(db, author_id, vote.created_at, **{reputation.vote_count(vote_type): -1})
+    if isinstance(vote, Vote):
+        db.delete(vote)
+    else:
+        rollup.remove_archived(db, vote)
+    publish_vote_delta(db, question_id, removed=vote_type)
     db.commit()
     
     return None
 
 
+@app.get("/users/{user_id}/reputation", response_model=ReputationResponse)
+@query_budget(2)
+def get_user_reputation(user_id: int, db: Session = Depends(get_db)):
+    """A user's reputation, what it is made of and how much was earned this week"""
+    return reputation.user_reputation(db, user_id)
+
+
+@app.get("/leaderboard", response_model=List[LeaderboardEntry])
+@query_budget(1)
+def get_leaderboard(
+    window: Literal["week", "all"] = "all",
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Top contributors by reputation, all-time or earned in the last 7 days"""
+    return reputation.leaderboard(db, window, limit)
+
+
 if __name__ == "__main__":
+    # Development server; production runs migrate.py and then server.py
     import uvicorn
+    from migrate import migrate
+
+    migrate()
     uvicorn.run(app, host="0.0.0.0", port=8002)
@@ -0,0 +1,245 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# With several workers each process writes its samples to this directory and
+# /metrics aggregates them; it must exist before the first metric is created
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    multiprocess_mode="livesum",
+)
+RESPONSES = Counter(
+    "http_responses",
+    "HTTP responses by route template and status code",
+    ["method", "route", "status"],
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed while serving one request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_query_seconds_per_request",
+    "Time spent executing SQL while serving one request",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+AUTH_CALL_LATENCY = Histogram(
+    "auth_call_duration_seconds",
+    "Latency of token verification calls to auth-service",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+AUTH_HEDGED_REQUESTS = Counter(
+    "auth_hedged_requests",
+    "Second verification requests sent because the first was slow",
+)
+AUTH_GRACE_ACCEPTS = Counter(
+    "auth_grace_accepts",
+    "Tokens accepted from the grace cache while auth-service was unavailable",
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open",
+    ["upstream"],
+    multiprocess_mode="max",
+)
+CIRCUIT_BREAKER_TRIPS = Counter(
+    "circuit_breaker_trips",
+    "Times a circuit breaker opened",
+    ["upstream"],
+)
+EVENT_SUBSCRIBERS = Gauge(
+    "event_subscribers",
+    "Open server-sent event streams",
+    multiprocess_mode="livesum",
+)
+EVENTS_PUBLISHED = Counter(
+    "events_published",
+    "Question events published, by kind",
+    ["kind"],
+)
+EVENT_SUBSCRIBERS_DROPPED = Counter(
+    "event_subscribers_dropped",
+    "Event streams closed because the client fell too far behind",
+)
+IDEMPOTENCY_REPLAYS = Counter(
+    "idempotency_replays",
+    "Retried requests answered with the response stored for their Idempotency-Key",
+)
+IDEMPOTENCY_WAITS = Counter(
+    "idempotency_waits",
+    "Duplicate requests that waited for the in-flight request with the same Idempotency-Key",
+)
+QUESTIONS_PURGED = Counter(
+    "questions_purged",
+    "Deleted questions, by whether their rows were removed in the request or in the background",
+    ["mode"],
+)
+RATE_LIMITED = Counter(
+    "rate_limited",
+    "Requests rejected with 429, by the kind of bucket that was empty",
+    ["bucket"],
+)
+TRACE_SPANS_DROPPED = Counter(
+    "trace_spans_dropped",
+    "Finished trace spans dropped because the export queue was full or the export failed",
+)
+QUERY_PROBLEMS = Counter(
+    "query_problems",
+    "Query budget overruns, repeated (N+1) statements and slow statements in inspected requests",
+    ["method", "route", "kind"],
+)
+COALESCED_REQUESTS = Counter(
+    "coalesced_requests",
+    "Anonymous reads of coalesced routes, by whether they ran the endpoint (leader) or were sent a shared response (waiter, cached)",
+    ["route", "outcome"],
+)
+COALESCE_WAITERS = Gauge(
+    "coalesce_waiters",
+    "Requests waiting for an identical in-flight request's response",
+    multiprocess_mode="livesum",
+)
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Set per request by the middleware; the object is shared with the threadpool
+# that runs sync endpoints, so engine events can add to it
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+# Labelled children resolved once per route; labels() takes a lock on every call
+_route_children = {}
+_response_children = {}
+
+
+def _children_for(method: str, route: str):
+    children = _route_children.get((method, route))
+    if children is None:
+        children = (
+            REQUEST_LATENCY.labels(method, route),
+            DB_QUERIES_PER_REQUEST.labels(route),
+            DB_TIME_PER_REQUEST.labels(route),
+        )
+        _route_children[(method, route)] = children
+    return children
+
+
+def _response_counter(method: str, route: str, status_code: int):
+    counter = _response_children.get((method, route, status_code))
+    if counter is None:
+        counter = RESPONSES.labels(method, route, str(status_code))
+        _response_children[(method, route, status_code)] = counter
+    return counter
+
+
+class MetricsMiddleware:
+    """Record latency, in-flight requests, status codes and DB usage per route"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+
+            method = scope["method"]
+            route = _route_template(scope)
+            latency, db_queries, db_time = _children_for(method, route)
+            latency.observe(elapsed)
+            db_queries.observe(stats.queries)
+            db_time.observe(stats.db_time)
+            _response_counter(method, route, status_code).inc()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attribute SQL statement count and time to the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - context._metrics_start
+
+
+def metrics_response() -> Response:
+    """Render all metrics, aggregated across worker processes when enabled"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the shared directory on shutdown"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
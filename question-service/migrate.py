@@ -0,0 +1,77 @@
+"""Create tables, columns and votes partitions, fill in stored excerpts and
+compute reputations the first time; run once per deploy before the servers.
+
+    python migrate.py
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import Text, func, select, text, type_coerce, update
+
+from compressed_text import MARKER
+from database import SessionLocal, engine, init_db
+# Also registers the models on Base.metadata
+from models import EXCERPT_LENGTH, Question
+import partitions
+import purge
+import reputation
+
+# Serializes concurrent migrate runs, e.g. init containers of several replicas
+MIGRATION_LOCK_ID = 8002
+
+
+@contextmanager
+def migration_lock():
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def fill_excerpts(batch_size: int = 1000) -> int:
+    """Store excerpts of questions written before they were stored, one batch per transaction"""
+    stored = type_coerce(Question.content, Text)
+    batch = (
+        select(Question.id)
+        # Compressed bodies always come with an excerpt
+        .where(Question.excerpt.is_(None), ~stored.startswith(MARKER))
+        .limit(batch_size)
+    )
+    total = 0
+    with SessionLocal() as db:
+        while True:
+            count = db.execute(
+                update(Question)
+                .where(Question.id.in_(batch))
+                .values(excerpt=func.substr(stored, 1, EXCERPT_LENGTH), updated_at=Question.updated_at)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            total += count
+            if count < batch_size:
+                return total
+
+
+def migrate():
+    with migration_lock():
+        init_db()
+        if engine.dialect.name == "postgresql":
+            with engine.begin() as connection:
+                partitions.partition_existing_votes(connection)
+                partitions.ensure_partitions(connection)
+                purge.add_cascades(connection)
+    filled = fill_excerpts()
+    if filled:
+        print(f"Stored excerpts of {filled} questions")
+    if reputation.is_empty():
+        users, _ = reputation.recompute()
+        if users:
+            print(f"Computed reputation of {users} users")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,9 +1,16 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Date, DateTime, LargeBinary, JSON, ForeignKey, Enum as SQLEnum,
+    DDL, Index, PrimaryKeyConstraint, event
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from compressed_text import CompressedText
 from database import Base
 import enum
 
+# Number of characters of the body returned by list endpoints
+EXCERPT_LENGTH = 200
+
 
 class VoteType(enum.Enum):
     UPVOTE = "upvote"
@@ -15,37 +22,190 @@ class Question(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)
     user_id = Column(Integer, nullable=False, index=True)  
     views = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set when a large thread is deleted: the question is hidden at once and
+    # its rows are removed in the background, which moves this forward as it
+    # progresses. See purge.py
+    deleted_at = Column(DateTime)
+
+    # Stored on write so list queries never read the body, which may be
+    # compressed; migrate.py fills it in for older rows
+    excerpt = Column(String(EXCERPT_LENGTH))
+
+    # Children are deleted by the database (or purge.py), never loaded for it
+    answers = relationship("Answer", back_populates="question", cascade="all, delete-orphan", passive_deletes=True)
+    votes = relationship("Vote", back_populates="question", cascade="all, delete-orphan", passive_deletes=True)
+
+
+@event.listens_for(Question.content, "set")
+def _set_excerpt(target, value, oldvalue, initiator):
+    target.excerpt = value[:EXCERPT_LENGTH] if value is not None else None
+
 
-    answers = relationship("Answer", back_populates="question", cascade="all, delete-orphan")
-    votes = relationship("Vote", back_populates="question", cascade="all, delete-orphan")
+# Lets the purge sweep find deleted questions without scanning the others
+Index(
+    "ix_questions_deleted_at", Question.deleted_at,
+    postgresql_where=Question.deleted_at.isnot(None),
+    sqlite_where=Question.deleted_at.isnot(None),
+)
 
 
 class Answer(Base):
     __tablename__ = "answers"
 
     id = Column(Integer, primary_key=True, index=True)
-    content = Column(Text, nullable=False)
-    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    content = Column(CompressedText, nullable=False)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False, index=True)
     user_id = Column(Integer, nullable=False, index=True)  
     is_accepted = Column(Integer, default=0)
+    # When the question's author accepted it; reputation.py dates the points by it
+    accepted_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     question = relationship("Question", back_populates="answers")
 
 
+def _not_postgres(ddl, target, bind, dialect, **kw) -> bool:
+    return dialect.name != "postgresql"
+
+
+# On Postgres votes are range-partitioned by month of created_at, see
+# partitions.py. A partitioned table's primary key must include the
+# partition column, so there it is (id, created_at) instead of id.
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        PrimaryKeyConstraint("id").ddl_if(callable_=_not_postgres),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    id = Column(Integer, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False, index=True)
     user_id = Column(Integer, nullable=False, index=True)  
     vote_type = Column(SQLEnum(VoteType), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     question = relationship("Question", back_populates="votes")
+
+
+# Rows outside every monthly partition land in the default one until a
+# partition for their month is created
+event.listen(
+    Vote.__table__, "after_create",
+    DDL("ALTER TABLE votes ADD PRIMARY KEY (id, created_at)").execute_if(dialect="postgresql"),
+)
+event.listen(
+    Vote.__table__, "after_create",
+    DDL("CREATE TABLE votes_default PARTITION OF votes DEFAULT").execute_if(dialect="postgresql"),
+)
+
+
+# Vote totals folded out of votes for old, inactive questions, see rollup.py;
+# a question's counts are its remaining votes plus this row
+class VoteRollup(Base):
+    __tablename__ = "vote_rollups"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    upvotes = Column(Integer, nullable=False, default=0)
+    downvotes = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Folded votes under their original ids; read only when a voter changes or
+# removes a vote that was rolled up
+class ArchivedVote(Base):
+    __tablename__ = "votes_archive"
+    __table_args__ = (Index("ix_votes_archive_question_user", "question_id", "user_id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, nullable=False)
+    vote_type = Column(SQLEnum(VoteType), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+# A user's reputation and what it is made of: votes received on their
+# questions, answers posted and answers accepted. Kept current as votes and
+# answers are written, see reputation.py
+class UserReputation(Base):
+    __tablename__ = "user_reputation"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    reputation = Column(Integer, nullable=False, default=0)
+    upvotes = Column(Integer, nullable=False, default=0)
+    downvotes = Column(Integer, nullable=False, default=0)
+    answers = Column(Integer, nullable=False, default=0)
+    accepted_answers = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# The all-time leaderboard reads it in order
+Index("ix_user_reputation_score", UserReputation.reputation.desc(), UserReputation.user_id)
+
+
+# Reputation earned per user and UTC day, for windowed leaderboards; days
+# before the longest window are pruned by reputation.py
+class ReputationDay(Base):
+    __tablename__ = "reputation_days"
+    __table_args__ = (Index("ix_reputation_days_user_day", "user_id", "day"),)
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    reputation = Column(Integer, nullable=False, default=0)
+
+
+# MinHash signature of a question's text, see dedup.py
+class QuestionSignature(Base):
+    __tablename__ = "question_signatures"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    signature = Column(LargeBinary, nullable=False)
+
+
+# One band of a question's signature; questions sharing a bucket are duplicate candidates
+class QuestionBucket(Base):
+    __tablename__ = "question_lsh_buckets"
+
+    bucket = Column(BigInteger, primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+# Hashed term vector of a question and its precomputed related questions, see related.py
+class QuestionRelated(Base):
+    __tablename__ = "question_related"
+
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    terms = Column(LargeBinary, nullable=False)
+    frequencies = Column(LargeBinary, nullable=False)
+    # [[question_id, score], ...] best first; null until the next related.py run
+    neighbours = Column(JSON(none_as_null=True))
+
+
+# Response of the first request made with an Idempotency-Key, replayed to
+# retries; status_code is null while that request is still running. See
+# idempotency.py
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer)
+    body = Column(LargeBinary)
+    content_type = Column(String(100))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+# zstd dictionaries trained on stored bodies, see compressed_text.py; the id
+# is the one recorded in every frame compressed with the dictionary
+class CompressionDictionary(Base):
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
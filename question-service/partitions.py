@@ -0,0 +1,130 @@
+"""Monthly range partitions of the votes table (Postgres only).
+
+votes is partitioned by created_at with one partition per month, named
+votes_pYYYY_MM, and a default partition for rows outside all of them.
+migrate.py and rollup.py keep partitions created a few months ahead;
+rollup.py drops old partitions once their votes have been folded.
+"""
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from config import settings
+from models import Vote
+
+DEFAULT_PARTITION = "votes_default"
+LEGACY_TABLE = "votes_unpartitioned"
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"votes_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    return connection.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('votes')")
+    ).scalar() is True
+
+
+def monthly_partitions(connection: Connection) -> List[str]:
+    return connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'votes'::regclass AND c.relname <> :default ORDER BY c.relname"
+    ), {"default": DEFAULT_PARTITION}).scalars().all()
+
+
+def create_partition(connection: Connection, month: date) -> None:
+    """Create a month's partition, moving its rows out of the default partition.
+
+    Attaching a partition fails while the default partition holds rows in its
+    range, so the table is filled first and attached afterwards.
+    """
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    connection.execute(text(f"CREATE TABLE {name} (LIKE votes INCLUDING DEFAULTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        "WHERE created_at >= :lower AND created_at < :upper RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"lower": lower, "upper": upper})
+    connection.execute(text(
+        f"ALTER TABLE votes ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+
+
+def ensure_partitions(connection: Connection, since: Optional[date] = None) -> List[str]:
+    """Create missing monthly partitions from `since` (default: this month)
+    through votes_partition_months_ahead months ahead; returns their names"""
+    existing = set(monthly_partitions(connection))
+    today = month_start(datetime.utcnow().date())
+    month = month_start(since) if since is not None else today
+    end = add_months(today, settings.votes_partition_months_ahead + 1)
+    created = []
+    while month < end:
+        if partition_name(month) not in existing:
+            create_partition(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def drop_empty_partitions(connection: Connection, before: date) -> List[str]:
+    """Drop monthly partitions that end on or before `before` and hold no rows"""
+    dropped = []
+    for name in monthly_partitions(connection):
+        year, month = int(name[7:11]), int(name[12:14])
+        if add_months(date(year, month, 1), 1) > before:
+            continue
+        if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+            continue
+        connection.execute(text(f"ALTER TABLE votes DETACH PARTITION {name}"))
+        connection.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+def partition_existing_votes(connection: Connection) -> int:
+    """Convert a votes table created before partitioning; returns rows moved.
+
+    The old table, its indexes and id sequence are renamed out of the way,
+    the partitioned table is created with partitions for every month that
+    has votes, the rows are copied over and the old table is dropped.
+    """
+    if connection.execute(text("SELECT to_regclass('votes')")).scalar() is None:
+        return 0
+    if is_partitioned(connection):
+        return 0
+
+    connection.execute(text(f"ALTER TABLE votes RENAME TO {LEGACY_TABLE}"))
+    indexes = connection.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+    ), {"table": LEGACY_TABLE}).scalars().all()
+    for index in indexes:
+        connection.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_unpartitioned"'))
+    connection.execute(text("ALTER SEQUENCE votes_id_seq RENAME TO votes_unpartitioned_id_seq"))
+
+    # checkfirst also skips the vote type enum, which already exists
+    Vote.__table__.create(connection, checkfirst=True)
+    first = connection.execute(text(f"SELECT min(created_at) FROM {LEGACY_TABLE}")).scalar()
+    ensure_partitions(connection, since=first.date() if first is not None else None)
+    moved = connection.execute(text(
+        "INSERT INTO votes (id, question_id, user_id, vote_type, created_at) "
+        "SELECT id, question_id, user_id, vote_type, coalesce(created_at, now() AT TIME ZONE 'utc') "
+        f"FROM {LEGACY_TABLE}"
+    )).rowcount
+    connection.execute(text(
+        f"SELECT setval('votes_id_seq', (SELECT coalesce(max(id), 0) + 1 FROM {LEGACY_TABLE}), false)"
+    ))
+    connection.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+    return moved
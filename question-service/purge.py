@@ -0,0 +1,209 @@
+"""Deleting questions together with their answers and votes.
+
+Rows are deleted with set-based statements, never loaded. A thread with
+up to question_purge_sync_limit answers and votes is deleted in the
+request. A larger one is only marked deleted there, which hides it at
+once, and purged afterwards in batches of question_purge_batch_size rows,
+each its own short transaction, so neither memory nor lock time grows
+with the thread. Purges run in each worker's purge_loop, outside any
+request, which also resumes purges interrupted by a restart.
+
+Answers and votes are deleted with RETURNING, so their authors'
+reputation loses exactly the rows deleted, in the same transaction.
+
+The foreign keys to questions cascade on Postgres as well, so rows added
+to a thread while it is being purged go with the question.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, literal, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from metrics import QUESTIONS_PURGED
+from models import Answer, ArchivedVote, Question, Vote, VoteRollup
+import dedup
+import related
+import reputation
+
+CHILD_TABLES = (Answer.__table__, Vote.__table__, ArchivedVote.__table__)
+
+
+def _child_count(db: Session, question_id: int, limit: int) -> int:
+    """Answers and votes of a question, counted up to just past `limit`"""
+    total = 0
+    for table in CHILD_TABLES:
+        rows = select(literal(1)).where(table.c.question_id == question_id).limit(limit + 1 - total)
+        total += db.execute(select(func.count()).select_from(rows.subquery())).scalar()
+        if total > limit:
+            break
+    return total
+
+
+def _author(db: Session, question_id: int) -> int:
+    return db.execute(select(Question.user_id).where(Question.id == question_id)).scalar()
+
+
+def _delete_children(db: Session, table, question_id: int, author_id: int, limit: int = 0) -> Tuple[int, list]:
+    """Delete a question's rows in `table`, at most `limit` of them; returns
+    the number deleted and the reputation changes that takes"""
+    statement = delete(table).where(table.c.question_id == question_id)
+    if limit:
+        statement = statement.where(table.c.id.in_(
+            select(table.c.id).where(table.c.question_id == question_id).limit(limit)
+        ))
+    if table is Answer.__table__:
+        rows = db.execute(
+            statement.returning(table.c.user_id, table.c.created_at, table.c.is_accepted, table.c.accepted_at)
+        ).all()
+        changes = [(row.user_id, row.created_at, {"answers": -1}) for row in rows]
+        changes += [(row.user_id, row.accepted_at, {"accepted_answers": -1}) for row in rows if row.is_accepted]
+    else:
+        rows = db.execute(statement.returning(table.c.vote_type, table.c.created_at)).all()
+        changes = [(author_id, row.created_at, {reputation.vote_count(row.vote_type): -1}) for row in rows]
+    return len(rows), changes
+
+
+def _touch(db: Session, question_id: int) -> None:
+    db.execute(
+        update(Question).where(Question.id == question_id).values(deleted_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def _delete_question_row(db: Session, question_id: int) -> None:
+    dedup.remove_question(db, question_id)
+    related.remove_question(db, question_id)
+    db.execute(delete(VoteRollup).where(VoteRollup.question_id == question_id))
+    db.execute(delete(Question).where(Question.id == question_id), execution_options={"synchronize_session": False})
+
+
+def delete_question(db: Session, question_id: int) -> bool:
+    """Delete a small thread outright, or mark a large one for purge_question.
+
+    Returns whether the question is gone; the caller commits either way.
+    """
+    if _child_count(db, question_id, settings.question_purge_sync_limit) <= settings.question_purge_sync_limit:
+        author_id = _author(db, question_id)
+        changes = []
+        for table in CHILD_TABLES:
+            changes += _delete_children(db, table, question_id, author_id)[1]
+        reputation.record_many(db, changes)
+        _delete_question_row(db, question_id)
+        QUESTIONS_PURGED.labels("request").inc()
+        return True
+    # Duplicate and related lookups stop offering it right away
+    dedup.remove_question(db, question_id)
+    related.remove_question(db, question_id)
+    _touch(db, question_id)
+    return False
+
+
+def purge_question(question_id: int, batch_size: int = 0) -> int:
+    """Delete a marked question's rows in batches, then the question; returns rows deleted"""
+    batch_size = batch_size or settings.question_purge_batch_size
+    deleted = 0
+    with SessionLocal() as db:
+        author_id = _author(db, question_id)
+        for table in CHILD_TABLES:
+            while True:
+                count, changes = _delete_children(db, table, question_id, author_id, batch_size)
+                reputation.record_many(db, changes)
+                # A purge making progress is not taken for an interrupted one
+                _touch(db, question_id)
+                db.commit()
+                deleted += count
+                if count < batch_size:
+                    break
+        _delete_question_row(db, question_id)
+        db.commit()
+    QUESTIONS_PURGED.labels("background").inc()
+    return deleted
+
+
+def _claim_stale(db: Session, question_id: int, deleted_at: datetime) -> bool:
+    # Moving the mark forward claims the purge; another worker that read the
+    # old mark updates nothing and leaves it
+    claimed = db.execute(
+        update(Question)
+        .where(Question.id == question_id, Question.deleted_at == deleted_at)
+        .values(deleted_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    db.commit()
+    return claimed == 1
+
+
+def purge_stale() -> List[int]:
+    """Purge marked questions whose purge has made no progress for an interval"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.question_purge_interval_seconds)
+    with SessionLocal() as db:
+        stale = db.execute(
+            select(Question.id, Question.deleted_at).where(Question.deleted_at < cutoff).limit(100)
+        ).all()
+        claimed = [question_id for question_id, deleted_at in stale if _claim_stale(db, question_id, deleted_at)]
+    for question_id in claimed:
+        purge_question(question_id)
+    return claimed
+
+
+# This worker's loop and the questions it was asked to purge
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_scheduled: Optional[asyncio.Queue] = None
+
+
+def schedule(question_id: int) -> None:
+    """Hand a marked question to purge_loop; safe to call from sync endpoints"""
+    loop, scheduled = _loop, _scheduled
+    if loop is None:
+        # purge_stale gets to it
+        return
+    try:
+        loop.call_soon_threadsafe(scheduled.put_nowait, question_id)
+    except RuntimeError:
+        # The loop closed during shutdown
+        pass
+
+
+async def purge_loop() -> None:
+    """Purge scheduled questions one at a time, and run purge_stale
+    periodically; jittered so workers don't line up"""
+    global _loop, _scheduled
+    _loop, _scheduled = asyncio.get_running_loop(), asyncio.Queue()
+    interval = settings.question_purge_interval_seconds
+    next_sweep = time.monotonic() + interval * random.uniform(0.5, 1.5)
+    while True:
+        try:
+            question_id = await asyncio.wait_for(_scheduled.get(), max(0.0, next_sweep - time.monotonic()))
+            job, args = purge_question, (question_id,)
+        except asyncio.TimeoutError:
+            next_sweep = time.monotonic() + interval * random.uniform(0.5, 1.5)
+            job, args = purge_stale, ()
+        try:
+            await run_in_threadpool(job, *args)
+        except Exception:
+            # The sweep picks the question up again
+            pass
+
+
+def add_cascades(connection: Connection) -> List[str]:
+    """Make foreign keys to questions created without ON DELETE CASCADE cascade (Postgres)"""
+    constraints = connection.execute(text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = 'questions'::regclass AND confdeltype <> 'c' "
+        "AND conparentid = 0 AND conrelid IN ('answers'::regclass, 'votes'::regclass)"
+    )).all()
+    for table, name in constraints:
+        connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+        connection.execute(text(
+            f'ALTER TABLE {table} ADD CONSTRAINT "{name}" '
+            "FOREIGN KEY (question_id) REFERENCES questions (id) ON DELETE CASCADE"
+        ))
+    return [name for _, name in constraints]
@@ -0,0 +1,238 @@
+"""User reputation and the contributors leaderboard, maintained incrementally.
+
+A user's reputation is the points for votes on their questions, for the
+answers they posted and for those of their answers that were accepted,
+weighted by the reputation_* settings. Every write that changes one of
+these adjusts the author's user_reputation row, and the reputation_days
+row of the day the vote or answer dates from, in the write's transaction.
+Reads never aggregate votes or answers:
+
+- a user's reputation is one row, their week an index range of days
+- the all-time leaderboard reads ix_user_reputation_score in order
+- a windowed leaderboard sums the window's days, a row per user active
+  on each day
+
+Deleting a question takes its votes and answers off their authors as
+purge.py deletes the rows. The recompute rebuilds both tables from votes
+and answers, to repair them or after the weights change:
+
+    python reputation.py            # full recompute
+    python reputation.py --prune    # daily: drop days older than every window
+"""
+import argparse
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, delete, func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import Answer, ArchivedVote, Question, ReputationDay, UserReputation, Vote, VoteType
+
+# Days summed by each leaderboard window; "all" reads user_reputation
+WINDOWS = {"week": 7}
+COUNTS = ("upvotes", "downvotes", "answers", "accepted_answers")
+
+
+def points(upvotes: int = 0, downvotes: int = 0, answers: int = 0, accepted_answers: int = 0) -> int:
+    return (
+        upvotes * settings.reputation_upvote
+        + downvotes * settings.reputation_downvote
+        + answers * settings.reputation_answer
+        + accepted_answers * settings.reputation_accepted_answer
+    )
+
+
+def vote_count(vote_type: VoteType) -> str:
+    """The count a vote of this type adds to"""
+    return "upvotes" if vote_type == VoteType.UPVOTE else "downvotes"
+
+
+def window_start(days: int) -> date:
+    """First UTC day of a window of `days` days ending today"""
+    return datetime.utcnow().date() - timedelta(days=days - 1)
+
+
+def _upsert(db: Session, table, key: List[str], columns: Iterable[str]):
+    """INSERT that adds to `columns` of an existing row instead (Postgres, SQLite)"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=key,
+        set_={
+            **{column: table.c[column] + statement.excluded[column] for column in columns},
+            **({"updated_at": statement.excluded.updated_at} if "updated_at" in table.c else {}),
+        },
+    )
+
+
+def record_many(db: Session, changes: Iterable[Tuple[int, Optional[datetime], Dict[str, int]]]) -> None:
+    """Apply (user id, when, count changes) to reputations, in the caller's
+    transaction; `when` None, for rows without a date, leaves the days alone"""
+    totals: Dict[int, Counter] = defaultdict(Counter)
+    days: Dict[Tuple[date, int], int] = defaultdict(int)
+    oldest = window_start(max(WINDOWS.values()))
+    for user_id, when, counts in changes:
+        totals[user_id].update(counts)
+        if when is not None and when.date() >= oldest:
+            days[(when.date(), user_id)] += points(**counts)
+    if not totals:
+        return
+    now = datetime.utcnow()
+    db.execute(
+        _upsert(db, UserReputation.__table__, ["user_id"], ("reputation",) + COUNTS),
+        [
+            {"user_id": user_id, "reputation": points(**counts), "updated_at": now,
+             **{name: counts[name] for name in COUNTS}}
+            for user_id, counts in totals.items()
+        ],
+    )
+    days = {key: value for key, value in days.items() if value}
+    if days:
+        db.execute(
+            _upsert(db, ReputationDay.__table__, ["day", "user_id"], ("reputation",)),
+            [{"day": day, "user_id": user_id, "reputation": value} for (day, user_id), value in days.items()],
+        )
+
+
+def record(db: Session, user_id: int, when: Optional[datetime], **counts: int) -> None:
+    """Adjust one user's reputation, e.g. record(db, author, vote.created_at, upvotes=-1, downvotes=1)"""
+    record_many(db, [(user_id, when, counts)])
+
+
+def user_reputation(db: Session, user_id: int) -> dict:
+    row = db.get(UserReputation, user_id)
+    result = {
+        "user_id": user_id,
+        "reputation": row.reputation if row is not None else 0,
+        **{name: getattr(row, name) if row is not None else 0 for name in COUNTS},
+    }
+    for window, days in WINDOWS.items():
+        result[window] = db.execute(
+            select(func.coalesce(func.sum(ReputationDay.reputation), 0))
+            .where(ReputationDay.user_id == user_id, ReputationDay.day >= window_start(days))
+        ).scalar()
+    return result
+
+
+def leaderboard(db: Session, window: str, limit: int) -> List[dict]:
+    """Top users by reputation, all-time or earned within a window"""
+    if window == "all":
+        rows = db.execute(
+            select(UserReputation.user_id, UserReputation.reputation)
+            .order_by(UserReputation.reputation.desc(), UserReputation.user_id)
+            .limit(limit)
+        ).all()
+    else:
+        earned = func.sum(ReputationDay.reputation)
+        rows = db.execute(
+            select(ReputationDay.user_id, earned)
+            .where(ReputationDay.day >= window_start(WINDOWS[window]))
+            .group_by(ReputationDay.user_id)
+            .order_by(earned.desc(), ReputationDay.user_id)
+            .limit(limit)
+        ).all()
+    return [{"user_id": user_id, "reputation": reputation} for user_id, reputation in rows]
+
+
+def _aggregate(db: Session, since: datetime):
+    """Counts per user, and points per (day, user) since `since`, from votes and answers"""
+    totals: Dict[int, Counter] = defaultdict(Counter)
+    days: Dict[Tuple[date, int], int] = defaultdict(int)
+
+    def add(rows, count_of, dated: bool):
+        for row in rows:
+            user_id, key, value = row[0], count_of(row), row[-1]
+            if dated:
+                days[(row[1], user_id)] += points(**{key: value})
+            else:
+                totals[user_id][key] += value
+
+    for table in (Vote.__table__, ArchivedVote.__table__):
+        received = select(Question.user_id).join_from(table, Question, Question.id == table.c.question_id)
+        add(db.execute(
+            received.add_columns(table.c.vote_type, func.count()).group_by(Question.user_id, table.c.vote_type)
+        ), lambda row: vote_count(row[1]), False)
+        day = func.date(table.c.created_at, type_=Date)
+        add(db.execute(
+            received.add_columns(day, table.c.vote_type, func.count())
+            .where(table.c.created_at >= since)
+            .group_by(Question.user_id, day, table.c.vote_type)
+        ), lambda row: vote_count(row[2]), True)
+
+    accepted = Answer.is_accepted == 1
+    add(db.execute(select(Answer.user_id, func.count()).group_by(Answer.user_id)), lambda row: "answers", False)
+    add(db.execute(
+        select(Answer.user_id, func.count()).where(accepted).group_by(Answer.user_id)
+    ), lambda row: "accepted_answers", False)
+    for column, key, condition in ((Answer.created_at, "answers", None), (Answer.accepted_at, "accepted_answers", accepted)):
+        day = func.date(column, type_=Date)
+        query = select(Answer.user_id, day, func.count()).where(column >= since).group_by(Answer.user_id, day)
+        if condition is not None:
+            query = query.where(condition)
+        add(db.execute(query), lambda row, key=key: key, True)
+    return totals, days
+
+
+def recompute(batch_size: int = 1000) -> Tuple[int, int]:
+    """Rebuild user_reputation and reputation_days; returns (users, days) stored"""
+    since = window_start(max(WINDOWS.values()))
+    with SessionLocal() as db:
+        if db.get_bind().dialect.name == "postgresql":
+            # Writers wait for the rebuild, so no change falls between the
+            # aggregates and the rows that replace the old ones
+            db.execute(text("LOCK TABLE user_reputation, reputation_days IN EXCLUSIVE MODE"))
+        totals, days = _aggregate(db, datetime.combine(since, datetime.min.time()))
+        db.execute(delete(UserReputation))
+        db.execute(delete(ReputationDay))
+        now = datetime.utcnow()
+        users = [
+            {"user_id": user_id, "reputation": points(**counts), "updated_at": now,
+             **{name: counts[name] for name in COUNTS}}
+            for user_id, counts in totals.items()
+        ]
+        day_rows = [
+            {"day": day, "user_id": user_id, "reputation": value}
+            for (day, user_id), value in days.items() if value
+        ]
+        for table, rows in ((UserReputation.__table__, users), (ReputationDay.__table__, day_rows)):
+            for start in range(0, len(rows), batch_size):
+                db.execute(insert(table), rows[start:start + batch_size])
+        db.commit()
+    return len(users), len(day_rows)
+
+
+def prune() -> int:
+    """Delete days before every window; returns rows deleted"""
+    with SessionLocal() as db:
+        deleted = db.execute(
+            delete(ReputationDay).where(ReputationDay.day < window_start(max(WINDOWS.values())))
+        ).rowcount
+        db.commit()
+    return deleted
+
+
+def is_empty() -> bool:
+    with SessionLocal() as db:
+        return db.execute(select(UserReputation.user_id).limit(1)).first() is None
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Recompute user reputation from votes and answers")
+    parser.add_argument("--prune", action="store_true", help="only drop days older than every leaderboard window")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.prune:
+        print(f"pruned {prune()} reputation days in {time.perf_counter() - start:.1f}s")
+        return
+    users, days = recompute()
+    print(f"recomputed reputation of {users} users, {days} user days in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Fold votes on old, inactive questions into per-question totals.
+
+Stats and list queries count a question's rows in votes; once a question
+stops receiving votes those rows only cost index and cache space. This job
+moves the votes of questions created and last voted on more than
+votes_rollup_after_days ago into vote_rollups (counts) and votes_archive
+(the rows themselves, read only when a voter changes or removes one of
+them), then drops the monthly partitions that were emptied. Counts are
+always the remaining votes plus the rollup row, so nothing changes for
+clients.
+
+    python rollup.py              # daily: partitions ahead, fold, drop
+    python rollup.py --days 365
+"""
+import argparse
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal, engine
+from models import ArchivedVote, Question, Vote, VoteRollup, VoteType
+import partitions
+
+# Only one job at a time; a second one exits
+JOB_LOCK_ID = 18004
+
+VOTES_TABLE = Vote.__table__
+ARCHIVE_INSERT = insert(ArchivedVote.__table__)
+ROLLUP_INSERT = insert(VoteRollup.__table__)
+ROLLUP_ADD = (
+    update(VoteRollup.__table__)
+    .where(VoteRollup.__table__.c.question_id == bindparam("row_id"))
+    .values(
+        upvotes=VoteRollup.__table__.c.upvotes + bindparam("up"),
+        downvotes=VoteRollup.__table__.c.downvotes + bindparam("down"),
+        updated_at=bindparam("now"),
+    )
+)
+
+
+def vote_totals(db: Session, question_id: int) -> Tuple[int, int]:
+    """Upvotes and downvotes of a question, folded ones included"""
+    counts = dict(db.execute(
+        select(Vote.vote_type, func.count())
+        .where(Vote.question_id == question_id)
+        .group_by(Vote.vote_type)
+    ).all())
+    upvotes = counts.get(VoteType.UPVOTE, 0)
+    downvotes = counts.get(VoteType.DOWNVOTE, 0)
+    rolled_up = db.execute(
+        select(VoteRollup.upvotes, VoteRollup.downvotes).where(VoteRollup.question_id == question_id)
+    ).first()
+    if rolled_up is not None:
+        upvotes += rolled_up[0]
+        downvotes += rolled_up[1]
+    return upvotes, downvotes
+
+
+def _unfold(db: Session, archived: ArchivedVote) -> None:
+    column = "upvotes" if archived.vote_type == VoteType.UPVOTE else "downvotes"
+    db.execute(
+        update(VoteRollup)
+        .where(VoteRollup.question_id == archived.question_id)
+        .values({column: getattr(VoteRollup, column) - 1})
+    )
+    db.delete(archived)
+
+
+def thaw_vote(db: Session, question_id: int, user_id: int) -> Optional[Vote]:
+    """Move a user's folded vote on a question back into votes, if there is one"""
+    if db.get(VoteRollup, question_id) is None:
+        return None
+    archived = db.execute(
+        select(ArchivedVote).where(ArchivedVote.question_id == question_id, ArchivedVote.user_id == user_id)
+    ).scalars().first()
+    if archived is None:
+        return None
+    vote = Vote(
+        id=archived.id, question_id=archived.question_id, user_id=archived.user_id,
+        vote_type=archived.vote_type, created_at=archived.created_at,
+    )
+    _unfold(db, archived)
+    db.add(vote)
+    db.flush()
+    return vote
+
+
+def archived_vote(db: Session, vote_id: int) -> Optional[ArchivedVote]:
+    return db.get(ArchivedVote, vote_id)
+
+
+def remove_archived(db: Session, archived: ArchivedVote) -> None:
+    """Delete a folded vote and take it out of its question's totals"""
+    _unfold(db, archived)
+
+
+def _fold_batch(db: Session, question_ids: List[int], cutoff: datetime) -> int:
+    # Deleting first and archiving exactly the returned rows keeps the totals
+    # right if a vote changes while the batch runs; votes newer than the
+    # cutoff stay where they are and are still counted
+    rows = db.execute(
+        delete(VOTES_TABLE)
+        .where(VOTES_TABLE.c.question_id.in_(question_ids), VOTES_TABLE.c.created_at < cutoff)
+        .returning(
+            VOTES_TABLE.c.id, VOTES_TABLE.c.question_id, VOTES_TABLE.c.user_id,
+            VOTES_TABLE.c.vote_type, VOTES_TABLE.c.created_at,
+        )
+    ).all()
+    if not rows:
+        return 0
+    db.execute(ARCHIVE_INSERT, [row._asdict() for row in rows])
+
+    totals: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+    for row in rows:
+        totals[row.question_id][0 if row.vote_type == VoteType.UPVOTE else 1] += 1
+    existing = set(db.execute(
+        select(VoteRollup.question_id).where(VoteRollup.question_id.in_(list(totals)))
+    ).scalars())
+    now = datetime.utcnow()
+    additions = [
+        {"row_id": question_id, "up": up, "down": down, "now": now}
+        for question_id, (up, down) in totals.items() if question_id in existing
+    ]
+    if additions:
+        db.execute(ROLLUP_ADD, additions)
+    created = [
+        {"question_id": question_id, "upvotes": up, "downvotes": down, "updated_at": now}
+        for question_id, (up, down) in totals.items() if question_id not in existing
+    ]
+    if created:
+        db.execute(ROLLUP_INSERT, created)
+    return len(rows)
+
+
+def fold_inactive(cutoff: datetime, batch_size: int = 500) -> Tuple[int, int]:
+    """Fold votes of questions inactive since `cutoff`; returns (questions, votes)"""
+    questions = folded = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            batch = db.execute(
+                select(Vote.question_id)
+                .join(Question, Question.id == Vote.question_id)
+                .where(Vote.question_id > last_id, Question.created_at < cutoff, Question.deleted_at.is_(None))
+                .group_by(Vote.question_id)
+                .having(func.max(Vote.created_at) < cutoff)
+                .order_by(Vote.question_id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not batch:
+                return questions, folded
+            folded += _fold_batch(db, batch, cutoff)
+            db.commit()
+            questions += len(batch)
+            last_id = batch[-1]
+
+
+@contextmanager
+def _job_lock():
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect() as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": JOB_LOCK_ID}).scalar()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": JOB_LOCK_ID})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold votes on inactive questions into totals")
+    parser.add_argument(
+        "--days", type=int, default=settings.votes_rollup_after_days,
+        help="days without new votes after which a question is folded",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with _job_lock() as acquired:
+        if not acquired:
+            print("another rollup job is running")
+            return
+        start = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(days=args.days)
+        postgres = engine.dialect.name == "postgresql"
+        if postgres:
+            with engine.begin() as connection:
+                created = partitions.ensure_partitions(connection)
+        questions, folded = fold_inactive(cutoff, args.batch_size)
+        dropped = []
+        if postgres:
+            with engine.begin() as connection:
+                dropped = partitions.drop_empty_partitions(connection, partitions.month_start(cutoff.date()))
+        print(f"folded {folded} votes on {questions} questions in {time.perf_counter() - start:.1f}s")
+        if postgres:
+            print(f"created partitions {created or 'none'}, dropped {dropped or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,34 @@ class QuestionResponse(QuestionBase):
         from_attributes = True
 
 
+class QuestionSummaryResponse(BaseModel):
+    id: int
+    title: str
+    excerpt: str
+    user_id: int
+    views: int
+    created_at: datetime
+    updated_at: datetime
+    answer_count: Optional[int] = 0
+    vote_count: Optional[int] = 0
+
+    class Config:
+        from_attributes = True
+
+
+class SimilarQuestionsRequest(BaseModel):
+    title: str = Field(..., min_length=1, max_length=255)
+    content: str = ""
+
+
+class SimilarQuestionResponse(QuestionSummaryResponse):
+    similarity: float
+
+
+class QuestionCreatedResponse(QuestionResponse):
+    similar_questions: List[SimilarQuestionResponse] = []
+
+
 class AnswerBase(BaseModel):
     content: str = Field(..., min_length=20)
 
@@ -81,3 +109,19 @@ class VoteStats(BaseModel):
     upvotes: int
     downvotes: int
     total: int
+
+
+class ReputationResponse(BaseModel):
+    user_id: int
+    reputation: int
+    upvotes: int
+    downvotes: int
+    answers: int
+    accepted_answers: int
+    # Earned in the last 7 days
+    week: int
+
+
+class LeaderboardEntry(BaseModel):
+    user_id: int
+    reputation: int
@@ -0,0 +1,49 @@
+"""Events are sent when the write they report commits, never when it rolls back"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+import events
+from database import SessionLocal
+
+TOPIC = 7
+
+
+@pytest.fixture
+def broker():
+    broker = events.LocalBroker(max_subscribers=10, queue_size=10)
+    yield broker
+    broker.stop()
+
+
+def sent(broker: events.LocalBroker, end) -> list:
+    """Frames a subscriber receives from one publish in a transaction that `end` finishes"""
+
+    async def run():
+        broker.start(asyncio.get_running_loop())
+        subscription = broker.subscribe(TOPIC)
+        with SessionLocal() as db:
+            db.execute(text("SELECT 1"))
+            broker.publish(db, TOPIC, "votes", {"total": 1})
+            # Not before the transaction ends
+            await asyncio.sleep(0)
+            assert subscription.queue.empty()
+            end(db)
+        await asyncio.sleep(0)
+        frames = []
+        while not subscription.queue.empty():
+            frames.append(subscription.queue.get_nowait())
+        return frames
+
+    return asyncio.run(run())
+
+
+def test_sent_on_commit(broker):
+    assert sent(broker, lambda db: db.commit()) == [events.encode_event("votes", {"total": 1})]
+
+
+@pytest.mark.parametrize("end", [lambda db: db.rollback(), lambda db: None], ids=["rollback", "close"])
+def test_dropped_without_commit(broker, end):
+    assert sent(broker, end) == []
+
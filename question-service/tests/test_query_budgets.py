@@ -0,0 +1,116 @@
+"""Endpoints run under QUERY_INSPECTION=raise, so a request over its
+@query_budget or repeating a statement per row fails its test"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import main
+import migrate
+import query_inspector
+from database import SessionLocal
+from query_inspector import QueryBudgetExceeded, query_budget
+
+# More of each than query_repeat_threshold, so a statement run per row shows
+QUESTIONS = 6
+ANSWERS = 6
+VOTES = 6
+
+
+def as_user(user_id: int) -> None:
+    main.app.dependency_overrides[main.get_current_user] = lambda: {"id": user_id}
+
+
+@pytest.fixture(scope="module")
+def client():
+    migrate.migrate()
+    client = TestClient(main.app)
+    question_ids = []
+    for number in range(QUESTIONS):
+        as_user(1 + number % 2)
+        response = client.post("/questions", json={
+            "title": f"Seeded question number {number}",
+            "content": f"Content of seeded question {number}, long enough",
+        })
+        assert response.status_code == 201
+        question_ids.append(response.json()["id"])
+        for answer in range(ANSWERS):
+            as_user(100 + answer)
+            assert client.post("/answers", json={
+                "question_id": question_ids[-1],
+                "content": f"Answer {answer} to seeded question {number}",
+            }).status_code == 201
+        for vote in range(VOTES):
+            as_user(200 + vote)
+            assert client.post("/votes", json={
+                "question_id": question_ids[-1],
+                "vote_type": "upvote" if vote % 3 else "downvote",
+            }).status_code == 201
+    main.app.dependency_overrides.clear()
+    client.question_ids = question_ids
+    return client
+
+
+def test_list_questions(client):
+    response = client.get("/questions", params={"limit": 20})
+    assert response.status_code == 200
+    assert len(response.json()) == QUESTIONS
+    assert {question["answer_count"] for question in response.json()} == {ANSWERS}
+
+
+def test_questions_by_user(client):
+    response = client.get("/questions/user/1")
+    assert response.status_code == 200
+    assert len(response.json()) == QUESTIONS // 2
+
+
+def test_question_detail(client):
+    response = client.get(f"/questions/{client.question_ids[0]}")
+    assert response.status_code == 200
+    assert response.json()["answer_count"] == ANSWERS
+    assert response.json()["vote_count"] == VOTES
+
+
+def test_answers_for_question(client):
+    response = client.get(f"/answers/question/{client.question_ids[0]}")
+    assert response.status_code == 200
+    assert len(response.json()) == ANSWERS
+
+
+def test_vote_stats(client):
+    response = client.get(f"/votes/question/{client.question_ids[0]}/stats")
+    assert response.status_code == 200
+    assert response.json()["upvotes"] + response.json()["downvotes"] == VOTES
+
+
+@pytest.fixture
+def inspected_app():
+    app = FastAPI()
+    app.add_middleware(query_inspector.QueryInspectionMiddleware)
+    return app
+
+
+def test_over_budget_handler_raises(inspected_app):
+    @inspected_app.get("/two-queries")
+    @query_budget(1)
+    def two_queries():
+        with SessionLocal() as db:
+            db.execute(text("SELECT 1"))
+            db.execute(text("SELECT 2"))
+        return {}
+
+    with pytest.raises(QueryBudgetExceeded, match="2 queries, budget 1"):
+        TestClient(inspected_app).get("/two-queries")
+
+
+def test_repeated_statement_raises(inspected_app):
+    @inspected_app.get("/per-row")
+    @query_budget(10)
+    def per_row():
+        with SessionLocal() as db:
+            for row_id in range(5):
+                db.execute(text("SELECT :id"), {"id": row_id})
+        return {}
+
+    with pytest.raises(QueryBudgetExceeded, match="5 x SELECT"):
+        TestClient(inspected_app).get("/per-row")
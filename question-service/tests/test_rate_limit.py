@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import rate_limit
+from config import settings
+
+GATEWAY = "10.244.3.7"
+
+
+@pytest.fixture
+def pod_network(monkeypatch):
+    """Gateway pods' network trusted, as FORWARDED_ALLOW_NETWORKS=10.244.0.0/16"""
+    monkeypatch.setattr(rate_limit, "TRUSTED_NETWORKS", rate_limit.parse_networks("10.244.0.0/16"))
+    rate_limit.is_trusted_proxy.cache_clear()
+    yield
+    rate_limit.is_trusted_proxy.cache_clear()
+
+
+@pytest.fixture
+def limiter(monkeypatch, pod_network):
+    """One request per client IP"""
+    monkeypatch.setattr(settings, "rate_limit_store", "local")
+    monkeypatch.setattr(settings, "rate_limit_ip_rate", 0.001)
+    monkeypatch.setattr(settings, "rate_limit_ip_burst", 1.0)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    return rate_limit.RateLimitMiddleware(app, name="test")
+
+
+def get(middleware, peer: str, forwarded_for: str = None) -> int:
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    scope = {"type": "http", "method": "GET", "path": "/questions", "headers": headers, "client": (peer, 40000)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"]
+
+
+def test_clients_behind_gateway_get_their_own_buckets(limiter):
+    assert get(limiter, GATEWAY, "203.0.113.1") == 200
+    assert get(limiter, GATEWAY, "203.0.113.2") == 200
+    assert get(limiter, GATEWAY, "203.0.113.1") == 429
+
+
+def test_forwarded_for_resolves_past_trusted_proxies(pod_network):
+    scope = {"client": (GATEWAY, 1), "headers": [(b"x-forwarded-for", b"198.51.100.4, 203.0.113.9, 10.244.0.12")]}
+    # The entry left of the last trusted proxy; earlier ones are the client's to write
+    assert rate_limit.client_ip(scope) == "203.0.113.9"
+
+
+def test_untrusted_peer_cannot_rotate_forwarded_for(limiter):
+    assert get(limiter, "198.51.100.7", "203.0.113.1") == 200
+    assert get(limiter, "198.51.100.7", "203.0.113.2") == 429
@@ -3,6 +3,7 @@ import axios from 'axios';
 const AUTH_API_URL = 'http://localhost:8001';
 const QUESTION_API_URL = 'http://localhost:8002';
 const BLOG_API_URL = 'http://localhost:8003';
+const GATEWAY_API_URL = 'http://localhost:8004';
 
 // Create axios instances
 const authApi = axios.create({
@@ -17,6 +18,10 @@ const blogApi = axios.create({
   baseURL: BLOG_API_URL,
 });
 
+const gatewayApi = axios.create({
+  baseURL: GATEWAY_API_URL,
+});
+
 // Add token to requests
 const addAuthToken = (config) => {
   const token = localStorage.getItem('access_token');
@@ -29,6 +34,7 @@ const addAuthToken = (config) => {
 authApi.interceptors.request.use(addAuthToken);
 questionApi.interceptors.request.use(addAuthToken);
 blogApi.interceptors.request.use(addAuthToken);
+gatewayApi.interceptors.request.use(addAuthToken);
 
 // Auth Service API
 export const authService = {
@@ -43,6 +49,7 @@ export const questionService = {
   getQuestions: (skip = 0, limit = 20) => questionApi.get(`/questions?skip=${skip}&limit=${limit}`),
   getQuestion: (id) => questionApi.get(`/questions/${id}`),
   createQuestion: (questionData) => questionApi.post('/questions', questionData),
+  findSimilarQuestions: (questionData) => questionApi.post('/questions/similar', questionData),
   updateQuestion: (id, questionData) => questionApi.put(`/questions/${id}`, questionData),
   deleteQuestion: (id) => questionApi.delete(`/questions/${id}`),
   
@@ -53,6 +60,9 @@ export const questionService = {
   // Votes
   createVote: (voteData) => questionApi.post('/votes', voteData),
   getVoteStats: (questionId) => questionApi.get(`/votes/question/${questionId}/stats`),
+
+  // Live answers, vote changes and view milestones (server-sent events)
+  subscribeToQuestion: (questionId) => new EventSource(`${QUESTION_API_URL}/questions/${questionId}/events`),
 };
 
 // Blog Service API
@@ -64,10 +74,19 @@ export const blogService = {
   deleteBlog: (id) => blogApi.delete(`/blogs/${id}`),
   getBlogsByUser: (userId, skip = 0, limit = 20) => 
     blogApi.get(`/blogs/user/${userId}?skip=${skip}&limit=${limit}`),
+  getRelatedBlogs: (id, limit = 5) => blogApi.get(`/blogs/${id}/related?limit=${limit}`),
+};
+
+// Gateway API: whole pages in one request, with author names resolved
+export const gatewayService = {
+  getHomePage: (limit = 10) => gatewayApi.get(`/pages/home?limit=${limit}`),
+  getQuestionPage: (id) => gatewayApi.get(`/pages/questions/${id}`),
+  getUserPage: (userId, limit = 20) => gatewayApi.get(`/pages/users/${userId}?limit=${limit}`),
 };
 
 export default {
   authService,
   questionService,
   blogService,
+  gatewayService,
 };
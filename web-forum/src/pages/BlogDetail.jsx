@@ -1,10 +1,11 @@
 import { useState, useEffect } from 'react';
-import { useParams } from 'react-router-dom';
+import { Link, useParams } from 'react-router-dom';
 import { blogService } from '../api';
 
 function BlogDetail({ user }) {
   const { id } = useParams();
   const [blog, setBlog] = useState(null);
+  const [related, setRelated] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
@@ -14,8 +15,13 @@ function BlogDetail({ user }) {
 
   const fetchBlogDetails = async () => {
     try {
-      const response = await blogService.getBlog(id);
+      const [response, relatedRes] = await Promise.all([
+        blogService.getBlog(id),
+        // Related posts are optional; the article renders without them
+        blogService.getRelatedBlogs(id).catch(() => ({ data: [] })),
+      ]);
       setBlog(response.data);
+      setRelated(relatedRes.data);
     } catch (err) {
       setError('Failed to load blog article');
     } finally {
@@ -47,19 +53,44 @@ function BlogDetail({ user }) {
         <div className="card-meta" style={{ marginBottom: '2rem' }}>
           <span>By User ID: {blog.user_id}</span>
           <span>{blog.views} views</span>
+          {blog.reading_time_minutes && <span>{blog.reading_time_minutes} min read</span>}
           <span>{new Date(blog.created_at).toLocaleDateString()}</span>
         </div>
 
-        <div style={{ 
-          whiteSpace: 'pre-wrap', 
-          lineHeight: '1.8',
-          fontSize: '1.1rem'
-        }}>
-          {blog.content}
-        </div>
+        {blog.content_html ? (
+          <div
+            style={{ lineHeight: '1.8', fontSize: '1.1rem' }}
+            dangerouslySetInnerHTML={{ __html: blog.content_html }}
+          />
+        ) : (
+          <div style={{ 
+            whiteSpace: 'pre-wrap', 
+            lineHeight: '1.8',
+            fontSize: '1.1rem'
+          }}>
+            {blog.content}
+          </div>
+        )}
       </div>
 
       {error && <div className="error-message">{error}</div>}
+
+      {related.length > 0 && (
+        <div>
+          <h2 style={{ margin: '2rem 0 1rem 0' }}>Related Posts</h2>
+          {related.map((post) => (
+            <div key={post.id} className="card">
+              <Link to={`/blogs/${post.id}`} className="card-title">
+                {post.title}
+              </Link>
+              <div className="card-meta">
+                {post.reading_time_minutes && <span>{post.reading_time_minutes} min read</span>}
+                <span>{new Date(post.created_at).toLocaleDateString()}</span>
+              </div>
+            </div>
+          ))}
+        </div>
+      )}
     </div>
   );
 }
@@ -119,10 +119,11 @@ function Blogs({ user }) {
                 </p>
               )}
               <p className="card-content">
-                {blog.content.substring(0, 300)}...
+                {blog.excerpt}...
               </p>
               <div className="card-meta">
                 <span>{blog.views} views</span>
+                {blog.reading_time_minutes && <span>{blog.reading_time_minutes} min read</span>}
                 <span>{new Date(blog.created_at).toLocaleDateString()}</span>
               </div>
             </div>
@@ -1,31 +1,68 @@
-import { useState, useEffect } from 'react';
-import { useParams } from 'react-router-dom';
-import { questionService } from '../api';
+import { useState, useEffect, useRef } from 'react';
+import { Link, useParams } from 'react-router-dom';
+import { questionService, gatewayService } from '../api';
 
 function QuestionDetail({ user }) {
   const { id } = useParams();
   const [question, setQuestion] = useState(null);
   const [answers, setAnswers] = useState([]);
+  const [related, setRelated] = useState([]);
   const [voteStats, setVoteStats] = useState({ upvotes: 0, downvotes: 0, total: 0 });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [answerContent, setAnswerContent] = useState('');
+  const eventsRef = useRef(null);
 
   useEffect(() => {
     fetchQuestionDetails();
+
+    // Live updates replace refetching; a reconnect reloads whatever was missed
+    const events = questionService.subscribeToQuestion(id);
+    eventsRef.current = events;
+    let connected = false;
+    events.onopen = () => {
+      if (connected) fetchQuestionDetails();
+      connected = true;
+    };
+    events.addEventListener('answer', (e) => {
+      const answer = JSON.parse(e.data);
+      if (answer.truncated) {
+        fetchQuestionDetails();
+        return;
+      }
+      setAnswers((prev) => (prev.some((a) => a.id === answer.id) ? prev : [...prev, answer]));
+    });
+    events.addEventListener('votes', (e) => {
+      const delta = JSON.parse(e.data);
+      setVoteStats((prev) => ({
+        upvotes: prev.upvotes + delta.upvotes,
+        downvotes: prev.downvotes + delta.downvotes,
+        total: prev.total + delta.total,
+      }));
+    });
+    events.addEventListener('views', (e) => {
+      const { views } = JSON.parse(e.data);
+      setQuestion((prev) => prev && { ...prev, views });
+    });
+
+    return () => {
+      events.close();
+      eventsRef.current = null;
+    };
   }, [id]);
 
+  const isLive = () => eventsRef.current?.readyState === EventSource.OPEN;
+
   const fetchQuestionDetails = async () => {
     try {
-      const [questionRes, answersRes, votesRes] = await Promise.all([
-        questionService.getQuestion(id),
-        questionService.getAnswersByQuestion(id),
-        questionService.getVoteStats(id),
-      ]);
-
-      setQuestion(questionRes.data);
-      setAnswers(answersRes.data);
-      setVoteStats(votesRes.data);
+      const { data } = await gatewayService.getQuestionPage(id);
+
+      setQuestion(data.question);
+      setAnswers(data.answers || []);
+      setRelated(data.related || []);
+      if (data.vote_stats) {
+        setVoteStats(data.vote_stats);
+      }
     } catch (err) {
       setError('Failed to load question details');
     } finally {
@@ -41,8 +78,10 @@ function QuestionDetail({ user }) {
 
     try {
       await questionService.createVote({ question_id: parseInt(id), vote_type: voteType });
-      const votesRes = await questionService.getVoteStats(id);
-      setVoteStats(votesRes.data);
+      if (!isLive()) {
+        const votesRes = await questionService.getVoteStats(id);
+        setVoteStats(votesRes.data);
+      }
       setError('');
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to vote');
@@ -58,12 +97,17 @@ function QuestionDetail({ user }) {
     }
 
     try {
-      await questionService.createAnswer({
+      const { data } = await questionService.createAnswer({
         question_id: parseInt(id),
         content: answerContent,
       });
       setAnswerContent('');
-      fetchQuestionDetails();
+      if (isLive()) {
+        // The event may have arrived first; this copy also carries the author
+        setAnswers((prev) => [...prev.filter((a) => a.id !== data.id), { ...data, author: user }]);
+      } else {
+        fetchQuestionDetails();
+      }
       setError('');
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to post answer');
@@ -80,6 +124,7 @@ function QuestionDetail({ user }) {
         <p style={{ whiteSpace: 'pre-wrap', marginBottom: '1rem' }}>{question.content}</p>
         
         <div className="card-meta" style={{ marginBottom: '1rem' }}>
+          {question.author && <span>Asked by {question.author.username}</span>}
           <span>{question.views} views</span>
           <span>{new Date(question.created_at).toLocaleDateString()}</span>
         </div>
@@ -103,13 +148,30 @@ function QuestionDetail({ user }) {
         <div key={answer.id} className="card">
           <p style={{ whiteSpace: 'pre-wrap' }}>{answer.content}</p>
           <div className="card-meta">
-            <span>User ID: {answer.user_id}</span>
+            <span>{answer.author ? answer.author.username : `User ID: ${answer.user_id}`}</span>
             <span>{new Date(answer.created_at).toLocaleDateString()}</span>
             {answer.is_accepted && <span style={{ color: '#51cf66' }}>✓ Accepted</span>}
           </div>
         </div>
       ))}
 
+      {related.length > 0 && (
+        <div>
+          <h2 style={{ margin: '2rem 0 1rem 0' }}>Related Questions</h2>
+          {related.map((item) => (
+            <div key={item.id} className="card">
+              <Link to={`/questions/${item.id}`} className="card-title">
+                {item.title}
+              </Link>
+              <div className="card-meta">
+                <span>{item.answer_count} answers</span>
+                <span>{item.views} views</span>
+              </div>
+            </div>
+          ))}
+        </div>
+      )}
+
       {user && (
         <div className="card" style={{ marginTop: '2rem' }}>
           <h3 style={{ marginBottom: '1rem' }}>Your Answer</h3>
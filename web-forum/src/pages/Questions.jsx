@@ -11,6 +11,8 @@ function Questions({ user }) {
     title: '',
     content: '',
   });
+  // Likely duplicates of the draft, checked once before it is posted
+  const [similar, setSimilar] = useState(null);
 
   useEffect(() => {
     fetchQuestions();
@@ -37,8 +39,16 @@ function Questions({ user }) {
     }
 
     try {
+      if (similar === null) {
+        const { data } = await questionService.findSimilarQuestions(formData);
+        if (data.length > 0) {
+          setSimilar(data);
+          return;
+        }
+      }
       await questionService.createQuestion(formData);
       setFormData({ title: '', content: '' });
+      setSimilar(null);
       setShowForm(false);
       fetchQuestions();
     } catch (err) {
@@ -69,7 +79,10 @@ function Questions({ user }) {
               type="text"
               className="form-input"
               value={formData.title}
-              onChange={(e) => setFormData({ ...formData, title: e.target.value })}
+              onChange={(e) => {
+                setFormData({ ...formData, title: e.target.value });
+                setSimilar(null);
+              }}
               required
               minLength={10}
             />
@@ -80,13 +93,30 @@ function Questions({ user }) {
             <textarea
               className="form-textarea"
               value={formData.content}
-              onChange={(e) => setFormData({ ...formData, content: e.target.value })}
+              onChange={(e) => {
+                setFormData({ ...formData, content: e.target.value });
+                setSimilar(null);
+              }}
               required
               minLength={20}
             />
           </div>
 
-          <button type="submit" className="form-button">Post Question</button>
+          {similar && similar.length > 0 && (
+            <div className="form-group">
+              <p>These questions look similar. Do any of them answer yours?</p>
+              {similar.map((question) => (
+                <div key={question.id}>
+                  <Link to={`/questions/${question.id}`}>{question.title}</Link>
+                  <span className="card-meta"> {question.answer_count} answers</span>
+                </div>
+              ))}
+            </div>
+          )}
+
+          <button type="submit" className="form-button">
+            {similar && similar.length > 0 ? 'Post Anyway' : 'Post Question'}
+          </button>
         </form>
       )}
 
@@ -100,7 +130,7 @@ function Questions({ user }) {
                 {question.title}
               </Link>
               <p className="card-content">
-                {question.content.substring(0, 200)}...
+                {question.excerpt}...
               </p>
               <div className="card-meta">
                 <span>{question.views} views</span>